@@ -2,26 +2,27 @@ import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
 import os
+from result_files import require_results, load_metrics
 
 # Get the directory where this script is located
 script_dir = os.path.dirname(os.path.abspath(__file__))
 
-# Define the data
-data = [
-    {"Algorithm": "DeRide", "0_riders": 22, "1_rider": 4, "2_riders": 6, "3_riders": 8, "4_riders": 5, "5_riders": 55},
-    {"Algorithm": "DeRideFair", "0_riders": 23, "1_rider": 12, "2_riders": 12, "3_riders": 17, "4_riders": 13, "5_riders": 23},
-    {"Algorithm": "SCIPDeRide", "0_riders": 26, "1_rider": 1, "2_riders": 2, "3_riders": 7, "4_riders": 1, "5_riders": 63},
-    {"Algorithm": "SCIPDeRideFairMMScalar", "0_riders": 26, "1_rider": 1, "2_riders": 2, "3_riders": 7, "4_riders": 1, "5_riders": 63},
-    {"Algorithm": "SCIPDeRideFairMM2Phase", "0_riders": 28, "1_rider": 1, "2_riders": 2, "3_riders": 2, "4_riders": 1, "5_riders": 66},
-    {"Algorithm": "SCIPDeRideFairMMLexico", "0_riders": 22, "1_rider": 4, "2_riders": 8, "3_riders": 2, "4_riders": 1, "5_riders": 63}
-]
+# Driver load histograms from each solver's metrics.json
+algorithms = require_results()
+histograms = {name: load_metrics(name)['load_histogram'] for name in algorithms}
+max_load = max(len(h) for h in histograms.values()) - 1
+
+load_levels = [f"{k}_rider" if k == 1 else f"{k}_riders" for k in range(max_load + 1)]
+load_labels = [level.replace('_', ' ') for level in load_levels]
+data = []
+for name in algorithms:
+    counts = histograms[name] + [0] * (max_load + 1 - len(histograms[name]))
+    data.append({"Algorithm": name, **dict(zip(load_levels, counts))})
 
 df = pd.DataFrame(data)
 
 # Define colors for each load level
 colors = ['#1FB8CD', '#DB4545', '#2E8B57', '#5D878F', '#D2BA4C', '#B4413C']
-load_levels = ['0_riders', '1_rider', '2_riders', '3_riders', '4_riders', '5_riders']
-load_labels = ['0 riders', '1 rider', '2 riders', '3 riders', '4 riders', '5 riders']
 
 # Calculate totals for percentage calculations
 df['total'] = df[load_levels].sum(axis=1)
@@ -46,7 +47,7 @@ for i, (level, label) in enumerate(zip(load_levels, load_labels)):
         name=f"<b>{label}</b>",  # Make legend label bold
         x=df['Algorithm'],
         y=df[level],
-        marker_color=colors[i],
+        marker_color=colors[i % len(colors)],
         text=text_labels,
         textposition='inside',
         textfont=dict(size=11, family='Arial', color='black', weight='bold'),  # Use weight for bold
@@ -3,24 +3,12 @@ import pandas as pd
 import numpy as np
 import scipy.stats as stats
 
-# Create sample data (replace with your actual data loading)
-np.random.seed(42)
-
-# Create sample data for DeRideFair (more balanced distribution)
-df_fair = pd.DataFrame({
-    'Driver_ID': range(1, 101),
-    'Filled_Seats': np.random.choice([0, 1, 2, 3, 4, 5], 100, p=[0.1, 0.15, 0.25, 0.25, 0.15, 0.1])
-})
-
-# Create sample data for DeRide (more skewed distribution)
-df_deride = pd.DataFrame({
-    'Driver_ID': range(1, 101),
-    'Filled_Seats': np.random.choice([0, 1, 2, 3, 4, 5], 100, p=[0.05, 0.1, 0.15, 0.2, 0.25, 0.25])
-})
-
-# If you have actual CSV files, uncomment these lines instead:
-# df_fair = pd.read_csv('deride_fair_data.csv')
-# df_deride = pd.read_csv('deride_data.csv')
+from result_files import require_results, load_filled_seats
+
+# Per-driver filled seats from the DeRide / DeRideFair runs (assignments.jsonl)
+require_results('DeRideFair', 'DeRide')
+df_fair = load_filled_seats('DeRideFair')
+df_deride = load_filled_seats('DeRide')
 
 # Combine both datasets for comparison
 df_combined = pd.concat([df_fair, df_deride], ignore_index=True)
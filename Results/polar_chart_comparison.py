@@ -2,45 +2,18 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 
-# Raw dataset (updated, removed Standard_Deviation and Drivers_with_Zero_Load)
-data = {
-    "DeRide": {
-        "Variance": 4.5291,
-        "Total_Riders_Accommodated": 297,
-        "Utilization_Rate_Percent": 67.0,
-        "Gini_Coefficient": 0.319
-    },
-    "DeRideFair": {
-        "Variance": 3.7131,
-        "Total_Riders_Accommodated": 263,
-        "Utilization_Rate_Percent": 52.6,
-        "Gini_Coefficient": 0.448
-    },
-    "SCIPDeRide": {
-        "Variance": 5.0275,
-        "Total_Riders_Accommodated": 345,
-        "Utilization_Rate_Percent": 69.0,
-        "Gini_Coefficient": 0.307
-    },
-    # "SCIPDeRideFairMM2Phase": {
-    #     "Variance": 5.0275,
-    #     "Total_Riders_Accommodated": 345,
-    #     "Utilization_Rate_Percent": 69.0,
-    #     "Gini_Coefficient": 0.307
-    # },
-    "SCIPDeRideFairMMLexico": {
-        "Variance": 4.5475,
-        "Total_Riders_Accommodated": 345,
-        "Utilization_Rate_Percent": 69.0,
-        "Gini_Coefficient": 0.307
-    },
-    # "SCIPDeRideFairMMScalar": {
-    #     "Variance": 4.7275,
-    #     "Total_Riders_Accommodated": 345,
-    #     "Utilization_Rate_Percent": 69.0,
-    #     "Gini_Coefficient": 0.307
-    # }
-}
+from result_files import require_results, load_metrics
+
+# Metrics of every solver run found in its metrics.json
+data = {}
+for name in require_results():
+    metrics = load_metrics(name)
+    data[name] = {
+        "Variance": metrics["variance"],
+        "Total_Riders_Accommodated": metrics["accommodated_riders"],
+        "Utilization_Rate_Percent": metrics["utilization_rate"] * 100,
+        "Gini_Coefficient": metrics["gini_coefficient"]
+    }
 
 # Min/Max ranges for normalization (removed Standard_Deviation and Drivers_with_Zero_Load)
 ranges = {
@@ -68,7 +41,7 @@ for algo, metrics in data.items():
         normalized_data[algo].append(norm_val)
 
 # Radar chart setup
-categories = [labels_map[m] for m in data["DeRide"].keys()]
+categories = [labels_map[m] for m in ranges.keys()]
 N = len(categories)
 angles = np.linspace(0, 2*np.pi, N, endpoint=False).tolist()
 angles += angles[:1]  # close loop
@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+import pandas as pd
+
+# Output directory of every solver script; each run writes assignments.jsonl and
+# metrics.json there next to its Output.txt (see WithOpenStreetMap/result_writer.py)
+SOLVER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'WithOpenStreetMap')
+RESULT_DIRS = {
+    "DeRide": 'OutputDeRide',
+    "DeRideFair": 'OutputDeRideFair',
+    "SCIPDeRide": 'OutputSCIPDeRide',
+    "SCIPDeRideFairMMScalar": 'OutputSCIPDeRideFairMaxMinSclrzd',
+    "SCIPDeRideFairMM2Phase": 'OutputSCIPDeRideFairMaxMin2phase',
+    "SCIPDeRideFairMMLexico": 'OutputSCIPDeRideFairMaxMinLexico',
+}
+
+# Solver script (in SOLVER_DIR) that writes each algorithm's results
+SOLVER_SCRIPTS = {
+    "DeRide": 'mainDeRide.py',
+    "DeRideFair": 'mainDeRideFair.py',
+    "SCIPDeRide": 'mainSCIPDeRide.py',
+    "SCIPDeRideFairMMScalar": 'mainSCIPDeRideFairMaxMinSclrzd.py',
+    "SCIPDeRideFairMM2Phase": 'mainSCIPDeRideFairMaxMinFrns2phase.py',
+    "SCIPDeRideFairMMLexico": 'mainSCIPDeRideFairMaxMinFrnsLexico.py',
+}
+
+
+def results_dir(algorithm):
+    return os.path.join(SOLVER_DIR, RESULT_DIRS[algorithm])
+
+
+def available_algorithms():
+    """Algorithms (in RESULT_DIRS order) whose metrics.json exists."""
+    return [name for name in RESULT_DIRS if os.path.exists(os.path.join(results_dir(name), 'metrics.json'))]
+
+
+def require_results(*algorithms):
+    """Exit with a message naming the solver scripts to run unless results exist.
+
+    With algorithm names, each of them needs metrics.json and assignments.jsonl;
+    without, at least one algorithm needs metrics.json. Returns the available
+    algorithms in the latter case.
+    """
+    if algorithms:
+        missing = [name for name in algorithms
+                   if not all(os.path.exists(os.path.join(results_dir(name), f)) for f in ('metrics.json', 'assignments.jsonl'))]
+    else:
+        available = available_algorithms()
+        if available:
+            return available
+        missing = list(RESULT_DIRS)
+    if missing:
+        scripts = ", ".join(SOLVER_SCRIPTS[name] for name in missing)
+        sys.exit(f"No results for {', '.join(missing)} yet; run {scripts} in {SOLVER_DIR} first.")
+    return list(algorithms)
+
+
+def load_assignments(algorithm):
+    """One row per driver: driver_id, seats, load, riders, path, ..."""
+    return pd.read_json(os.path.join(results_dir(algorithm), 'assignments.jsonl'), lines=True)
+
+
+def load_metrics(algorithm):
+    with open(os.path.join(results_dir(algorithm), 'metrics.json')) as f:
+        return json.load(f)
+
+
+def load_filled_seats(algorithm):
+    """DataFrame with Driver_ID (1-based, input order) and Filled_Seats, the layout the analysis scripts use."""
+    assignments = load_assignments(algorithm)
+    return pd.DataFrame({'Driver_ID': range(1, len(assignments) + 1), 'Filled_Seats': assignments['load']})
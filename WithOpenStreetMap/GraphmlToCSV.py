@@ -1,36 +1,80 @@
 import os
 import xml.etree.ElementTree as ET
 import csv
+from array import array
+import numpy as np
+from graph_csr import CSRGraph, bundle_path_for
+
+GRAPHML_NS = '{http://graphml.graphdrawing.org/xmlns}'
+
+
+def nodes_csv_path_for(csv_file):
+    """Node coordinate CSV stored next to the edge list CSV (map/graph.csv -> map/graph_nodes.csv)."""
+    return os.path.splitext(csv_file)[0] + '_nodes.csv'
+
+
+def convert_graphml_to_csv(graphml_file, csv_file, bundle_dir=None, nodes_csv_file=None):
+    """Stream a GraphML road network into an edge list CSV, a node coordinate CSV and a binary bundle.
+
+    The GraphML file is read with iterparse and every <node>/<edge> element is
+    cleared as soon as it has been written, so memory use does not grow with
+    the size of the XML. Attribute keys (length, x, y) are resolved from the
+    <key> declarations instead of assuming osmnx's numbering.
+    """
+    if bundle_dir is None:
+        bundle_dir = bundle_path_for(csv_file)
+    if nodes_csv_file is None:
+        nodes_csv_file = nodes_csv_path_for(csv_file)
+
+    keys = {}  # (for, attr.name) -> key id
+    node_ids, xs, ys = array('q'), array('d'), array('d')
+    sources, targets, weights = array('q'), array('q'), array('d')
+    graph_element = None
+
+    with open(csv_file, mode='w', newline='') as edges_out, open(nodes_csv_file, mode='w', newline='') as nodes_out:
+        edge_writer = csv.writer(edges_out)
+        node_writer = csv.writer(nodes_out)
+        edge_writer.writerow(['source', 'destination', 'weight'])
+        node_writer.writerow(['id', 'x', 'y'])
+
+        for event, elem in ET.iterparse(graphml_file, events=('start', 'end')):
+            tag = elem.tag
+            if event == 'start':
+                if tag == GRAPHML_NS + 'graph':
+                    graph_element = elem
+                continue
+
+            if tag == GRAPHML_NS + 'key':
+                keys[(elem.get('for'), elem.get('attr.name'))] = elem.get('id')
+
+            elif tag == GRAPHML_NS + 'node':
+                data = {d.get('key'): d.text for d in elem.iter(GRAPHML_NS + 'data')}
+                x = data.get(keys.get(('node', 'x')))
+                y = data.get(keys.get(('node', 'y')))
+                node_writer.writerow([elem.get('id'), x if x is not None else '', y if y is not None else ''])
+                node_ids.append(int(elem.get('id')))
+                xs.append(float(x) if x is not None else float('nan'))
+                ys.append(float(y) if y is not None else float('nan'))
+                elem.clear()
+                graph_element.clear()
+
+            elif tag == GRAPHML_NS + 'edge':
+                data = {d.get('key'): d.text for d in elem.iter(GRAPHML_NS + 'data')}
+                length = data.get(keys.get(('edge', 'length')))
+                # Edges without a length cannot be weighted and are skipped
+                if length is not None:
+                    edge_writer.writerow([elem.get('source'), elem.get('target'), length])
+                    sources.append(int(elem.get('source')))
+                    targets.append(int(elem.get('target')))
+                    weights.append(float(length))
+                elem.clear()
+                graph_element.clear()
+
+    # Binary graph bundle (CSR arrays, node ID map, coordinates) the solvers memory-map
+    graph = CSRGraph.from_edges(sources, targets, weights, node_ids=node_ids, coords=np.column_stack([np.frombuffer(xs), np.frombuffer(ys)]))
+    graph.save(bundle_dir)
+    return graph
 
-def convert_graphml_to_csv(graphml_file, csv_file):
-    # Parse the GraphML file
-    tree = ET.parse(graphml_file)
-    root = tree.getroot()
-    
-    # Namespace handling
-    ns = {'graphml': 'http://graphml.graphdrawing.org/xmlns'}
-    
-    # Create a list to hold the edges data
-    edges = []
-    
-    # Iterate through each edge in the GraphML
-    for edge in root.findall('.//graphml:edge', ns):
-        source = edge.get('source')
-        target = edge.get('target')
-        
-        # Find the length (weight) of the edge
-        length_data = edge.find('graphml:data[@key="d12"]', ns)
-        if length_data is not None:
-            weight = length_data.text
-            edges.append((source, target, weight))
-    
-    # Write the edges to a CSV file
-    with open(csv_file, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        # Write header
-        writer.writerow(['source', 'destination', 'weight'])
-        # Write data rows
-        writer.writerows(edges)
 
 if __name__ == "__main__":
     # Get the directory of the current script
@@ -40,9 +84,9 @@ if __name__ == "__main__":
     map_dir = os.path.join(script_dir, 'map')
     # Load the OSM graph data from the GraphML file
     graph_file = os.path.join(map_dir, 'graph.graphml')
-    # set path for 
+    # set path for
     csv_file = os.path.join(map_dir, 'graph.csv')
 
     # Call the conversion function
     convert_graphml_to_csv(graph_file, csv_file)
-    print(f"Conversion complete! Data written to {csv_file}")
\ No newline at end of file
+    print(f"Conversion complete! Data written to {csv_file}, {nodes_csv_path_for(csv_file)} and {bundle_path_for(csv_file)}")
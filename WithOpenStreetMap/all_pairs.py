@@ -0,0 +1,117 @@
+import glob
+import hashlib
+import os
+import numpy as np
+from scipy.sparse.csgraph import connected_components, dijkstra
+
+# With all_pairs='auto', DistanceEngine only builds the |V|^2 distance/predecessor
+# matrices up to this many nodes (5000 nodes is ~300 MB); above it, and by
+# default, it uses per-source searches.
+ALL_PAIRS_MAX_NODES = 5000
+
+
+def graph_hash(graph):
+    """SHA-256 over the CSR arrays: changes whenever the topology or any weight changes."""
+    digest = hashlib.sha256()
+    for array in (graph.node_ids, graph.indptr, graph.indices, graph.weights):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def cache_path_for(graph_file, key):
+    """Cache file stored next to the graph (map/graph.csv -> map/graph.apsp-<hash>.npz)."""
+    return os.path.splitext(graph_file)[0] + f'.apsp-{key[:16]}.npz'
+
+
+class AllPairsDistances:
+    """Distance and predecessor matrices over the largest strongly connected component.
+
+    Restricting to the largest SCC loses nothing for pairs inside it: every node
+    on a shortest path between two nodes of an SCC belongs to that SCC. Queries
+    involving any other node return None and are answered by Dijkstra instead.
+    """
+
+    def __init__(self, key, members, dist, pred, num_nodes):
+        self.key = key
+        self.members = members  # dense graph indices of the component, sorted
+        self.dist = dist        # (k, k) float64, local indices
+        self.pred = pred        # (k, k) int32, local indices, -9999 on the diagonal
+        self.local = np.full(num_nodes, -1, dtype=np.int64)
+        self.local[members] = np.arange(len(members))
+
+    @classmethod
+    def build(cls, graph, key=None):
+        matrix = graph.to_scipy()
+        _, labels = connected_components(matrix, directed=True, connection='strong')
+        largest = np.bincount(labels).argmax() if len(labels) else 0
+        members = np.flatnonzero(labels == largest)
+        sub = matrix[members][:, members]
+        dist, pred = dijkstra(sub, directed=True, return_predecessors=True)
+        return cls(key or graph_hash(graph), members, dist, pred.astype(np.int32), graph.number_of_nodes())
+
+    def save(self, path):
+        np.savez(path, key=np.array(self.key), members=self.members, dist=self.dist, pred=self.pred)
+
+    @classmethod
+    def load(cls, path, graph, key):
+        """Cached matrices from `path`, or None if the file was built for a different graph."""
+        with np.load(path) as data:
+            if str(data['key']) != key:
+                return None
+            return cls(key, data['members'], data['dist'], data['pred'], graph.number_of_nodes())
+
+    def covers(self, i):
+        return i >= 0 and self.local[i] >= 0
+
+    def distance(self, i, j):
+        """Distance between dense node indices i and j, or None if either is outside the component."""
+        if not (self.covers(i) and self.covers(j)):
+            return None
+        return float(self.dist[self.local[i], self.local[j]])
+
+    def path(self, i, j):
+        """Shortest path i -> j as dense node indices, or None if either is outside the component."""
+        if not (self.covers(i) and self.covers(j)):
+            return None
+        a, b = self.local[i], self.local[j]
+        path = [b]
+        while path[-1] != a:
+            path.append(self.pred[a, path[-1]])
+        return [int(self.members[v]) for v in reversed(path)]
+
+    def row(self, i, columns):
+        """Distances from node i to the dense node indices `columns`, or None if any is not covered."""
+        if not self.covers(i) or not (self.local[columns] >= 0).all():
+            return None
+        return self.dist[self.local[i], self.local[columns]]
+
+    def column(self, j, rows):
+        """Distances from the dense node indices `rows` to node j, or None if any is not covered."""
+        if not self.covers(j) or not (self.local[rows] >= 0).all():
+            return None
+        return self.dist[self.local[rows], self.local[j]]
+
+
+def remove_stale(graph_file, keep):
+    """Delete the cache files of earlier versions of `graph_file`, all but `keep`."""
+    for path in glob.glob(os.path.splitext(graph_file)[0] + '.apsp-*.npz'):
+        if os.path.abspath(path) != os.path.abspath(keep):
+            os.remove(path)
+
+
+def load_or_build(graph):
+    """All-pairs matrices for `graph`, reusing the on-disk cache next to its source file when valid.
+
+    Writing a new cache file removes the ones left by earlier versions of the graph.
+    """
+    key = graph_hash(graph)
+    path = cache_path_for(graph.source_file, key) if graph.source_file else None
+    if path and os.path.exists(path):
+        cached = AllPairsDistances.load(path, graph, key)
+        if cached is not None:
+            return cached
+    all_pairs = AllPairsDistances.build(graph, key)
+    if path:
+        all_pairs.save(path)
+        remove_stale(graph.source_file, path)
+    return all_pairs
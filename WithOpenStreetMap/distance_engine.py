@@ -0,0 +1,297 @@
+from collections import OrderedDict
+import heapq
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+from all_pairs import ALL_PAIRS_MAX_NODES, load_or_build
+
+# Distance cells per batched Dijkstra call; larger batches are split into chunks
+SEARCH_CELLS = 1 << 22
+# Cap on the cached search rows (distance + predecessor row per searched node)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class DistanceEngine:
+    """One-to-many shortest path distances over a CSRGraph.
+
+    Instead of running a point-to-point search for every (source, target) pair,
+    the engine runs one single-source Dijkstra per source node (forward) or one
+    reverse Dijkstra per target node (backward) and answers every later query
+    with an array lookup. Searches for many nodes are batched into a single
+    scipy.sparse.csgraph.dijkstra call.
+
+    With all_pairs=True, or all_pairs='auto' on maps of at most ALL_PAIRS_MAX_NODES
+    nodes, the engine also loads, or builds and saves next to the graph file, a
+    persistent all-pairs distance matrix and answers queries inside the largest
+    strongly connected component from it without any search. It is off by
+    default: the matrices grow with |V|^2 and are written to disk.
+
+    Search rows are kept in one LRU cache, evicted least-recently-used first
+    once they take more than `max_bytes`, so memory does not grow with the
+    number of distinct sources and targets ever searched.
+    """
+
+    def __init__(self, graph, all_pairs=False, max_bytes=DEFAULT_MAX_BYTES):
+        self.graph = graph
+        self.max_bytes = max_bytes
+        # (reverse, node index) -> (distance row, predecessor row), or the successor row of a reverse search
+        self._rows = OrderedDict()
+        self.row_bytes = graph.number_of_nodes() * (np.dtype(float).itemsize + np.dtype(np.int32).itemsize)
+        self.nbytes = 0
+        self.evictions = 0
+        if all_pairs == 'auto':
+            all_pairs = graph.number_of_nodes() <= ALL_PAIRS_MAX_NODES
+        self.all_pairs = load_or_build(graph) if all_pairs else None
+
+    @staticmethod
+    def _search(graph, indices, limit=np.inf):
+        dist, pred = dijkstra(graph.to_scipy(), directed=True, indices=indices,
+                              return_predecessors=True, limit=limit)
+        return dist, pred.astype(np.int32)
+
+    def _cached(self, reverse, i):
+        """Cached (distance row, predecessor row) of node index i, or None; marks it recently used."""
+        row = self._rows.get((reverse, i))
+        if row is not None:
+            self._rows.move_to_end((reverse, i))
+        return row
+
+    def _store(self, reverse, i, row):
+        self._rows[(reverse, i)] = row
+        self.nbytes += self.row_bytes
+        while self.nbytes > self.max_bytes and len(self._rows) > 1:
+            self._rows.popitem(last=False)
+            self.nbytes -= self.row_bytes
+            self.evictions += 1
+
+    def _search_rows(self, reverse, indices):
+        """(distance row, predecessor row) of every dense node index in `indices`, in order.
+
+        Cached rows are reused; the others are searched in batches of at most
+        SEARCH_CELLS cells (and no more rows than fit in `max_bytes`), and each
+        row is copied out of its batch so that a cached row does not keep the
+        whole batch matrix alive.
+        """
+        graph = self.graph.reverse() if reverse else self.graph
+        n = max(self.graph.number_of_nodes(), 1)
+        step = max(1, min(SEARCH_CELLS // n, self.max_bytes // max(self.row_bytes, 1)))
+        for lo in range(0, len(indices), step):
+            chunk = indices[lo:lo + step]
+            rows = {}
+            for i in dict.fromkeys(chunk):
+                row = self._cached(reverse, i)
+                if row is not None:
+                    rows[i] = row
+            pending = [i for i in dict.fromkeys(chunk) if i not in rows]
+            if pending:
+                dist, pred = self._search(graph, pending)
+                for k, i in enumerate(pending):
+                    rows[i] = (dist[k].copy(), pred[k].copy())
+                    self._store(reverse, i, rows[i])
+                del dist, pred
+            for i in chunk:
+                yield rows[i]
+
+    def _run(self, reverse, nodes, skip_all_pairs=False):
+        """Search (and cache) every node of `nodes` that is in the graph and not cached yet."""
+        pending = []
+        for node in dict.fromkeys(nodes):
+            i = self.graph.index_of(node)
+            if i >= 0 and (reverse, i) not in self._rows:
+                if skip_all_pairs and self.all_pairs is not None and self.all_pairs.covers(i):
+                    continue
+                pending.append(i)
+        for _ in self._search_rows(reverse, pending):
+            pass
+
+    def _row(self, reverse, i):
+        """(distance row, predecessor row) of dense node index i, searching it if not cached."""
+        return next(self._search_rows(reverse, [i]))
+
+    def _unreachable(self):
+        n = self.graph.number_of_nodes()
+        return np.full(n, np.inf), np.full(n, -9999, dtype=np.int32)
+
+    def from_source(self, source):
+        """Distances from `source` to every node, indexed by dense node index (one forward Dijkstra)."""
+        i = self.graph.index_of(source)
+        if i < 0:
+            return self._unreachable()[0]
+        return self._row(False, i)[0]
+
+    def to_target(self, target):
+        """Distances from every node to `target`, indexed by dense node index (one reverse Dijkstra)."""
+        i = self.graph.index_of(target)
+        if i < 0:
+            return self._unreachable()[0]
+        return self._row(True, i)[0]
+
+    def precompute(self, sources=(), targets=()):
+        """Run the forward searches for `sources` and the reverse searches for `targets` up front.
+
+        Only as many rows as fit in `max_bytes` stay cached; callers that need
+        many rows at once should go block by block (see distances_from).
+        """
+        self._run(False, sources, skip_all_pairs=True)
+        self._run(True, targets, skip_all_pairs=True)
+
+    def distance(self, source, target):
+        """Shortest path length from `source` to `target`, or inf if unreachable."""
+        s, t = self.graph.index_of(source), self.graph.index_of(target)
+        if s < 0 or t < 0:
+            return float('inf')
+        if self.all_pairs is not None:
+            d = self.all_pairs.distance(s, t)
+            if d is not None:
+                return d
+        row = self._cached(False, s)
+        if row is not None:
+            return float(row[0][t])
+        row = self._cached(True, t)
+        if row is not None:
+            return float(row[0][s])
+        return float(self.from_source(source)[t])
+
+    def has_path(self, source, target):
+        return self.distance(source, target) < np.inf
+
+    def shortest_path(self, source, target):
+        """(path as a list of OSM node IDs, length), or (None, inf) if `target` is unreachable."""
+        s, t = self.graph.index_of(source), self.graph.index_of(target)
+        if s < 0 or t < 0:
+            return None, float('inf')
+        if self.all_pairs is not None:
+            path = self.all_pairs.path(s, t)
+            if path is not None:
+                return [self.graph.node_of(v) for v in path], self.all_pairs.distance(s, t)
+        if (False, s) not in self._rows and (True, t) in self._rows:
+            # Walk the reverse search tree forwards: successor[v] is the next hop from v towards t
+            dist, successor = self._cached(True, t)
+            if dist[s] == np.inf:
+                return None, float('inf')
+            path = [s]
+            while path[-1] != t:
+                path.append(int(successor[path[-1]]))
+            return [self.graph.node_of(v) for v in path], float(dist[s])
+
+        dist, predecessor = self._row(False, s)
+        if dist[t] == np.inf:
+            return None, float('inf')
+        path = [t]
+        while path[-1] != s:
+            path.append(int(predecessor[path[-1]]))
+        path.reverse()
+        return [self.graph.node_of(v) for v in path], float(dist[t])
+
+    def _ball(self, reverse, node, cutoff):
+        i = self.graph.index_of(node)
+        if i < 0:
+            return self._unreachable()[0]
+        row = self._cached(reverse, i)
+        if row is not None:
+            return row[0]
+        # Bounded searches are not cached: nodes beyond `cutoff` are reported as inf
+        dist, _ = self._search(self.graph.reverse() if reverse else self.graph, i, limit=cutoff)
+        return dist
+
+    def ball_from(self, source, cutoff):
+        """Distances from `source` indexed by dense node index; exact up to `cutoff`, inf beyond it.
+
+        Runs a forward Dijkstra that stops once the frontier passes `cutoff`
+        (or reuses a cached full search), so its cost grows with the size of
+        the ball rather than with the whole map.
+        """
+        return self._ball(False, source, cutoff)
+
+    def ball_to(self, target, cutoff):
+        """Distances into `target` indexed by dense node index; exact up to `cutoff`, inf beyond it (reverse Dijkstra)."""
+        return self._ball(True, target, cutoff)
+
+    def within(self, source, cutoff):
+        """{node ID: distance} for every node reachable from `source` within `cutoff`."""
+        if self.graph.index_of(source) < 0:
+            return {}
+        dist = self.ball_from(source, cutoff)
+        reached = np.flatnonzero(dist <= cutoff)
+        return dict(zip(self.graph.node_ids[reached].tolist(), dist[reached].tolist()))
+
+    def nearest_within(self, sources, cutoff):
+        """{node ID: (nearest source ID, distance)} for every node within `cutoff` of any of `sources`.
+
+        One multi-source Dijkstra over the CSR arrays, seeded with every source at
+        distance 0 and keyed by (distance, position in `sources`): each reached node
+        is settled once, by its nearest source, ties going to the source listed first.
+        """
+        heap = []
+        for position, source in enumerate(sources):
+            i = self.graph.index_of(source)
+            if i >= 0:
+                heap.append((0.0, position, i))
+        heapq.heapify(heap)
+        settled = {}  # dense node index -> (source position, distance)
+        while heap:
+            d, position, v = heapq.heappop(heap)
+            if v in settled:
+                continue
+            settled[v] = (position, d)
+            targets, weights = self.graph.successors(v)
+            for u, w in zip(targets.tolist(), weights.tolist()):
+                if d + w <= cutoff and u not in settled:
+                    heapq.heappush(heap, (d + w, position, u))
+        return {self.graph.node_of(v): (sources[position], d) for v, (position, d) in settled.items()}
+
+    def _matrix(self, reverse, ends, nodes):
+        columns = self.graph.indices_of(nodes)
+        matrix = np.full((len(ends), len(columns)), np.inf)
+        present = columns >= 0
+        searched = []  # (row of the matrix, dense index) of the ends the all-pairs matrix does not cover
+        for k, i in enumerate(self.graph.indices_of(ends).tolist()):
+            if i < 0:
+                continue
+            row = None
+            if self.all_pairs is not None:
+                lookup = self.all_pairs.column if reverse else self.all_pairs.row
+                row = lookup(i, columns[present])
+            if row is not None:
+                matrix[k, present] = row
+            else:
+                searched.append((k, i))
+        for (k, _), (dist, _) in zip(searched, self._search_rows(reverse, [i for _, i in searched])):
+            matrix[k, present] = dist[columns[present]]
+        return matrix
+
+    def distances_from(self, sources, nodes):
+        """Dense |sources| x |nodes| array with spd(source, node), inf where unreachable."""
+        return self._matrix(False, sources, nodes)
+
+    def distances_to(self, targets, nodes):
+        """Dense |targets| x |nodes| array with spd(node, target), inf where unreachable."""
+        return self._matrix(True, targets, nodes)
+
+    def pair_distances(self, sources, targets):
+        """Array of spd(sources[k], targets[k]), inf where unreachable.
+
+        One forward search per distinct source not covered by the all-pairs
+        matrix, in chunks, so only the rows that fit in `max_bytes` stay cached.
+        """
+        s, t = self.graph.indices_of(sources), self.graph.indices_of(targets)
+        lengths = np.full(len(s), np.inf)
+        searched = []
+        for k, (i, j) in enumerate(zip(s.tolist(), t.tolist())):
+            if i < 0 or j < 0:
+                continue
+            d = self.all_pairs.distance(i, j) if self.all_pairs is not None else None
+            if d is not None:
+                lengths[k] = d
+            else:
+                searched.append(k)
+        # Group the pairs by source so that each source is searched once
+        searched.sort(key=lambda k: s[k])
+        for k, (dist, _) in zip(searched, self._search_rows(False, [int(s[k]) for k in searched])):
+            lengths[k] = dist[t[k]]
+        return lengths
+
+    def deviated_path_length(self, driver, rider):
+        """spd(d.s, r.s) + spd(r.s, r.f) + spd(r.f, d.f) for a single driver and rider."""
+        return (self.distance(driver.source, rider.source)
+                + self.distance(rider.source, rider.destination)
+                + self.distance(rider.destination, driver.destination))
@@ -0,0 +1,337 @@
+import numpy as np
+
+# Cells evaluated per block when the ER matrix is built, which bounds the
+# temporary |block| x |R| float arrays to ~32 MB however many drivers there are.
+BLOCK_CELLS = 1 << 22
+
+
+def driver_blocks(num_drivers, num_riders):
+    """(lo, hi) ranges of consecutive drivers, each covering at most ~BLOCK_CELLS (driver, rider) cells."""
+    step = max(1, BLOCK_CELLS // max(num_riders, 1))
+    for lo in range(0, num_drivers, step):
+        yield lo, min(lo + step, num_drivers)
+
+
+class DenseEligibility:
+    """ER as a dense |D| x |R| int array (the original representation)."""
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    @classmethod
+    def from_blocks(cls, num_drivers, num_riders, blocks):
+        """Build from boolean row blocks covering drivers 0..|D|-1 in order."""
+        blocks = list(blocks)
+        if not blocks:
+            return cls(np.zeros((num_drivers, num_riders), dtype=int))
+        return cls(np.vstack(blocks).astype(int))
+
+    @classmethod
+    def empty(cls, num_drivers, num_riders):
+        return cls.from_blocks(num_drivers, num_riders, [])
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def is_eligible(self, d, r):
+        return bool(self.matrix[d, r])
+
+    def row(self, d):
+        """Riders driver d is eligible for, ascending."""
+        return np.flatnonzero(self.matrix[d])
+
+    def column(self, r):
+        """Drivers eligible for rider r, ascending."""
+        return np.flatnonzero(self.matrix[:, r])
+
+    def column_counts(self):
+        return np.sum(self.matrix, axis=0)
+
+    def add(self, d, r):
+        """Set ER[d][r] = 1; True if it was 0."""
+        if self.matrix[d, r]:
+            return False
+        self.matrix[d, r] = 1
+        return True
+
+    def discard(self, d, r):
+        """Set ER[d][r] = 0; True if it was 1."""
+        if not self.matrix[d, r]:
+            return False
+        self.matrix[d, r] = 0
+        return True
+
+    def clear_row(self, d):
+        """Set ER[d][*] = 0 and return the riders that were cleared."""
+        cleared = self.row(d)
+        self.matrix[d, cleared] = 0
+        return cleared
+
+    def clear_column(self, r):
+        """Set ER[*][r] = 0 and return the drivers that were cleared."""
+        cleared = self.column(r)
+        self.matrix[cleared, r] = 0
+        return cleared
+
+    def to_dense(self):
+        return self.matrix
+
+    def __str__(self):
+        return str(self.matrix)
+
+
+class SparseEligibility:
+    """ER stored as its eligible (driver, rider) pairs only.
+
+    The pairs are kept in CSR order (by driver, then rider) with a CSC
+    permutation (by rider, then driver) over the same entries, so both a
+    driver's riders and a rider's drivers are a contiguous slice. Clearing a
+    cell, row or column only flips `live` flags; the per-rider live counts
+    (the Offer array) are maintained alongside. Memory is ~13 bytes per
+    eligible pair instead of 8 bytes per (driver, rider) cell.
+    """
+
+    def __init__(self, num_drivers, num_riders, drivers, riders):
+        self.num_drivers = num_drivers
+        self.num_riders = num_riders
+        self._build(np.asarray(drivers, dtype=np.int64), np.asarray(riders, dtype=np.int64))
+
+    def _build(self, drivers, riders):
+        index_dtype = np.int32 if len(drivers) < np.iinfo(np.int32).max else np.int64
+        order = np.lexsort((riders, drivers))
+        self.row_indices = drivers[order].astype(np.int32)
+        self.indices = riders[order].astype(np.int32)
+        self.indptr = np.zeros(self.num_drivers + 1, dtype=index_dtype)
+        np.cumsum(np.bincount(self.row_indices, minlength=self.num_drivers), out=self.indptr[1:])
+
+        # CSR positions grouped by rider; lexsort is stable, so drivers stay ascending within a rider
+        self.col_order = np.argsort(self.indices, kind='stable').astype(index_dtype)
+        self.col_indptr = np.zeros(self.num_riders + 1, dtype=index_dtype)
+        np.cumsum(np.bincount(self.indices, minlength=self.num_riders), out=self.col_indptr[1:])
+
+        self.live = np.ones(len(self.indices), dtype=bool)
+        self.counts = np.bincount(self.indices, minlength=self.num_riders).astype(int)
+
+    @classmethod
+    def from_blocks(cls, num_drivers, num_riders, blocks):
+        """Build from boolean row blocks covering drivers 0..|D|-1 in order, keeping only their nonzeros."""
+        drivers, riders = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        offset = 0
+        for block in blocks:
+            d, r = np.nonzero(block)
+            drivers.append(d + offset)
+            riders.append(r)
+            offset += len(block)
+        return cls(num_drivers, num_riders, np.concatenate(drivers), np.concatenate(riders))
+
+    @classmethod
+    def empty(cls, num_drivers, num_riders):
+        return cls.from_blocks(num_drivers, num_riders, [])
+
+    @property
+    def shape(self):
+        return (self.num_drivers, self.num_riders)
+
+    def _position(self, d, r):
+        """Index of the stored (d, r) entry, live or not, or -1."""
+        lo, hi = self.indptr[d], self.indptr[d + 1]
+        k = lo + np.searchsorted(self.indices[lo:hi], r)
+        return k if k < hi and self.indices[k] == r else -1
+
+    def is_eligible(self, d, r):
+        k = self._position(d, r)
+        return k >= 0 and bool(self.live[k])
+
+    def row(self, d):
+        """Riders driver d is eligible for, ascending."""
+        lo, hi = self.indptr[d], self.indptr[d + 1]
+        return self.indices[lo:hi][self.live[lo:hi]]
+
+    def column(self, r):
+        """Drivers eligible for rider r, ascending."""
+        positions = self.col_order[self.col_indptr[r]:self.col_indptr[r + 1]]
+        return self.row_indices[positions[self.live[positions]]]
+
+    def column_counts(self):
+        return self.counts.copy()
+
+    def add(self, d, r):
+        """Set ER[d][r] = 1; True if it was 0."""
+        k = self._position(d, r)
+        if k >= 0:
+            if self.live[k]:
+                return False
+            self.live[k] = True
+            self.counts[r] += 1
+            return True
+        # A pair that was never eligible: rebuild the index arrays with it (rare)
+        live = np.flatnonzero(self.live)
+        self._build(np.append(self.row_indices[live], d).astype(np.int64),
+                    np.append(self.indices[live], r).astype(np.int64))
+        return True
+
+    def discard(self, d, r):
+        """Set ER[d][r] = 0; True if it was 1."""
+        k = self._position(d, r)
+        if k < 0 or not self.live[k]:
+            return False
+        self.live[k] = False
+        self.counts[r] -= 1
+        return True
+
+    def clear_row(self, d):
+        """Set ER[d][*] = 0 and return the riders that were cleared."""
+        lo = self.indptr[d]
+        positions = lo + np.flatnonzero(self.live[lo:self.indptr[d + 1]])
+        self.live[positions] = False
+        cleared = self.indices[positions]
+        self.counts[cleared] -= 1
+        return cleared
+
+    def clear_column(self, r):
+        """Set ER[*][r] = 0 and return the drivers that were cleared."""
+        positions = self.col_order[self.col_indptr[r]:self.col_indptr[r + 1]]
+        positions = positions[self.live[positions]]
+        self.live[positions] = False
+        self.counts[r] = 0
+        return self.row_indices[positions]
+
+    def to_dense(self):
+        matrix = np.zeros(self.shape, dtype=int)
+        live = np.flatnonzero(self.live)
+        matrix[self.row_indices[live], self.indices[live]] = 1
+        return matrix
+
+    def __str__(self):
+        return f"<sparse ER {self.num_drivers}x{self.num_riders}, {int(self.counts.sum())} eligible pairs>"
+
+
+def _popcount(words):
+    """Number of set bits in each uint64 word."""
+    if hasattr(np, 'bitwise_count'):  # NumPy >= 2.0
+        return np.bitwise_count(words)
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return table[words.view(np.uint8)].reshape(*words.shape, 8).sum(axis=-1)
+
+
+def _bits(positions):
+    """uint64 word masks with bit (position % 64) set."""
+    return np.left_shift(np.uint64(1), (np.asarray(positions) & 63).astype(np.uint64))
+
+
+def _pack(block, width):
+    """Pack a boolean (n, m) array into (n, width) little-endian uint64 words."""
+    padded = np.zeros((len(block), width * 64), dtype=bool)
+    padded[:, :block.shape[1]] = block
+    return np.packbits(padded, axis=1, bitorder='little').view('<u8')
+
+
+def _unpack(words, length):
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder='little')[:length])
+
+
+class BitPackedEligibility:
+    """ER as bit-packed uint64 rows, one bit per (driver, rider) cell.
+
+    `rows[d]` holds the bits of driver d's riders and `columns[r]`, a
+    transposed copy, the bits of rider r's drivers, so clearing a row or a
+    column is a word assignment plus one bit clear per affected entry of
+    the other copy. Offers are popcounts of the column words. Both arrays
+    are plain fixed-size uint64 buffers, 1/64 of the dense int matrix each,
+    and can be placed in shared memory for worker processes.
+    """
+
+    def __init__(self, num_drivers, num_riders, rows, columns):
+        self.num_drivers = num_drivers
+        self.num_riders = num_riders
+        self.rows = rows        # (|D|, ceil(|R|/64)) uint64
+        self.columns = columns  # (|R|, ceil(|D|/64)) uint64
+
+    @classmethod
+    def from_blocks(cls, num_drivers, num_riders, blocks):
+        """Build from boolean row blocks covering drivers 0..|D|-1 in order."""
+        row_width, column_width = -(-num_riders // 64), -(-num_drivers // 64)
+        rows = np.zeros((num_drivers, row_width), dtype=np.uint64)
+        columns = np.zeros((num_riders, column_width), dtype=np.uint64)
+        offset = 0
+        for block in blocks:
+            rows[offset:offset + len(block)] = _pack(block, row_width)
+            d, r = np.nonzero(block)
+            d += offset
+            np.bitwise_or.at(columns, (r, d >> 6), _bits(d))
+            offset += len(block)
+        return cls(num_drivers, num_riders, rows, columns)
+
+    @classmethod
+    def empty(cls, num_drivers, num_riders):
+        return cls.from_blocks(num_drivers, num_riders, [])
+
+    @property
+    def shape(self):
+        return (self.num_drivers, self.num_riders)
+
+    def is_eligible(self, d, r):
+        return bool(self.rows[d, r >> 6] & _bits(r))
+
+    def row(self, d):
+        """Riders driver d is eligible for, ascending."""
+        return _unpack(self.rows[d], self.num_riders)
+
+    def column(self, r):
+        """Drivers eligible for rider r, ascending."""
+        return _unpack(self.columns[r], self.num_drivers)
+
+    def column_counts(self):
+        return _popcount(self.columns).sum(axis=1).astype(int)
+
+    def add(self, d, r):
+        """Set ER[d][r] = 1; True if it was 0."""
+        if self.is_eligible(d, r):
+            return False
+        self.rows[d, r >> 6] |= _bits(r)
+        self.columns[r, d >> 6] |= _bits(d)
+        return True
+
+    def discard(self, d, r):
+        """Set ER[d][r] = 0; True if it was 1."""
+        if not self.is_eligible(d, r):
+            return False
+        self.rows[d, r >> 6] &= ~_bits(r)
+        self.columns[r, d >> 6] &= ~_bits(d)
+        return True
+
+    def clear_row(self, d):
+        """Set ER[d][*] = 0 and return the riders that were cleared."""
+        cleared = self.row(d)
+        self.rows[d] = 0
+        self.columns[cleared, d >> 6] &= ~_bits(d)
+        return cleared
+
+    def clear_column(self, r):
+        """Set ER[*][r] = 0 and return the drivers that were cleared."""
+        cleared = self.column(r)
+        self.columns[r] = 0
+        self.rows[cleared, r >> 6] &= ~_bits(r)
+        return cleared
+
+    def to_dense(self):
+        bits = np.unpackbits(self.rows.view(np.uint8), axis=1, bitorder='little')
+        return bits[:, :self.num_riders].astype(int)
+
+    def __str__(self):
+        return f"<bit-packed ER {self.num_drivers}x{self.num_riders}, {int(_popcount(self.rows).sum())} eligible pairs>"
+
+
+ER_BACKENDS = {
+    'dense': DenseEligibility,
+    'sparse': SparseEligibility,
+    'bitpacked': BitPackedEligibility,
+}
+
+
+def eligibility_backend(name):
+    """ER matrix class for a backend name ('dense', 'sparse' or 'bitpacked')."""
+    if name not in ER_BACKENDS:
+        raise ValueError(f"Unknown ER backend: {name}")
+    return ER_BACKENDS[name]
@@ -0,0 +1,202 @@
+import csv
+import os
+import numpy as np
+import scipy.sparse as sp
+
+
+BUNDLE_ARRAYS = ('node_ids', 'indptr', 'indices', 'weights')
+
+
+class CSRGraph:
+    """Compact directed road graph in compressed sparse row (CSR) form.
+
+    OSM node IDs (64-bit, e.g. 9443684664) are remapped to dense int32 indices
+    0..n-1. `node_ids` is sorted, so the ID -> index lookup is a binary search
+    and needs no per-node dictionary. Adjacency is stored as three flat arrays:
+      - indptr  (int32, n+1): out-edges of node i are indptr[i]:indptr[i+1]
+                              (int64 only past 2**31 edges)
+      - indices (int32, m):   edge targets
+      - weights (float32, m): edge lengths
+    Parallel edges are collapsed to the shortest one.
+    """
+
+    def __init__(self, node_ids, indptr, indices, weights, coords=None):
+        self.node_ids = node_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.coords = coords  # optional (n, 2) float array of (x, y), NaN where unknown
+        self.source_file = None  # file the graph was loaded from; per-graph caches are stored next to it
+        self._matrix = None
+        self._reverse = None
+
+    @classmethod
+    def from_edges(cls, sources, targets, weights, node_ids=None, coords=None):
+        """Build the CSR arrays from parallel sequences of OSM source IDs, target IDs and weights."""
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float32)
+
+        if node_ids is None:
+            node_ids = np.unique(np.concatenate([sources, targets]))
+        else:
+            node_ids = np.asarray(node_ids, dtype=np.int64)
+            order = np.argsort(node_ids, kind='stable')
+            node_ids = node_ids[order]
+            if coords is not None:
+                coords = np.asarray(coords, dtype=np.float64)[order]
+        src = np.searchsorted(node_ids, sources).astype(np.int32)
+        dst = np.searchsorted(node_ids, targets).astype(np.int32)
+
+        # Sort by (source, target, weight) and keep the first of every (source, target) run
+        order = np.lexsort((weights, dst, src))
+        src, dst, weights = src[order], dst[order], weights[order]
+        keep = np.ones(len(src), dtype=bool)
+        keep[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+        src, dst, weights = src[keep], dst[keep], weights[keep]
+
+        # int32 offsets whenever they fit, so scipy can use the arrays without upcasting them
+        indptr_dtype = np.int32 if len(src) < np.iinfo(np.int32).max else np.int64
+        indptr = np.zeros(len(node_ids) + 1, dtype=indptr_dtype)
+        np.cumsum(np.bincount(src, minlength=len(node_ids)), out=indptr[1:])
+        return cls(node_ids, indptr, dst, weights, coords)
+
+    @classmethod
+    def from_csv(cls, file_path, integer_weights=False):
+        """Read an edge list CSV with a header row and columns source, destination, weight."""
+        sources, targets, weights = [], [], []
+        with open(file_path, 'r') as file:
+            reader = csv.reader(file)
+            next(reader)  # Skip the header row
+            for row in reader:
+                sources.append(int(row[0]))
+                targets.append(int(row[1]))
+                weights.append(int(float(row[2])) if integer_weights else float(row[2]))
+        return cls.from_edges(sources, targets, weights)
+
+    def save(self, bundle_dir):
+        """Write the graph as a binary bundle: one raw .npy file per array, loadable with mmap."""
+        os.makedirs(bundle_dir, exist_ok=True)
+        for name in BUNDLE_ARRAYS:
+            np.save(os.path.join(bundle_dir, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        coords_file = os.path.join(bundle_dir, 'coords.npy')
+        if self.coords is not None:
+            np.save(coords_file, np.ascontiguousarray(self.coords))
+        elif os.path.exists(coords_file):
+            os.remove(coords_file)
+
+    @classmethod
+    def load(cls, bundle_dir, mmap_mode='r'):
+        """Open a bundle written by `save`. With mmap_mode='r' the arrays are memory-mapped,
+        so startup does no parsing and concurrent processes share the page-cached files."""
+        arrays = {name: np.load(os.path.join(bundle_dir, f"{name}.npy"), mmap_mode=mmap_mode) for name in BUNDLE_ARRAYS}
+        coords_file = os.path.join(bundle_dir, 'coords.npy')
+        coords = np.load(coords_file, mmap_mode=mmap_mode) if os.path.exists(coords_file) else None
+        return cls(coords=coords, **arrays)
+
+    def with_weights(self, weights):
+        """Same topology (sharing the index arrays) with a different weight array."""
+        graph = CSRGraph(self.node_ids, self.indptr, self.indices, weights, self.coords)
+        graph.source_file = self.source_file
+        return graph
+
+    def number_of_nodes(self):
+        return len(self.node_ids)
+
+    def number_of_edges(self):
+        return len(self.indices)
+
+    def __contains__(self, node_id):
+        return self.index_of(node_id) >= 0
+
+    def index_of(self, node_id):
+        """Dense index of an OSM node ID, or -1 if the node is not in the graph."""
+        i = int(np.searchsorted(self.node_ids, node_id))
+        if i < len(self.node_ids) and self.node_ids[i] == node_id:
+            return i
+        return -1
+
+    def indices_of(self, node_ids):
+        """Vectorized `index_of` for an array of OSM node IDs (-1 where missing)."""
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        idx = np.searchsorted(self.node_ids, node_ids)
+        idx = np.minimum(idx, max(len(self.node_ids) - 1, 0))
+        found = len(self.node_ids) > 0 and self.node_ids[idx] == node_ids
+        return np.where(found, idx, -1).astype(np.int64)
+
+    def node_of(self, index):
+        """OSM node ID for a dense index."""
+        return int(self.node_ids[index])
+
+    def nodes(self):
+        """All OSM node IDs as Python ints."""
+        return self.node_ids.tolist()
+
+    def successors(self, index):
+        """(targets, weights) of the out-edges of dense node `index`."""
+        start, end = self.indptr[index], self.indptr[index + 1]
+        return self.indices[start:end], self.weights[start:end]
+
+    def coordinates(self, node_id):
+        """(x, y) of an OSM node, or None if no coordinates are known."""
+        if self.coords is None:
+            return None
+        i = self.index_of(node_id)
+        if i < 0 or np.isnan(self.coords[i]).any():
+            return None
+        return float(self.coords[i][0]), float(self.coords[i][1])
+
+    def to_scipy(self):
+        """float64 scipy CSR matrix sharing the index arrays (built once, used by csgraph routines)."""
+        if self._matrix is None:
+            n = len(self.node_ids)
+            self._matrix = sp.csr_matrix(
+                (self.weights.astype(np.float64), self.indices, self.indptr), shape=(n, n)
+            )
+        return self._matrix
+
+    def reverse(self):
+        """Graph with every edge reversed, used for one-to-many searches *into* a target."""
+        if self._reverse is None:
+            transposed = self.to_scipy().T.tocsr()
+            transposed.sort_indices()
+            self._reverse = CSRGraph(
+                self.node_ids,
+                transposed.indptr,
+                transposed.indices,
+                transposed.data.astype(np.float32),
+                self.coords,
+            )
+            self._reverse._matrix = transposed
+            self._reverse._reverse = self
+        return self._reverse
+
+
+def bundle_path_for(csv_file):
+    """Binary bundle directory stored next to an edge list CSV (map/graph.csv -> map/graph.bundle)."""
+    return os.path.splitext(csv_file)[0] + '.bundle'
+
+
+def bundle_is_current(bundle_dir, csv_file):
+    """True if the bundle has all its arrays and is not older than the CSV it was built from."""
+    paths = [os.path.join(bundle_dir, f"{name}.npy") for name in BUNDLE_ARRAYS]
+    if not all(os.path.exists(path) for path in paths):
+        return False
+    return not os.path.exists(csv_file) or min(os.path.getmtime(path) for path in paths) >= os.path.getmtime(csv_file)
+
+
+def load_graph(file_path, mmap_mode='r'):
+    """Load a road graph from a bundle directory or an edge list CSV.
+
+    CSV is only an import format: the first time a CSV is loaded it is converted
+    into a bundle next to it, and later runs memory-map that bundle instead.
+    """
+    if os.path.isdir(file_path):
+        graph = CSRGraph.load(file_path, mmap_mode=mmap_mode)
+    else:
+        bundle_dir = bundle_path_for(file_path)
+        if not bundle_is_current(bundle_dir, file_path):
+            CSRGraph.from_csv(file_path).save(bundle_dir)
+        graph = CSRGraph.load(bundle_dir, mmap_mode=mmap_mode)
+    graph.source_file = file_path
+    return graph
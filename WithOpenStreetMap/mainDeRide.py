@@ -1,30 +1,27 @@
 import csv
-import networkx as nx
 import numpy as np
 import random
 import os
 import time
+from distance_engine import DistanceEngine
+from path_cache import PathCache, DEFAULT_MAX_BYTES
+from offer_queue import OfferQueue
+from eligibility import driver_blocks, eligibility_backend
+from node_index import RiderIndex, PathPositions
+from tracing import Tracer, PAIR
+from result_writer import ResultWriter
+from graph_csr import load_graph as load_csr_graph
 
 class GraphManager:
     def __init__(self, file_path):
-        self.graph = nx.DiGraph()
+        self.graph = None
         self.load_graph(file_path)
 
     def load_graph(self, file_path):
-        edges = self.read_graph_from_csv(file_path)
-        for edge in edges:
-            self.graph.add_edge(edge[0], edge[1], weight=edge[2])
-
-    @staticmethod
-    def read_graph_from_csv(file_path):
-        edges = []
-        with open(file_path, 'r') as file:
-            reader = csv.reader(file)
-            next(reader)  # Skip the header row if it exists
-            for row in reader:
-                node1, node2, weight = int(row[0]), int(row[1]), int(float(row[2]))  # Convert weight to integer
-                edges.append((node1, node2, weight))
-        return edges
+        # Memory-mapped binary graph bundle; the CSV is only parsed (and converted) on first use
+        graph = load_csr_graph(file_path)
+        # DeRide has always worked on edge lengths truncated to integers
+        self.graph = graph.with_weights(np.trunc(graph.weights))
 
 
 class Driver:
@@ -34,6 +31,10 @@ class Driver:
         self.destination = destination
         self.seats = seats
         self.threshold = threshold
+        # Shortest path length SP (d.s -> d.f) and maximum path length MP, set once by
+        # EligibilityRiderMatrix.set_path_limits
+        self.sp = None
+        self.mp = None
 
 
 class Rider:
@@ -44,129 +45,267 @@ class Rider:
 
 
 class EligibilityRiderMatrix:
-    def __init__(self, graph_manager, output_file):
+    def __init__(self, graph_manager, trace, path_cache_bytes=DEFAULT_MAX_BYTES, er_backend='dense'):
         self.graph_manager = graph_manager
         self.ER = None
+        # 'dense' keeps the |D| x |R| int array; 'sparse' stores only the eligible pairs;
+        # 'bitpacked' stores one bit per cell
+        self.er_backend = eligibility_backend(er_backend)
         self.offers = None
+        self.offer_queue = None
+        # One budget for the engine's search rows and the memo on top of them
+        self.distance_engine = DistanceEngine(graph_manager.graph, max_bytes=path_cache_bytes)
+        # (source, target) memo shared by the matrix phase and the assignment phase
+        self.path_cache = PathCache(self.distance_engine, max_bytes=path_cache_bytes)
         self.node_coordinates = self.get_node_coordinates()
-        output_file.write("########## Eligibility Rider(ER) Matrix initialized. ###########\n")
+        trace.summary("########## Eligibility Rider(ER) Matrix initialized. ###########")
 
     def get_node_coordinates(self):
         """Generate a dictionary mapping each node ID to its (x, y) coordinates."""
         node_coordinates = {}
-        for node in self.graph_manager.graph.nodes:
-            x = self.graph_manager.graph.nodes[node].get('x')
-            y = self.graph_manager.graph.nodes[node].get('y')
-            if x is not None and y is not None:
-                node_coordinates[node] = (x, y)
+        for node in self.graph_manager.graph.nodes():
+            xy = self.graph_manager.graph.coordinates(node)
+            if xy is not None:
+                node_coordinates[node] = xy
         return node_coordinates
     
-    def calculate(self, drivers, riders, output_file):
-        DP_assigned = {driver.id: {'driver_path': [], 'nodes': {}} for driver in drivers}
+    def set_path_limits(self, drivers):
+        """Set SP and MP on every driver, with one batched forward search per driver source."""
+        sp = self.distance_engine.pair_distances([driver.source for driver in drivers], [driver.destination for driver in drivers])
+        for driver, driver_sp in zip(drivers, sp.tolist()):
+            driver.sp = driver_sp
+            driver.mp = driver.sp * (1 + (driver.threshold / 100))
+
+    def calculate(self, drivers, riders, trace, mode='corridor', rider_index=None):
+        """Build the ER matrix.
+
+        mode='corridor' (default) only looks at the riders inside each driver's detour
+        ellipse (see `corridor_candidates`), so the work per driver follows the size of the
+        ellipse rather than |R|; mode='vectorized' evaluates every (driver, rider) pair in one
+        broadcasted NumPy expression over precomputed distance arrays; mode='scalar' is the
+        original per-pair loop, kept as a reference/debug implementation.
+        """
+        # node -> riders index by pickup and dropoff (RideShareSystem.load_riders builds it once),
+        # set before the mode dispatch since the assignment phase reads it in every mode
+        self.rider_index = rider_index if rider_index is not None else RiderIndex(self.graph_manager.graph, riders)
+        if mode == 'scalar':
+            return self.calculate_scalar(drivers, riders, trace)
+        if mode not in ('corridor', 'vectorized'):
+            raise ValueError(f"Unknown eligibility calculation mode: {mode}")
+
+        DP_assigned = {driver.id: {'driver_path': [], 'nodes': {}, 'positions': PathPositions([], {})} for driver in drivers}
+        num_drivers = len(drivers)
+        num_riders = len(riders)
+
+        self.ER = self.er_backend.empty(num_drivers, num_riders)
+        self.offers = np.zeros(num_riders, dtype=int)
+        trace.summary("Initialized ER matrix of size {} and ER :\n {}", self.ER.shape, self.ER)
+        trace.summary("Offer array: \n{}", self.offers)
+
+        driver_sources = [driver.source for driver in drivers]
+        driver_destinations = [driver.destination for driver in drivers]
+        if mode == 'vectorized':
+            # Distinct pickup/dropoff nodes become the columns of the distance arrays;
+            # rs/rf map each rider to its column.
+            pickup_nodes, rs = np.unique(np.array([rider.source for rider in riders], dtype=np.int64), return_inverse=True)
+            dropoff_nodes, rf = np.unique(np.array([rider.destination for rider in riders], dtype=np.int64), return_inverse=True)
+            pickup_nodes, dropoff_nodes = pickup_nodes.tolist(), dropoff_nodes.tolist()
+
+            # Driver rows are searched block by block in eligible_blocks; the trip lengths
+            # only need one value per rider, not a kept row per pickup
+            trip = self.distance_engine.pair_distances([rider.source for rider in riders], [rider.destination for rider in riders])
+        else:
+            # Riders are only reached through the node -> riders index of their pickups and
+            # dropoffs; trip lengths are filled in lazily, for corridor candidates only.
+            trip = np.full(num_riders, np.nan)
+
+        if any(driver.sp is None for driver in drivers):
+            self.set_path_limits(drivers)
+        SP = np.array([driver.sp for driver in drivers], dtype=float)
+        MP = np.array([driver.mp for driver in drivers], dtype=float)
+        t = np.array([driver.threshold for driver in drivers], dtype=float)
+        for i, driver in enumerate(drivers):
+            trace.iteration("Driver {}: Shortest Path (SP) distance = {}, Maximum Path (MP) distance= {}", driver.id, SP[i], MP[i])
+
+        # DP = spd(d.s, r.s) + spd(r.s, r.f) + spd(r.f, d.f) for all pairs of one block of drivers at a time
+        def eligible_blocks():
+            for lo, hi in driver_blocks(num_drivers, num_riders):
+                if mode == 'corridor':
+                    block = np.zeros((hi - lo, num_riders), dtype=bool)
+                    for i in range(lo, hi):
+                        block[i - lo, self.corridor_candidates(drivers[i], MP[i], trip, riders)] = True
+                else:
+                    D_src = self.distance_engine.distances_from(driver_sources[lo:hi], pickup_nodes)
+                    D_dst = self.distance_engine.distances_to(driver_destinations[lo:hi], dropoff_nodes)
+                    block = D_src[:, rs] + trip + D_dst[:, rf] <= MP[lo:hi, None]
+
+                # Threshold-0 drivers only take riders on their own shortest path
+                for i in lo + np.flatnonzero(t[lo:hi] == 0):
+                    driver = drivers[i]
+                    shortest_path, _ = self.shortest_path_distance(driver.source, driver.destination, trace)
+                    self.set_driver_path(DP_assigned, driver.id, shortest_path, self.find_nodes_within_threshold(shortest_path, 0))
+                    # Only riders with both endpoints among the path nodes can be on the route
+                    candidates = self.rider_index.on_nodes(DP_assigned[driver.id]['nodes'])
+                    block[i - lo] = False
+                    block[i - lo, candidates[self.on_deviated_route(driver.id, candidates, riders, DP_assigned, trace)]] = True
+                yield block
+
+        self.ER = self.er_backend.from_blocks(num_drivers, num_riders, eligible_blocks())
+
+        trace.summary("Eligibility matrix after calculation: \n{}", self.ER)
+        self.update_offers(trace)
+
+    def corridor_candidates(self, driver, max_path, trip, riders):
+        """Indices of the riders eligible for `driver` with maximum path length `max_path` (MP).
+
+        A rider can only be eligible if spd(d.s, r.s) + spd(r.f, d.f) <= MP, so its pickup
+        must lie in the forward Dijkstra ball from d.s and its dropoff in the reverse ball
+        into d.f, both cut off at MP. Riders outside either ball are rejected without looking
+        up their trip length; `trip` caches spd(r.s, r.f) per rider (NaN until needed).
+        """
+        if not np.isfinite(max_path):
+            # Driver without a route: MP is inf and every rider compares eligible, as in the vectorized mode
+            return np.arange(len(riders))
+        to_pickup = self.distance_engine.ball_from(driver.source, max_path)
+        pickups, dropoffs = self.rider_index.pickups, self.rider_index.dropoffs
+        candidates = pickups.within(to_pickup, max_path)
+        if len(candidates) == 0:
+            return candidates
+        from_dropoff = self.distance_engine.ball_to(driver.destination, max_path)
+        pf = dropoffs.node_index[candidates]
+        d_src = to_pickup[pickups.node_index[candidates]]
+        d_dst = np.where(pf >= 0, from_dropoff[pf], np.inf)
+        inside = d_src + d_dst <= max_path
+        candidates, d_src, d_dst = candidates[inside], d_src[inside], d_dst[inside]
+
+        pending = candidates[np.isnan(trip[candidates])]
+        if len(pending):
+            trip[pending] = self.distance_engine.pair_distances([riders[j].source for j in pending],
+                                                               [riders[j].destination for j in pending])
+        return candidates[d_src + trip[candidates] + d_dst <= max_path]
+
+    def calculate_scalar(self, drivers, riders, trace):
+        """Reference implementation of `calculate`: checks every (driver, rider) pair in Python."""
+        DP_assigned = {driver.id: {'driver_path': [], 'nodes': {}, 'positions': PathPositions([], {})} for driver in drivers}
         num_drivers = len(drivers)
         num_riders = len(riders)
 
-        self.ER = np.zeros((num_drivers, num_riders), dtype=int)
+        ER = np.zeros((num_drivers, num_riders), dtype=int)
         self.offers = np.zeros(num_riders, dtype=int)
-        output_file.write(f"Initialized ER matrix of size {self.ER.shape} and ER :\n {self.ER}\n")
-        output_file.write(f"Offer array: \n{self.offers}\n")
+        trace.summary("Initialized ER matrix of size {} and ER :\n {}", ER.shape, ER)
+        trace.summary("Offer array: \n{}", self.offers)
+
+        # One forward Dijkstra per driver source and per distinct rider source, and one
+        # reverse Dijkstra per driver destination: every spd() below is then a lookup.
+        self.distance_engine.precompute(
+            sources=[driver.source for driver in drivers] + [rider.source for rider in riders],
+            targets=[driver.destination for driver in drivers]
+        )
 
         for i, driver in enumerate(drivers):
-            output_file.write(f"##### Driver {driver.id}: ##### \n")
-            shortest_path, sp_length = self.shortest_path_distance(driver.source, driver.destination, output_file)
+            trace.iteration("##### Driver {}: ##### ", driver.id)
+            shortest_path, sp_length = self.shortest_path_distance(driver.source, driver.destination, trace)
             t = driver.threshold
             radius = 0
             if t == 0:
             
                 nodes_within_circle_of_shortest_path_nodes = self.find_nodes_within_threshold(shortest_path, radius)
-                output_file.write(f"Shortest Path (SP) distance = {sp_length}\n")
+                trace.pair("Shortest Path (SP) distance = {}", sp_length)
                 
-                DP_assigned[driver.id]['driver_path'] = shortest_path
-                DP_assigned[driver.id]['nodes'] = nodes_within_circle_of_shortest_path_nodes
+                self.set_driver_path(DP_assigned, driver.id, shortest_path, nodes_within_circle_of_shortest_path_nodes)
                 for j, rider in enumerate(riders):
-                    output_file.write(f"####### Checking for rider {rider.id} is eligible for driver {driver.id}...... #######\n")
+                    trace.pair("####### Checking for rider {} is eligible for driver {}...... #######", rider.id, driver.id)
                     
-                    if self.is_on_deviated_route(drivers[i].id, riders[j], DP_assigned, output_file):
-                        self.ER[i][j] = 1
-                        output_file.write(f"Rider {rider.id} is near the shortest path of driver {driver.id}\n")
+                    if self.is_on_deviated_route(drivers[i].id, riders[j], DP_assigned, trace):
+                        ER[i][j] = 1
+                        trace.pair("Rider {} is near the shortest path of driver {}", rider.id, driver.id)
                     else:
-                        output_file.write(f"Rider {rider.id} is not near the shortest path of driver {driver.id}\n")
+                        trace.pair("Rider {} is not near the shortest path of driver {}", rider.id, driver.id)
                 
             else:
                 MP = sp_length * (1 + (t / 100))
-                output_file.write(f"Shortest Path (SP) distance = {sp_length}, Maximum Path (MP) distance= {MP}\n")
+                trace.pair("Shortest Path (SP) distance = {}, Maximum Path (MP) distance= {}", sp_length, MP)
 
                 for j, rider in enumerate(riders):
-                    output_file.write(f"####### Checking for rider {rider.id} is eligible for driver {driver.id}...... #######\n")
-                    DP = self.calculate_deviated_path(driver, rider, output_file)
-                    output_file.write(f"Rider {rider.id}: Deviated Path (DP) length = {DP}, MP = {MP}\n")
+                    trace.pair("####### Checking for rider {} is eligible for driver {}...... #######", rider.id, driver.id)
+                    DP = self.calculate_deviated_path(driver, rider, trace)
+                    trace.pair("Rider {}: Deviated Path (DP) length = {}, MP = {}", rider.id, DP, MP)
                     if DP <= MP:
-                        self.ER[i][j] = 1
-                        output_file.write(f"Rider {rider.id} is eligible for Driver {driver.id}\n")
+                        ER[i][j] = 1
+                        trace.pair("Rider {} is eligible for Driver {}", rider.id, driver.id)
                     else:
-                        output_file.write(f"Rider {rider.id} is not eligible for Driver {driver.id}\n")
-            output_file.write(f"Eligibility matrix after checking the all riders for driver {driver.id}:\n {self.ER}\n")
-        output_file.write(f"Eligibility matrix after calculation: \n{self.ER}\n")
-        self.update_offers(output_file)
-
-    def shortest_path_distance(self, source, target, output_file):
-        try:
-            path = nx.shortest_path(self.graph_manager.graph, source=source, target=target, weight='weight')
-            path_length = nx.shortest_path_length(self.graph_manager.graph, source=source, target=target, weight='weight')
-            output_file.write(f"Shortest path from Source {source} to Destination {target}: {path}, Shortest Length: {path_length}\n")
-            return path, path_length
-        except nx.NetworkXNoPath:
-            output_file.write(f"No path found from {source} to {target}.\n")
+                        trace.pair("Rider {} is not eligible for Driver {}", rider.id, driver.id)
+            trace.iteration("Eligibility matrix after checking the all riders for driver {}:\n {}", driver.id, ER)
+        trace.summary("Eligibility matrix after calculation: \n{}", ER)
+        self.ER = self.er_backend.from_blocks(num_drivers, num_riders, [ER.astype(bool)])
+        self.update_offers(trace)
+
+    def shortest_path_distance(self, source, target, trace):
+        path, path_length = self.path_cache.path(source, target)
+        if path is None:
+            trace.pair("No path found from {} to {}.", source, target)
             return None, float('inf')
+        trace.pair("Shortest path from Source {} to Destination {}: {}, Shortest Length: {}", source, target, path, path_length)
+        return path, path_length
 
-    def calculate_deviated_path(self, driver, rider, output_file):
-        DP1, dp1_length = self.shortest_path_distance(driver.source, rider.source, output_file)
-        DP2, dp2_length = self.shortest_path_distance(rider.source, rider.destination, output_file)
-        DP3, dp3_length = self.shortest_path_distance(rider.destination, driver.destination, output_file)
+    def calculate_deviated_path(self, driver, rider, trace):
+        # Table lookups into the one-to-many Dijkstra results (see DistanceEngine.precompute)
+        dp1_length = self.path_cache.distance(driver.source, rider.source)
+        dp2_length = self.path_cache.distance(rider.source, rider.destination)
+        dp3_length = self.path_cache.distance(rider.destination, driver.destination)
 
-        DP = (dp1_length if dp1_length != float('inf') else float('inf')) + \
-             (dp2_length if dp2_length != float('inf') else float('inf')) + \
-             (dp3_length if dp3_length != float('inf') else float('inf'))
-        output_file.write(f"Deviated path for driver {driver.id} and rider {rider.id}: SP1={dp1_length}, sP2={dp2_length}, sP3={dp3_length}, Total DP(SP1+SP2+SP3)={DP}\n")
+        DP = dp1_length + dp2_length + dp3_length
+        trace.pair("Deviated path for driver {} and rider {}: SP1={}, sP2={}, sP3={}, Total DP(SP1+SP2+SP3)={}", driver.id, rider.id, dp1_length, dp2_length, dp3_length, DP)
         return DP
 
-    def update_offers(self, output_file):
-        self.offers = np.sum(self.ER, axis=0)
-        output_file.write(f"Updated offers: {self.offers}\n")
-
-    def assign_riders_to_drivers(self, drivers, riders, output_file):
-        DP_assigned = {driver.id: {'driver_path': [], 'riders': [], 'nodes': {}} for driver in drivers}
-        output_file.write(f"###################################################################\n")
-        output_file.write(f"Initial DP_assigned: {DP_assigned}\n")
-
-        while np.sum(self.offers) > 0:
-            output_file.write(f"###################################################################\n")
-            non_zero_offers = self.offers[self.offers > 0]
-            output_file.write(f"Non-zero offers: {non_zero_offers}\n")
-            if non_zero_offers.size == 0:
-                break
-
-            Min_offer = np.min(non_zero_offers)
-            Min_offer_set = np.where(self.offers == Min_offer)[0]
-            output_file.write(f"Set of riders with minimum offer {Min_offer}: {Min_offer_set+1}\n")
-
-            r_selected = Min_offer_set[0] if len(Min_offer_set) == 1 else random.choice(Min_offer_set)
-            output_file.write(f"Selected rider r{r_selected+1} with minimum offer: {Min_offer}\n")
+    def update_offers(self, trace):
+        self.offers = self.ER.column_counts()
+        trace.summary("Updated offers: {}", self.offers)
+
+    def clear_cell(self, d, r):
+        """Set ER[d][r] = 0, keeping Offer[r] and the offer queue in step."""
+        if self.ER.discard(d, r):
+            self.offers[r] -= 1
+            self.offer_queue.update(r)
+
+    def clear_rider(self, r):
+        """Set ER[*][r] = 0 and Offer[r] = 0."""
+        self.ER.clear_column(r)
+        self.offers[r] = 0
+
+    def clear_driver(self, d):
+        """Set ER[d][*] = 0, decrementing the offers of every rider d was eligible for."""
+        cols = self.ER.clear_row(d)
+        self.offers[cols] -= 1
+        for r in cols:
+            self.offer_queue.update(r)
+
+    def assign_riders_to_drivers(self, drivers, riders, trace):
+        DP_assigned = {driver.id: {'driver_path': [], 'riders': [], 'nodes': {}, 'positions': PathPositions([], {})} for driver in drivers}
+        trace.summary("###################################################################")
+        trace.summary("Initial DP_assigned: {}", DP_assigned)
+
+        # Riders keyed by offer count; offers are maintained incrementally as ER cells are cleared
+        self.offer_queue = OfferQueue(self.offers)
+        while self.offer_queue:
+            trace.iteration("###################################################################")
+            Min_offer, Min_offer_set, r_selected = self.offer_queue.pop_min()
+            trace.iteration("Set of riders with minimum offer {}: {}", Min_offer, np.array(Min_offer_set)+1)
+            trace.iteration("Selected rider r{} with minimum offer: {}", r_selected+1, Min_offer)
             
-            eligible_drivers = np.where(self.ER[:, r_selected] == 1)[0]
-            output_file.write(f"Eligible drivers for rider r{r_selected+1}: {eligible_drivers+1}\n")
+            eligible_drivers = self.ER.column(r_selected)
+            trace.iteration("Eligible drivers for rider r{}: {}", r_selected+1, eligible_drivers+1)
 
             # Use eligible_drivers to get the driver index
-            d_assigned = self.select_driver(eligible_drivers, drivers, output_file)
-            output_file.write(f"Assigned driver d{d_assigned+1} to rider r{r_selected+1}\n")
+            d_assigned = self.select_driver(eligible_drivers, drivers, trace)
+            trace.iteration("Assigned driver d{} to rider r{}", d_assigned+1, r_selected+1)
 
             driver = drivers[d_assigned]  # Assign the driver using the index
             rider = riders[r_selected]
             
             if driver.seats == 0:
-                output_file.write(f"Driver {driver.id} has no available seats. Skipping...\n")
-                self.ER[d_assigned][r_selected] = 0
-                self.update_offers(output_file)
+                trace.iteration("Driver {} has no available seats. Skipping...", driver.id)
+                self.clear_cell(d_assigned, r_selected)
                 continue
 
             if not DP_assigned[driver.id]['driver_path']:
@@ -176,36 +315,37 @@ class EligibilityRiderMatrix:
                 path, path_nodes = None, None
                 
                 if driver.threshold == 0:
-                    path, _ = self.shortest_path_distance(driver.source, driver.destination, output_file)
+                    path, _ = self.shortest_path_distance(driver.source, driver.destination, trace)
                 else:
-                    path = self.calculate_deviated_path_for_assignment(driver, rider, output_file)
+                    path = self.calculate_deviated_path_for_assignment(driver, rider, trace)
                 
                 path_nodes = self.find_nodes_within_threshold(path, radius)
-                DP_assigned[driver.id]['driver_path'] = path
-                DP_assigned[driver.id]['nodes'] = path_nodes
+                self.set_driver_path(DP_assigned, driver.id, path, path_nodes)
                 
                 if driver.threshold != 0 and radius != 0:
-                    for j, rider in enumerate(riders):
-                        if self.is_on_deviated_route(drivers[d_assigned].id, riders[j], DP_assigned, output_file):
-                            self.ER[d_assigned][j] = 1
+                    candidates = self.rider_index.on_nodes(path_nodes)
+                    for j in candidates[self.on_deviated_route(driver.id, candidates, riders, DP_assigned, trace)]:
+                        if self.ER.add(d_assigned, j):
+                            self.offers[j] += 1
+                            self.offer_queue.update(j)
                 
-                output_file.write(f"Assigned deviated path for driver {driver.id}: {path}\n")
+                trace.iteration("Assigned deviated path for driver {}: {}", driver.id, path)
             DP_assigned[driver.id]['riders'].append({
                 'rider_id': rider.id,
                 'source': rider.source,
                 'destination': rider.destination
             })
-            output_file.write(f"Updated DP_assigned for driver {driver.id}: {DP_assigned[driver.id]}\n")
+            trace.iteration("Updated DP_assigned for driver {}: {}", driver.id, DP_assigned[driver.id])
 
-            self.update_eligibility(d_assigned, r_selected, drivers, riders, DP_assigned, output_file)
+            self.update_eligibility(d_assigned, r_selected, drivers, riders, DP_assigned, trace)
 
-        output_file.write(f"Final DP_assigned: {DP_assigned}\n")
+        trace.summary("Final DP_assigned: {}", DP_assigned)
         return DP_assigned
 
 
-    def select_driver(self, eligible_drivers, drivers, output_file):
+    def select_driver(self, eligible_drivers, drivers, trace):
         if len(eligible_drivers) == 1:
-            output_file.write(f"Only one eligible driver: d{eligible_drivers[0]+1}\n")
+            trace.iteration("Only one eligible driver: d{}", eligible_drivers[0]+1)
             return eligible_drivers[0]
         else:
             max_seats = -1
@@ -217,94 +357,103 @@ class EligibilityRiderMatrix:
                 elif drivers[driver_idx].seats == max_seats:
                     drivers_with_max_seats.append(driver_idx)
             selected_driver = random.choice(drivers_with_max_seats)
-            output_file.write(f"Selected driver d{selected_driver+1} from drivers with max seats: {drivers_with_max_seats}\n")
+            trace.iteration("Selected driver d{} from drivers with max seats: {}", selected_driver+1, drivers_with_max_seats)
             return selected_driver
 
-    def calculate_deviated_path_for_assignment(self, driver, rider, output_file):
-        path_to_rider_source, _ = self.shortest_path_distance(driver.source, rider.source, output_file)
-        rider_path, _ = self.shortest_path_distance(rider.source, rider.destination, output_file)
-        path_from_rider_destination, _ = self.shortest_path_distance(rider.destination, driver.destination, output_file)
+    def calculate_deviated_path_for_assignment(self, driver, rider, trace):
+        path_to_rider_source, _ = self.shortest_path_distance(driver.source, rider.source, trace)
+        rider_path, _ = self.shortest_path_distance(rider.source, rider.destination, trace)
+        path_from_rider_destination, _ = self.shortest_path_distance(rider.destination, driver.destination, trace)
         full_path = path_to_rider_source + rider_path[1:] + path_from_rider_destination[1:]
-        output_file.write(f"Calculated deviated path for driver {driver.id} and rider {rider.id}: {full_path}\n")
+        trace.iteration("Calculated deviated path for driver {} and rider {}: {}", driver.id, rider.id, full_path)
         return full_path
     
     # Function to find nodes within threshold distance from a list of nodes in driver path
     def find_nodes_within_threshold(self, driver_path, threshold_distance):
-        nodes_within_threshold = {}
+        """{node: nearest path node} for every node within `threshold_distance` of the path.
 
-        for node in driver_path:
-            # Use Dijkstra's algorithm to find nodes within the threshold distance
-            lengths = nx.single_source_dijkstra_path_length(self.graph_manager.graph, node, cutoff=threshold_distance)
+        A single multi-source Dijkstra seeded with all path nodes; ties go to the
+        node that comes first on the path.
+        """
+        nearest = self.distance_engine.nearest_within(driver_path, threshold_distance)
+        return {node: path_node for node, (path_node, _) in nearest.items()}
 
-            # Add nodes to the result dictionary without redundant checks
-            for target_node, _ in lengths.items():
-                # If target_node is not already present, or you want to handle multiple sources, adjust here
-                if target_node not in nodes_within_threshold:
-                    nodes_within_threshold[target_node] = node
-                else:
-                    l1 = lengths[target_node]
-                    l2 = nx.shortest_path_length(self.graph_manager.graph, source=nodes_within_threshold[target_node], target=target_node, weight='weight')
-                    if l1 < l2:
-                        nodes_within_threshold[target_node] = node
-
-        return nodes_within_threshold
-
-    def update_eligibility(self, d_assigned, r_selected, drivers, riders, DP_assigned, output_file):
-        output_file.write(f"Updating eligibility for driver d{d_assigned+1} and rider r{r_selected+1}\n")
-        for rj in range(len(riders)):
-            if self.ER[d_assigned][rj] == 1:
-                if not self.is_on_deviated_route(drivers[d_assigned].id, riders[rj], DP_assigned, output_file):
-                    self.ER[d_assigned][rj] = 0
-
-        for d in range(len(drivers)):
-            self.ER[d][r_selected] = 0
+    def update_eligibility(self, d_assigned, r_selected, drivers, riders, DP_assigned, trace):
+        trace.iteration("Updating eligibility for driver d{} and rider r{}", d_assigned+1, r_selected+1)
+        row = self.ER.row(d_assigned)
+        for rj in row[~self.on_deviated_route(drivers[d_assigned].id, row, riders, DP_assigned, trace)]:
+            self.clear_cell(d_assigned, rj)
+
+        self.clear_rider(r_selected)
             
-        output_file.write(f"Updated eligibility matrix(ER) for driver d{d_assigned+1}: \n{self.ER}\n")
+        trace.pair("Updated eligibility matrix(ER) for driver d{}: \n{}", d_assigned+1, self.ER)
         
         drivers[d_assigned].seats -= 1
-        output_file.write(f"Updated seats for driver d{d_assigned+1}: {drivers[d_assigned].seats}\n")
+        trace.iteration("Updated seats for driver d{}: {}", d_assigned+1, drivers[d_assigned].seats)
         if drivers[d_assigned].seats == 0:
-            self.ER[d_assigned] = np.zeros(len(riders))
-
-        self.update_offers(output_file)
+            self.clear_driver(d_assigned)
+
+    def set_driver_path(self, DP_assigned, driver_id, path, nodes):
+        """Store a driver's path, the nodes attached to it and their path positions."""
+        DP_assigned[driver_id]['driver_path'] = path
+        DP_assigned[driver_id]['nodes'] = nodes
+        DP_assigned[driver_id]['positions'] = PathPositions(path, nodes)
+
+    def on_deviated_route(self, driver_id, rider_indices, riders, DP_assigned, trace):
+        """Vectorized `is_on_deviated_route` for the riders `rider_indices`; returns a boolean array."""
+        rider_indices = np.asarray(rider_indices, dtype=np.int64)
+        on_route = DP_assigned[driver_id]['positions'].in_order(
+            self.rider_index.sources[rider_indices], self.rider_index.destinations[rider_indices])
+        if trace.enabled(PAIR):
+            for j, on in zip(rider_indices.tolist(), on_route.tolist()):
+                if on:
+                    trace.pair("Rider {} is directly on the path of driver {}", riders[j].id, driver_id)
+                else:
+                    trace.pair("Rider {} is NOT on the deviated route of driver {}", riders[j].id, driver_id)
+        return on_route
 
-    def is_on_deviated_route(self, driver_id, rider, DP_assigned, output_file):
-        driver_path = DP_assigned[driver_id]['driver_path']
-        # driver_path = [9443684664, 9443679347, 3437318417, 2614492895, 2614495600, 2614495597, 5413697903, 2614495595, 2613601278, 11330569673, 1471100885, 2613601368]
+    def is_on_deviated_route(self, driver_id, rider, DP_assigned, trace):
         nodes_of_driver_path = DP_assigned[driver_id]['nodes']
         # nodes_of_driver_path = {9443684664: 9443684664, 9443679347: 9443679347, 9443684661: 9443684664, 9443684660: 9443684664, 9443684650: 9443679347, 9443679342: 9443679347, 9443684653: 9443684664}
         
         # Check if rider's source and destination nodes exist in the driver's path (nodes)
         if rider.source not in nodes_of_driver_path or rider.destination not in nodes_of_driver_path:
-            output_file.write(f"Rider {rider.id} is NOT on the deviated route of driver {driver_id}\n")
+            trace.pair("Rider {} is NOT on the deviated route of driver {}", rider.id, driver_id)
             return False
         
-        try:
-            source_index = driver_path.index(nodes_of_driver_path[rider.source])
-            destination_index = driver_path.index(nodes_of_driver_path[rider.destination])
-        except ValueError:
-            output_file.write(f"Rider {rider.id} is NOT on the deviated route of driver {driver_id} (source or destination not found in path)\n")
+        # Path positions of the attached path nodes, i.e. driver_path.index(nodes_of_driver_path[node])
+        positions = DP_assigned[driver_id]['positions']
+        source_index = positions.get(rider.source)
+        destination_index = positions.get(rider.destination)
+        if source_index is None or destination_index is None:
+            trace.pair("Rider {} is NOT on the deviated route of driver {} (source or destination not found in path)", rider.id, driver_id)
             return False
         
         # Check if rider's source and destination nodes are directly on the driver's path
         if source_index < destination_index:
-            output_file.write(f"Rider {rider.id} is directly on the path of driver {driver_id}\n")
+            trace.pair("Rider {} is directly on the path of driver {}", rider.id, driver_id)
             return True
         
-        output_file.write(f"Rider {rider.id} is NOT on the deviated route of driver {driver_id}\n")
+        trace.pair("Rider {} is NOT on the deviated route of driver {}", rider.id, driver_id)
         return False
 
 
 class RideShareSystem:
-    def __init__(self, graph_file, driver_file, rider_file, output_file):
+    def __init__(self, graph_file, driver_file, rider_file, output_file, er_backend='dense', trace_level='off', results_dir=None):
+        # Intermediate steps go through the tracer; output_results always writes to output_file
+        self.trace = Tracer(output_file, trace_level)
+        # Directory for assignments.jsonl / metrics.json (see result_writer), or None to skip them
+        self.results_dir = results_dir
         self.graph_manager = GraphManager(graph_file)
-        self.drivers = self.load_drivers(driver_file, output_file)
-        self.riders = self.load_riders(rider_file, output_file)
-        self.eligibility_matrix = EligibilityRiderMatrix(self.graph_manager, output_file)
+        self.drivers = self.load_drivers(driver_file, self.trace)
+        self.riders, self.rider_index = self.load_riders(rider_file, self.graph_manager.graph, self.trace)
+        self.eligibility_matrix = EligibilityRiderMatrix(self.graph_manager, self.trace, er_backend=er_backend)
+        # SP/MP of every driver, reused by the matrix, driver selection and result phases
+        self.eligibility_matrix.set_path_limits(self.drivers)
         self.total_initial_seats = sum(driver.seats for driver in self.drivers)
 
     @staticmethod
-    def load_drivers(file_path, output_file):
+    def load_drivers(file_path, trace):
         drivers = []
         with open(file_path, 'r') as file:
             reader = csv.DictReader(file)
@@ -317,12 +466,13 @@ class RideShareSystem:
                     threshold=int(row['threshold'])
                 )
                 drivers.append(driver)
-        output_file.write(f"##########  Program Start  ###########\n")
-        output_file.write(f"Loaded drivers info:\n {[driver.__dict__ for driver in drivers]}\n")
+        trace.summary("##########  Program Start  ###########")
+        trace.iteration("Loaded drivers info:\n {}", [driver.__dict__ for driver in drivers])
         return drivers
 
     @staticmethod
-    def load_riders(file_path, output_file):
+    def load_riders(file_path, graph, trace):
+        """Riders in file order and their RiderIndex (graph node -> riders by pickup and by dropoff)."""
         riders = []
         with open(file_path, 'r') as file:
             reader = csv.DictReader(file)
@@ -333,13 +483,35 @@ class RideShareSystem:
                     destination=int(row['destination'])
                 )
                 riders.append(rider)
-        output_file.write(f"Loaded riders info:\n {[rider.__dict__ for rider in riders]}\n")
-        return riders
+        trace.iteration("Loaded riders info:\n {}", [rider.__dict__ for rider in riders])
+        return riders, RiderIndex(graph, riders)
 
     def run(self, output_file):
-        self.eligibility_matrix.calculate(self.drivers, self.riders, output_file)
-        DPassigned = self.eligibility_matrix.assign_riders_to_drivers(self.drivers, self.riders, output_file)
+        start_time = time.time()
+        self.eligibility_matrix.calculate(self.drivers, self.riders, self.trace, rider_index=self.rider_index)
+        eligibility_time = time.time()
+        DPassigned = self.eligibility_matrix.assign_riders_to_drivers(self.drivers, self.riders, self.trace)
+        assignment_time = time.time()
         self.output_results(DPassigned, output_file)
+        if self.results_dir is not None:
+            self.write_results(DPassigned, {
+                'eligibility_seconds': eligibility_time - start_time,
+                'assignment_seconds': assignment_time - eligibility_time,
+            })
+        self.trace.summary("Path cache statistics: {}", self.eligibility_matrix.path_cache.stats())
+
+    def write_results(self, DPassigned, timings):
+        """Per-driver records and metrics as assignments.jsonl / metrics.json in results_dir."""
+        writer = ResultWriter(self.results_dir, 'DeRide')
+        for driver in self.drivers:
+            assignment = DPassigned[driver.id]
+            writer.add_driver(driver.id, driver.seats + len(assignment['riders']),
+                              [rider['rider_id'] for rider in assignment['riders']],
+                              path=assignment['driver_path'] or None,
+                              source=driver.source, destination=driver.destination, threshold=driver.threshold,
+                              shortest_path_length=driver.sp, max_path_length=driver.mp)
+        writer.finish(len(self.riders), timings=timings,
+                      path_cache=self.eligibility_matrix.path_cache.stats())
 
     # Function to output results
     def output_results(self, DPassigned, output_file):
@@ -431,7 +603,8 @@ if __name__ == "__main__":
 
     with open(os.path.join(output_dir, 'Output.txt'), 'w') as output_file:
     
-        ride_share_system = RideShareSystem(graph_file, driver_file, rider_file, output_file)
+        # Trace level for Output.txt: 'off' (final assignment and metrics only), 'summary', 'iteration' or 'pair'
+        ride_share_system = RideShareSystem(graph_file, driver_file, rider_file, output_file, trace_level='off', results_dir=output_dir)
         ride_share_system.run(output_file)
         
     # End the timer
@@ -1,30 +1,28 @@
 import csv
-import networkx as nx
 import numpy as np
 import random
 import os
 import time
+from distance_engine import DistanceEngine
+from path_cache import PathCache, DEFAULT_MAX_BYTES
+from offer_queue import OfferQueue
+from eligibility import driver_blocks, eligibility_backend
+from node_index import RiderIndex
+from route_state import RouteState
+from tracing import Tracer
+from result_writer import ResultWriter
+from graph_csr import load_graph as load_csr_graph
 
 class GraphManager:
     def __init__(self, file_path):
-        self.graph = nx.DiGraph()
+        self.graph = None
         self.load_graph(file_path)
 
     def load_graph(self, file_path):
-        edges = self.read_graph_from_csv(file_path)
-        for edge in edges:
-            self.graph.add_edge(edge[0], edge[1], weight=edge[2])
-
-    @staticmethod
-    def read_graph_from_csv(file_path):
-        edges = []
-        with open(file_path, 'r') as file:
-            reader = csv.reader(file)
-            next(reader)  # Skip the header row if it exists
-            for row in reader:
-                node1, node2, weight = int(row[0]), int(row[1]), int(float(row[2]))  # Convert weight to integer
-                edges.append((node1, node2, weight))
-        return edges
+        # Memory-mapped binary graph bundle; the CSV is only parsed (and converted) on first use
+        graph = load_csr_graph(file_path)
+        # DeRide has always worked on edge lengths truncated to integers
+        self.graph = graph.with_weights(np.trunc(graph.weights))
 
 
 class Driver:
@@ -34,6 +32,10 @@ class Driver:
         self.destination = destination
         self.seats = seats
         self.threshold = threshold
+        # Shortest path length SP (d.s -> d.f) and maximum path length MP, set once by
+        # EligibilityRiderMatrix.set_path_limits
+        self.sp = None
+        self.mp = None
 
 
 class Rider:
@@ -44,183 +46,313 @@ class Rider:
 
 
 class EligibilityRiderMatrix:
-    def __init__(self, graph_manager, output_file):
+    def __init__(self, graph_manager, trace, path_cache_bytes=DEFAULT_MAX_BYTES, er_backend='dense'):
         self.graph_manager = graph_manager
         self.ER = None
+        # 'dense' keeps the |D| x |R| int array; 'sparse' stores only the eligible pairs;
+        # 'bitpacked' stores one bit per cell
+        self.er_backend = eligibility_backend(er_backend)
         self.offers = None
+        self.offer_queue = None
+        # One budget for the engine's search rows and the memo on top of them
+        self.distance_engine = DistanceEngine(graph_manager.graph, max_bytes=path_cache_bytes)
+        # (source, target) memo shared by the matrix phase and the assignment phase
+        self.path_cache = PathCache(self.distance_engine, max_bytes=path_cache_bytes)
         self.node_coordinates = self.get_node_coordinates()
-        output_file.write("########## Eligibility Rider(ER) Matrix initialized. ###########\n")
+        trace.summary("########## Eligibility Rider(ER) Matrix initialized. ###########")
 
     def get_node_coordinates(self):
         """Generate a dictionary mapping each node ID to its (x, y) coordinates."""
         node_coordinates = {}
-        for node in self.graph_manager.graph.nodes:
-            x = self.graph_manager.graph.nodes[node].get('x')
-            y = self.graph_manager.graph.nodes[node].get('y')
-            if x is not None and y is not None:
-                node_coordinates[node] = (x, y)
+        for node in self.graph_manager.graph.nodes():
+            xy = self.graph_manager.graph.coordinates(node)
+            if xy is not None:
+                node_coordinates[node] = xy
         return node_coordinates
     
-    def calculate(self, drivers, riders, output_file):
-        """Algorithm 1: Eligibility Matrix Calculation"""
-        output_file.write("########## Algorithm 1: Eligibility Matrix Calculation ###########\n")
+    def set_path_limits(self, drivers):
+        """Set SP and MP on every driver, with one batched forward search per driver source."""
+        sp = self.distance_engine.pair_distances([driver.source for driver in drivers], [driver.destination for driver in drivers])
+        for driver, driver_sp in zip(drivers, sp.tolist()):
+            driver.sp = driver_sp
+            driver.mp = driver.sp + (driver.threshold / 100) * driver.sp
+
+    def calculate(self, drivers, riders, trace, mode='corridor', rider_index=None):
+        """Algorithm 1: Eligibility Matrix Calculation
+
+        mode='corridor' (default) only looks at the riders inside each driver's detour
+        ellipse (see `corridor_candidates`), so the work per driver follows the size of the
+        ellipse rather than |R|; mode='vectorized' evaluates every (driver, rider) pair in one
+        broadcasted NumPy expression over precomputed distance arrays; mode='scalar' is the
+        original per-pair loop, kept as a reference/debug implementation.
+        """
+        # node -> riders index by pickup and dropoff (RideShareSystem.load_riders builds it once),
+        # set before the mode dispatch since the assignment phase reads it in every mode
+        self.rider_index = rider_index if rider_index is not None else RiderIndex(self.graph_manager.graph, riders)
+        if mode == 'scalar':
+            return self.calculate_scalar(drivers, riders, trace)
+        if mode not in ('corridor', 'vectorized'):
+            raise ValueError(f"Unknown eligibility calculation mode: {mode}")
+
+        trace.summary("########## Algorithm 1: Eligibility Matrix Calculation ({}) ###########", mode)
+
+        num_drivers = len(drivers)
+        num_riders = len(riders)
+
+        # Step 1: Initialize eligibility matrix ER of size |D| × |R| with all entries set to 0
+        self.ER = self.er_backend.empty(num_drivers, num_riders)
+        self.offers = np.zeros(num_riders, dtype=int)
+        trace.summary("Step 1: Initialized ER matrix of size {} with all entries set to 0", self.ER.shape)
+
+        driver_sources = [driver.source for driver in drivers]
+        driver_destinations = [driver.destination for driver in drivers]
+        if mode == 'vectorized':
+            # Distinct pickup/dropoff nodes become the columns of the distance arrays;
+            # rs/rf map each rider to its column.
+            pickup_nodes, rs = np.unique(np.array([rider.source for rider in riders], dtype=np.int64), return_inverse=True)
+            dropoff_nodes, rf = np.unique(np.array([rider.destination for rider in riders], dtype=np.int64), return_inverse=True)
+            pickup_nodes, dropoff_nodes = pickup_nodes.tolist(), dropoff_nodes.tolist()
+
+            # Driver rows are searched block by block in eligible_blocks; the trip lengths
+            # only need one value per rider, not a kept row per pickup
+            trip = self.distance_engine.pair_distances([rider.source for rider in riders], [rider.destination for rider in riders])
+        else:
+            # Riders are only reached through the node -> riders index of their pickups and
+            # dropoffs; trip lengths are filled in lazily, for corridor candidates only.
+            trip = np.full(num_riders, np.nan)
+
+        # Step 2: SP_i and MP_i = SP_i + (t_i/100 × SP_i) for all drivers
+        if any(driver.sp is None for driver in drivers):
+            self.set_path_limits(drivers)
+        SP = np.array([driver.sp for driver in drivers], dtype=float)
+        MP = np.array([driver.mp for driver in drivers], dtype=float)
+        t = np.array([driver.threshold for driver in drivers], dtype=float)
+        for i, driver in enumerate(drivers):
+            trace.iteration("Step 2: Driver {} (d{}): SP_{} = {}, MP_{} = {}", driver.id, i+1, i+1, SP[i], i+1, MP[i])
+
+        # Step 3: ER[i][j] = 1 iff spd(d_i.s, r_j.s) + spd(r_j.s, r_j.f) + spd(r_j.f, d_i.f) ≤ MP_i,
+        # evaluated for one block of drivers at a time
+        def eligible_blocks():
+            for lo, hi in driver_blocks(num_drivers, num_riders):
+                if mode == 'corridor':
+                    block = np.zeros((hi - lo, num_riders), dtype=bool)
+                    for i in range(lo, hi):
+                        block[i - lo, self.corridor_candidates(drivers[i], MP[i], trip, riders)] = True
+                else:
+                    D_src = self.distance_engine.distances_from(driver_sources[lo:hi], pickup_nodes)
+                    D_dst = self.distance_engine.distances_to(driver_destinations[lo:hi], dropoff_nodes)
+                    block = D_src[:, rs] + trip + D_dst[:, rf] <= MP[lo:hi, None]
+                yield block
+
+        self.ER = self.er_backend.from_blocks(num_drivers, num_riders, eligible_blocks())
+        trace.summary("Final eligibility matrix after processing all drivers:\n{}", self.ER)
+
+        # Step 4: Compute the Offer array
+        trace.summary("Step 4: Computing Offer array")
+        self.update_offers(trace)
+
+    def corridor_candidates(self, driver, max_path, trip, riders):
+        """Indices of the riders eligible for `driver` with maximum path length `max_path` (MP).
+
+        A rider can only be eligible if spd(d.s, r.s) + spd(r.f, d.f) <= MP, so its pickup
+        must lie in the forward Dijkstra ball from d.s and its dropoff in the reverse ball
+        into d.f, both cut off at MP. Riders outside either ball are rejected without looking
+        up their trip length; `trip` caches spd(r.s, r.f) per rider (NaN until needed).
+        """
+        if not np.isfinite(max_path):
+            # Driver without a route: MP is inf and every rider compares eligible, as in the vectorized mode
+            return np.arange(len(riders))
+        to_pickup = self.distance_engine.ball_from(driver.source, max_path)
+        pickups, dropoffs = self.rider_index.pickups, self.rider_index.dropoffs
+        candidates = pickups.within(to_pickup, max_path)
+        if len(candidates) == 0:
+            return candidates
+        from_dropoff = self.distance_engine.ball_to(driver.destination, max_path)
+        pf = dropoffs.node_index[candidates]
+        d_src = to_pickup[pickups.node_index[candidates]]
+        d_dst = np.where(pf >= 0, from_dropoff[pf], np.inf)
+        inside = d_src + d_dst <= max_path
+        candidates, d_src, d_dst = candidates[inside], d_src[inside], d_dst[inside]
+
+        pending = candidates[np.isnan(trip[candidates])]
+        if len(pending):
+            trip[pending] = self.distance_engine.pair_distances([riders[j].source for j in pending],
+                                                               [riders[j].destination for j in pending])
+        return candidates[d_src + trip[candidates] + d_dst <= max_path]
+
+    def calculate_scalar(self, drivers, riders, trace):
+        """Algorithm 1: Eligibility Matrix Calculation (reference per-pair loop)"""
+        trace.summary("########## Algorithm 1: Eligibility Matrix Calculation ###########")
         
         num_drivers = len(drivers)
         num_riders = len(riders)
 
         # Step 1: Initialize eligibility matrix ER of size |D| × |R| with all entries set to 0
-        self.ER = np.zeros((num_drivers, num_riders), dtype=int)
+        ER = np.zeros((num_drivers, num_riders), dtype=int)
         self.offers = np.zeros(num_riders, dtype=int)
-        output_file.write(f"Step 1: Initialized ER matrix of size {self.ER.shape} with all entries set to 0\n")
-        output_file.write(f"ER Matrix:\n {self.ER}\n")
-        output_file.write(f"Offer array: \n{self.offers}\n")
+        trace.summary("Step 1: Initialized ER matrix of size {} with all entries set to 0", ER.shape)
+        trace.summary("ER Matrix:\n {}", ER)
+        trace.summary("Offer array: \n{}", self.offers)
+
+        # One forward Dijkstra per driver source and per distinct rider source, and one
+        # reverse Dijkstra per driver destination: every spd() below is then a lookup.
+        self.distance_engine.precompute(
+            sources=[driver.source for driver in drivers] + [rider.source for rider in riders],
+            targets=[driver.destination for driver in drivers]
+        )
 
         # Step 2 & 3: For each driver, compute SP and MP, then check eligibility for each rider
         for i, driver in enumerate(drivers):
-            output_file.write(f"##### Processing Driver {driver.id} (d{i+1}): ##### \n")
+            trace.iteration("##### Processing Driver {} (d{}): ##### ", driver.id, i+1)
             
             # Step 2a: Compute shortest path distance SP_i from source to destination
-            shortest_path, sp_length = self.shortest_path_distance(driver.source, driver.destination, output_file)
-            output_file.write(f"Step 2a: Computed SP_{i+1} = {sp_length}\n")
+            shortest_path, sp_length = self.shortest_path_distance(driver.source, driver.destination, trace)
+            trace.iteration("Step 2a: Computed SP_{} = {}", i+1, sp_length)
             
             # Step 2b: Compute maximum permissible path distance MP_i = SP_i + (t_i/100 × SP_i)
             t_i = driver.threshold
             MP_i = sp_length + (t_i / 100) * sp_length
-            output_file.write(f"Step 2b: Computed MP_{i+1} = {sp_length} + ({t_i}/100 × {sp_length}) = {MP_i}\n")
+            trace.iteration("Step 2b: Computed MP_{} = {} + ({}/100 × {}) = {}", i+1, sp_length, t_i, sp_length, MP_i)
 
             # Step 3: For each rider, compute deviated path and check eligibility
             for j, rider in enumerate(riders):
-                output_file.write(f"Step 3: Checking rider {rider.id} (r{j+1}) eligibility for driver {driver.id}\n")
+                trace.pair("Step 3: Checking rider {} (r{}) eligibility for driver {}", rider.id, j+1, driver.id)
                 
                 # Step 3a: Compute deviated path distance DP = spd(d_i.s, r_j.s) + spd(r_j.s, r_j.f) + spd(r_j.f, d_i.f)
-                DP = self.calculate_deviated_path(driver, rider, output_file)
-                output_file.write(f"Computed DP for d{i+1} and r{j+1}: {DP}\n")
+                DP = self.calculate_deviated_path(driver, rider, trace)
+                trace.pair("Computed DP for d{} and r{}: {}", i+1, j+1, DP)
                 
                 # Step 3b: If DP ≤ MP_i, then set ER[i][j] = 1
                 if DP <= MP_i:
-                    self.ER[i][j] = 1
-                    output_file.write(f"DP ({DP}) ≤ MP_{i+1} ({MP_i}): Setting ER[{i+1}][{j+1}] = 1\n")
-                    output_file.write(f"Rider {rider.id} is eligible for Driver {driver.id}\n")
+                    ER[i][j] = 1
+                    trace.pair("DP ({}) ≤ MP_{} ({}): Setting ER[{}][{}] = 1", DP, i+1, MP_i, i+1, j+1)
+                    trace.pair("Rider {} is eligible for Driver {}", rider.id, driver.id)
                 else:
-                    output_file.write(f"DP ({DP}) > MP_{i+1} ({MP_i}): ER[{i+1}][{j+1}] remains 0\n")
-                    output_file.write(f"Rider {rider.id} is not eligible for Driver {driver.id}\n")
+                    trace.pair("DP ({}) > MP_{} ({}): ER[{}][{}] remains 0", DP, i+1, MP_i, i+1, j+1)
+                    trace.pair("Rider {} is not eligible for Driver {}", rider.id, driver.id)
             
-            output_file.write(f"Eligibility matrix after processing driver {driver.id}:\n {self.ER}\n")
+            trace.iteration("Eligibility matrix after processing driver {}:\n {}", driver.id, ER)
         
-        output_file.write(f"Final eligibility matrix after processing all drivers:\n{self.ER}\n")
+        trace.summary("Final eligibility matrix after processing all drivers:\n{}", ER)
+        self.ER = self.er_backend.from_blocks(num_drivers, num_riders, [ER.astype(bool)])
         
         # Step 4: Compute the Offer array
-        output_file.write("Step 4: Computing Offer array\n")
-        self.update_offers(output_file)
-
-    def shortest_path_distance(self, source, target, output_file):
-        try:
-            path = nx.shortest_path(self.graph_manager.graph, source=source, target=target, weight='weight')
-            path_length = nx.shortest_path_length(self.graph_manager.graph, source=source, target=target, weight='weight')
-            output_file.write(f"Shortest path from Source {source} to Destination {target}: {path}, Shortest Length: {path_length}\n")
-            return path, path_length
-        except nx.NetworkXNoPath:
-            output_file.write(f"No path found from {source} to {target}.\n")
+        trace.summary("Step 4: Computing Offer array")
+        self.update_offers(trace)
+
+    def shortest_path_distance(self, source, target, trace):
+        path, path_length = self.path_cache.path(source, target)
+        if path is None:
+            trace.pair("No path found from {} to {}.", source, target)
             return None, float('inf')
+        trace.pair("Shortest path from Source {} to Destination {}: {}, Shortest Length: {}", source, target, path, path_length)
+        return path, path_length
 
-    def calculate_deviated_path(self, driver, rider, output_file):
-        DP1, dp1_length = self.shortest_path_distance(driver.source, rider.source, output_file)
-        DP2, dp2_length = self.shortest_path_distance(rider.source, rider.destination, output_file)
-        DP3, dp3_length = self.shortest_path_distance(rider.destination, driver.destination, output_file)
+    def calculate_deviated_path(self, driver, rider, trace):
+        # Table lookups into the one-to-many Dijkstra results (see DistanceEngine.precompute)
+        dp1_length = self.path_cache.distance(driver.source, rider.source)
+        dp2_length = self.path_cache.distance(rider.source, rider.destination)
+        dp3_length = self.path_cache.distance(rider.destination, driver.destination)
 
-        DP = (dp1_length if dp1_length != float('inf') else float('inf')) + \
-             (dp2_length if dp2_length != float('inf') else float('inf')) + \
-             (dp3_length if dp3_length != float('inf') else float('inf'))
-        output_file.write(f"Deviated path for driver {driver.id} and rider {rider.id}: SP1={dp1_length}, sP2={dp2_length}, sP3={dp3_length}, Total DP(SP1+SP2+SP3)={DP}\n")
+        DP = dp1_length + dp2_length + dp3_length
+        trace.pair("Deviated path for driver {} and rider {}: SP1={}, sP2={}, sP3={}, Total DP(SP1+SP2+SP3)={}", driver.id, rider.id, dp1_length, dp2_length, dp3_length, DP)
         return DP
 
-    def update_offers(self, output_file):
+    def update_offers(self, trace):
         """Step 4: Compute the Offer array - sum column j in ER matrix for each rider"""
-        self.offers = np.sum(self.ER, axis=0)
-        output_file.write(f"Offer array updated: Offer[r_j] = sum_d ER[d][r_j] for all j\n")
-        output_file.write(f"Updated offers: {self.offers}\n")
-
-    def assign_riders_to_drivers(self, drivers, riders, output_file):
+        self.offers = self.ER.column_counts()
+        trace.summary("Offer array updated: Offer[r_j] = sum_d ER[d][r_j] for all j")
+        trace.summary("Updated offers: {}", self.offers)
+
+    def clear_cell(self, d, r):
+        """Set ER[d][r] = 0, keeping Offer[r] and the offer queue in step."""
+        if self.ER.discard(d, r):
+            self.offers[r] -= 1
+            self.offer_queue.update(r)
+
+    def clear_rider(self, r):
+        """Set ER[*][r] = 0 and Offer[r] = 0."""
+        self.ER.clear_column(r)
+        self.offers[r] = 0
+
+    def clear_driver(self, d):
+        """Set ER[d][*] = 0, decrementing the offers of every rider d was eligible for."""
+        cols = self.ER.clear_row(d)
+        self.offers[cols] -= 1
+        for r in cols:
+            self.offer_queue.update(r)
+
+    def assign_riders_to_drivers(self, drivers, riders, trace):
         """Algorithm 2: Maximize the Number of Assigned Riders While Minimizing Driver Load"""
-        output_file.write("########## Algorithm 2: Maximize Assigned Riders While Minimizing Driver Load ###########\n")
+        trace.summary("########## Algorithm 2: Maximize Assigned Riders While Minimizing Driver Load ###########")
         
-        DP_assigned = {driver.id: {'driver_path': [], 'riders': [], 'nodes': {}} for driver in drivers}
-        output_file.write(f"Initial DP_assigned: {DP_assigned}\n")
+        # 'route' holds the ordered pickup/dropoff stops used to evaluate insertions (RouteState)
+        DP_assigned = {driver.id: {'driver_path': [], 'riders': [],
+                                   'route': RouteState(driver.source, driver.destination, self.path_cache.distance)}
+                       for driver in drivers}
+        trace.summary("Initial DP_assigned: {}", DP_assigned)
 
         # Step 1: While sum of Offer array > 0, repeat
         step_counter = 1
-        while np.sum(self.offers) > 0:
-            output_file.write(f"###################################################################\n")
-            output_file.write(f"Algorithm 2 - Iteration {step_counter}\n")
-            output_file.write(f"Step 1: sum(Offer) = {np.sum(self.offers)} > 0, continuing...\n")
-            
-            non_zero_offers = self.offers[self.offers > 0]
-            output_file.write(f"Non-zero offers: {non_zero_offers}\n")
-            if non_zero_offers.size == 0:
-                break
-
-            # Step 2: Identify riders with fewest number of eligible drivers
-            min_offer = np.min(non_zero_offers)
-            min_offer_set = np.where(self.offers == min_offer)[0]
-            output_file.write(f"Step 2: min_offer = {min_offer}\n")
-            output_file.write(f"min_offer_set = {min_offer_set+1} (riders with minimum offers)\n")
-
-            # Step 3: Select a rider
+        # Riders keyed by offer count; offers are maintained incrementally as ER cells are cleared
+        self.offer_queue = OfferQueue(self.offers)
+        while self.offer_queue:
+            trace.iteration("###################################################################")
+            trace.iteration("Algorithm 2 - Iteration {}", step_counter)
+            trace.iteration("Step 1: Offer queue not empty, continuing...")
+
+            # Step 2 & 3: Identify riders with fewest number of eligible drivers and select one
+            min_offer, min_offer_set, r_selected = self.offer_queue.pop_min()
+            trace.iteration("Step 2: min_offer = {}", min_offer)
+            trace.iteration("min_offer_set = {} (riders with minimum offers)", np.array(min_offer_set)+1)
             if len(min_offer_set) == 1:
-                r_selected = min_offer_set[0]
-                output_file.write(f"Step 3: Only one rider in min_offer_set, selected r{r_selected+1}\n")
+                trace.iteration("Step 3: Only one rider in min_offer_set, selected r{}", r_selected+1)
             else:
-                r_selected = random.choice(min_offer_set)
-                output_file.write(f"Step 3: Randomly selected rider r{r_selected+1} from min_offer_set\n")
+                trace.iteration("Step 3: Randomly selected rider r{} from min_offer_set", r_selected+1)
             
             # Step 4: Select the driver for r_selected
-            eligible_drivers = np.where(self.ER[:, r_selected] == 1)[0]
-            output_file.write(f"Step 4: eligible_drivers for rider r{r_selected+1}: {eligible_drivers+1}\n")
+            eligible_drivers = self.ER.column(r_selected)
+            trace.iteration("Step 4: eligible_drivers for rider r{}: {}", r_selected+1, eligible_drivers+1)
             
             if len(eligible_drivers) == 0:
-                output_file.write(f"No eligible drivers for rider r{r_selected+1}. Setting ER[*][{r_selected+1}] = 0\n")
-                self.ER[:, r_selected] = 0
-                self.offers[r_selected] = 0
+                trace.iteration("No eligible drivers for rider r{}. Setting ER[*][{}] = 0", r_selected+1, r_selected+1)
+                self.clear_rider(r_selected)
                 step_counter += 1
                 continue
 
             # Step 4a-c: Driver selection with load balancing and route constraints
-            d_assigned = self.select_driver_algorithm2(eligible_drivers, drivers, riders[r_selected], DP_assigned, output_file)
+            d_assigned = self.select_driver_algorithm2(eligible_drivers, drivers, riders[r_selected], DP_assigned, trace)
             
             # Check if no feasible driver was found
             if d_assigned == -1:
-                output_file.write(f"Step 4: No feasible driver found for rider r{r_selected+1}\n")
-                output_file.write(f"Setting ER[*][{r_selected+1}] = 0 and Offer[{r_selected+1}] = 0\n")
-                self.ER[:, r_selected] = 0
-                self.offers[r_selected] = 0
+                trace.iteration("Step 4: No feasible driver found for rider r{}", r_selected+1)
+                trace.iteration("Setting ER[*][{}] = 0 and Offer[{}] = 0", r_selected+1, r_selected+1)
+                self.clear_rider(r_selected)
                 step_counter += 1
                 continue
 
-            output_file.write(f"Step 4: Assigned driver d{d_assigned+1} to rider r{r_selected+1}\n")
+            trace.iteration("Step 4: Assigned driver d{} to rider r{}", d_assigned+1, r_selected+1)
 
             driver = drivers[d_assigned]
             rider = riders[r_selected]
             
             # Check if driver has available seats
             if driver.seats == 0:
-                output_file.write(f"Driver {driver.id} has no available seats. Setting ER[{d_assigned+1}][{r_selected+1}] = 0\n")
-                self.ER[d_assigned][r_selected] = 0
-                self.update_offers(output_file)
+                trace.iteration("Driver {} has no available seats. Setting ER[{}][{}] = 0", driver.id, d_assigned+1, r_selected+1)
+                self.clear_cell(d_assigned, r_selected)
                 step_counter += 1
                 continue
 
             # Step 5: Assign r_selected to d_assigned
-            output_file.write(f"Step 5: Assigning r{r_selected+1} to d{d_assigned+1}\n")
+            trace.iteration("Step 5: Assigning r{} to d{}", r_selected+1, d_assigned+1)
             
-            # Initialize driver path if not already set
-            if not DP_assigned[driver.id]['driver_path']:
-                if driver.threshold == 0:
-                    path, _ = self.shortest_path_distance(driver.source, driver.destination, output_file)
-                else:
-                    path = self.calculate_deviated_path_for_assignment(driver, rider, output_file)
-                
-                DP_assigned[driver.id]['driver_path'] = path
-                output_file.write(f"Initialized driver path for d{d_assigned+1}: {path}\n")
+            # Insert r_selected at its cheapest position in the route and follow the updated route
+            route = DP_assigned[driver.id]['route']
+            route_length = route.insert(rider.id, rider.source, rider.destination)
+            path = self.route_path(route)
+            DP_assigned[driver.id]['driver_path'] = path
+            trace.iteration("Updated driver path for d{} (stops {}): {}", d_assigned+1, route.stops, path)
+            trace.pair("Route length of d{}: {}", d_assigned+1, route_length)
             
             # Append r_selected to DP_d_assigned
             DP_assigned[driver.id]['riders'].append({
@@ -228,53 +360,48 @@ class EligibilityRiderMatrix:
                 'source': rider.source,
                 'destination': rider.destination
             })
-            output_file.write(f"Appended r{r_selected+1} to DP_d{d_assigned+1}\n")
+            trace.iteration("Appended r{} to DP_d{}", r_selected+1, d_assigned+1)
             
             # Decrease Seats[d_assigned] by 1
             drivers[d_assigned].seats -= 1
-            output_file.write(f"Decreased seats for d{d_assigned+1}: now {drivers[d_assigned].seats} seats\n")
+            trace.iteration("Decreased seats for d{}: now {} seats", d_assigned+1, drivers[d_assigned].seats)
             
             # Set ER[*][r_selected] = 0
-            self.ER[:, r_selected] = 0
-            output_file.write(f"Set ER[*][{r_selected+1}] = 0\n")
+            self.clear_rider(r_selected)
+            trace.iteration("Set ER[*][{}] = 0", r_selected+1)
 
             # Step 6: If Seats[d_assigned] = 0, set ER[d_assigned][*] = 0
             if drivers[d_assigned].seats == 0:
-                self.ER[d_assigned] = np.zeros(len(riders))
-                output_file.write(f"Step 6: Driver d{d_assigned+1} has 0 seats. Set ER[{d_assigned+1}][*] = 0\n")
+                self.clear_driver(d_assigned)
+                trace.iteration("Step 6: Driver d{} has 0 seats. Set ER[{}][*] = 0", d_assigned+1, d_assigned+1)
 
-            # Step 7: Update the Offer array
-            output_file.write(f"Step 7: Updating Offer array\n")
-            self.update_offers(output_file)
-            
             step_counter += 1
 
-        output_file.write(f"Algorithm 2 completed. Final DP_assigned: {DP_assigned}\n")
+        trace.summary("Algorithm 2 completed. Final DP_assigned: {}", DP_assigned)
         return DP_assigned
 
 
-    def select_driver_algorithm2(self, eligible_drivers, drivers, rider, DP_assigned, output_file):
+    def select_driver_algorithm2(self, eligible_drivers, drivers, rider, DP_assigned, trace):
         """Algorithm 2, Step 4: Select driver with load balancing and route constraints"""
-        output_file.write(f"Step 4a: eligible_drivers = {eligible_drivers+1}\n")
+        trace.iteration("Step 4a: eligible_drivers = {}", eligible_drivers+1)
         
         if len(eligible_drivers) == 1:
             # Only one eligible driver, check route constraint
             d = eligible_drivers[0]
             driver = drivers[d]
             
-            # Calculate MP_d (maximum permissible path distance for driver d)
-            _, sp_length = self.shortest_path_distance(driver.source, driver.destination, output_file)
-            MP_d = sp_length + (driver.threshold / 100) * sp_length
+            # MP_d (maximum permissible path distance for driver d), computed once per run
+            MP_d = driver.mp
             
             # Simulate adding r_selected to driver's current route
-            updated_route_length = self.calculate_updated_route_length(driver, rider, DP_assigned, output_file)
-            output_file.write(f"Single driver d{d+1}: route_length={updated_route_length}, MP_d={MP_d}\n")
+            updated_route_length = self.calculate_updated_route_length(driver, rider, DP_assigned, trace)
+            trace.pair("Single driver d{}: route_length={}, MP_d={}", d+1, updated_route_length, MP_d)
             
             if updated_route_length <= MP_d:
-                output_file.write(f"Route constraint satisfied for single driver d{d+1}\n")
+                trace.iteration("Route constraint satisfied for single driver d{}", d+1)
                 return d
             else:
-                output_file.write(f"Route constraint NOT satisfied for single driver d{d+1}\n")
+                trace.iteration("Route constraint NOT satisfied for single driver d{}", d+1)
                 return -1  # No feasible driver found
         
         # Step 4b: Group eligible_drivers by their current load in ascending order
@@ -283,7 +410,7 @@ class EligibilityRiderMatrix:
             driver_id = drivers[driver_idx].id
             current_load = len(DP_assigned[driver_id]['riders'])
             driver_loads[driver_idx] = current_load
-            output_file.write(f"Driver d{driver_idx+1} has current load: {current_load}\n")
+            trace.pair("Driver d{} has current load: {}", driver_idx+1, current_load)
         
         load_groups = {}
         for driver_idx, load in driver_loads.items():
@@ -292,167 +419,84 @@ class EligibilityRiderMatrix:
             load_groups[load].append(driver_idx)
         
         sorted_loads = sorted(load_groups.keys())
-        output_file.write(f"Step 4b: Load groups: {load_groups}, sorted loads: {sorted_loads}\n")
+        trace.iteration("Step 4b: Load groups: {}, sorted loads: {}", load_groups, sorted_loads)
         
         # Step 4c: For each load group (starting from smallest load)
         for load in sorted_loads:
             L_g = load_groups[load].copy()  # Make a copy to avoid modifying original
-            output_file.write(f"Step 4c: Processing load group {load} with drivers: {[d+1 for d in L_g]}\n")
+            trace.iteration("Step 4c: Processing load group {} with drivers: {}", load, [d+1 for d in L_g])
             
             # Step 4c.i: While L_g is not empty
             while L_g:
                 # Select driver from group
                 if len(L_g) > 1:
                     d = random.choice(L_g)
-                    output_file.write(f"Step 4c.i: Randomly selected driver d{d+1} from group: {[dr+1 for dr in L_g]}\n")
+                    trace.iteration("Step 4c.i: Randomly selected driver d{} from group: {}", d+1, [dr+1 for dr in L_g])
                 else:
                     d = L_g[0]
-                    output_file.write(f"Step 4c.i: Selected only driver d{d+1} from group\n")
+                    trace.iteration("Step 4c.i: Selected only driver d{} from group", d+1)
                 
                 # Simulate adding r_selected to driver's current route
                 driver = drivers[d]
                 
-                # Calculate MP_d (maximum permissible path distance for driver d)
-                _, sp_length = self.shortest_path_distance(driver.source, driver.destination, output_file)
-                MP_d = sp_length + (driver.threshold / 100) * sp_length
+                # MP_d (maximum permissible path distance for driver d), computed once per run
+                MP_d = driver.mp
                 
-                # Use networkx to compute the updated route length
-                updated_route_length = self.calculate_updated_route_length(driver, rider, DP_assigned, output_file)
-                output_file.write(f"Driver d{d+1}: route_length={updated_route_length}, MP_d={MP_d}\n")
+                # Cheapest insertion of the rider into the current route
+                updated_route_length = self.calculate_updated_route_length(driver, rider, DP_assigned, trace)
+                trace.pair("Driver d{}: route_length={}, MP_d={}", d+1, updated_route_length, MP_d)
                 
                 # Check route constraint
                 if updated_route_length <= MP_d:
-                    output_file.write(f"Step 4c.i: Route constraint satisfied for driver d{d+1}. Assigning.\n")
+                    trace.iteration("Step 4c.i: Route constraint satisfied for driver d{}. Assigning.", d+1)
                     return d  # d_assigned = d and break out of all loops
                 else:
-                    output_file.write(f"Step 4c.i: Route constraint NOT satisfied for driver d{d+1}. Removing from group.\n")
+                    trace.iteration("Step 4c.i: Route constraint NOT satisfied for driver d{}. Removing from group.", d+1)
                     L_g.remove(d)  # Remove d from L_g and continue while-loop
         
         # If no feasible driver is found
-        output_file.write("Step 4: No feasible driver found after checking all load groups\n")
+        trace.iteration("Step 4: No feasible driver found after checking all load groups")
         return -1
     
-    def calculate_updated_route_length(self, driver, new_rider, DP_assigned, output_file):
-        """Calculate the total route length if the new rider is added to the driver's route."""
-        driver_id = driver.id
-        current_riders = DP_assigned[driver_id]['riders']
-        
-        # If no current riders, calculate the deviated path with just the new rider
-        if not current_riders:
-            if driver.threshold == 0:
-                # For threshold 0, use shortest path
-                _, route_length = self.shortest_path_distance(driver.source, driver.destination, output_file)
-            else:
-                # Calculate deviated path with new rider
-                route_length = self.calculate_deviated_path(driver, new_rider, output_file)
-            output_file.write(f"Driver d{driver.id} has no current riders. Route length with new rider: {route_length}\n")
-            return route_length
-        
-        # If there are current riders, we need to find the optimal insertion point
-        # For simplicity, we'll calculate the route that visits all pickup/dropoff points
-        all_riders = current_riders + [{
-            'rider_id': new_rider.id,
-            'source': new_rider.source,
-            'destination': new_rider.destination
-        }]
-        
-        # Create a simple route: driver_source -> all rider sources -> all rider destinations -> driver_destination
-        # This is a simplified approach; a more sophisticated algorithm would optimize the order
-        waypoints = [driver.source]
-        
-        # Add all rider sources
-        for rider_info in all_riders:
-            waypoints.append(rider_info['source'])
-        
-        # Add all rider destinations
-        for rider_info in all_riders:
-            waypoints.append(rider_info['destination'])
-        
-        # Add driver destination
-        waypoints.append(driver.destination)
-        
-        # Calculate total route length
-        total_length = 0
-        for i in range(len(waypoints) - 1):
-            try:
-                segment_length = nx.shortest_path_length(
-                    self.graph_manager.graph, 
-                    source=waypoints[i], 
-                    target=waypoints[i+1], 
-                    weight='weight'
-                )
-                total_length += segment_length
-            except nx.NetworkXNoPath:
-                output_file.write(f"No path found between {waypoints[i]} and {waypoints[i+1]}\n")
-                return float('inf')
-        
-        output_file.write(f"Driver d{driver.id} total route length with all riders: {total_length}\n")
-        return total_length
-
-    def calculate_deviated_path_for_assignment(self, driver, rider, output_file):
-        path_to_rider_source, _ = self.shortest_path_distance(driver.source, rider.source, output_file)
-        rider_path, _ = self.shortest_path_distance(rider.source, rider.destination, output_file)
-        path_from_rider_destination, _ = self.shortest_path_distance(rider.destination, driver.destination, output_file)
-        full_path = path_to_rider_source + rider_path[1:] + path_from_rider_destination[1:]
-        output_file.write(f"Calculated deviated path for driver {driver.id} and rider {rider.id}: {full_path}\n")
-        return full_path
-    
-    def update_eligibility(self, d_assigned, r_selected, drivers, riders, DP_assigned, output_file):
-        output_file.write(f"Updating eligibility for driver d{d_assigned+1} and rider r{r_selected+1}\n")
-        for rj in range(len(riders)):
-            if self.ER[d_assigned][rj] == 1:
-                if not self.is_on_deviated_route(drivers[d_assigned].id, riders[rj], DP_assigned, output_file):
-                    self.ER[d_assigned][rj] = 0
-
-        for d in range(len(drivers)):
-            self.ER[d][r_selected] = 0
-            
-        output_file.write(f"Updated eligibility matrix(ER) for driver d{d_assigned+1}: \n{self.ER}\n")
-        
-        drivers[d_assigned].seats -= 1
-        output_file.write(f"Updated seats for driver d{d_assigned+1}: {drivers[d_assigned].seats}\n")
-        if drivers[d_assigned].seats == 0:
-            self.ER[d_assigned] = np.zeros(len(riders))
-
-        self.update_offers(output_file)
-
-    def is_on_deviated_route(self, driver_id, rider, DP_assigned, output_file):
-        driver_path = DP_assigned[driver_id]['driver_path']
-        # driver_path = [9443684664, 9443679347, 3437318417, 2614492895, 2614495600, 2614495597, 5413697903, 2614495595, 2613601278, 11330569673, 1471100885, 2613601368]
-        nodes_of_driver_path = DP_assigned[driver_id]['nodes']
-        # nodes_of_driver_path = {9443684664: 9443684664, 9443679347: 9443679347, 9443684661: 9443684664, 9443684660: 9443684664, 9443684650: 9443679347, 9443679342: 9443679347, 9443684653: 9443684664}
-        
-        # Check if rider's source and destination nodes exist in the driver's path (nodes)
-        if rider.source not in nodes_of_driver_path or rider.destination not in nodes_of_driver_path:
-            output_file.write(f"Rider {rider.id} is NOT on the deviated route of driver {driver_id}\n")
-            return False
-        
-        try:
-            source_index = driver_path.index(nodes_of_driver_path[rider.source])
-            destination_index = driver_path.index(nodes_of_driver_path[rider.destination])
-        except ValueError:
-            output_file.write(f"Rider {rider.id} is NOT on the deviated route of driver {driver_id} (source or destination not found in path)\n")
-            return False
-        
-        # Check if rider's source and destination nodes are directly on the driver's path
-        if source_index < destination_index:
-            output_file.write(f"Rider {rider.id} is directly on the path of driver {driver_id}\n")
-            return True
-        
-        output_file.write(f"Rider {rider.id} is NOT on the deviated route of driver {driver_id}\n")
-        return False
+    def calculate_updated_route_length(self, driver, new_rider, DP_assigned, trace):
+        """Calculate the total route length if the new rider is added to the driver's route.
+
+        The new pickup and dropoff are placed at their cheapest positions among the
+        driver's current stops (RouteState.best_insertion); the existing stops keep
+        their order.
+        """
+        route = DP_assigned[driver.id]['route']
+        route_length, i, j = route.best_insertion(new_rider.source, new_rider.destination)
+        trace.pair("Driver d{}: cheapest insertion of rider {} puts the pickup after stop {} and the dropoff after stop {} of {}, route length: {}",
+                   driver.id, new_rider.id, i, j, len(route), route_length)
+        return route_length
+
+    def route_path(self, route):
+        """Node sequence of a RouteState route: the shortest paths of its legs joined together."""
+        nodes = route.nodes()
+        path = [nodes[0]]
+        for source, target in zip(nodes, nodes[1:]):
+            leg_path, _ = self.path_cache.path(source, target)
+            path += leg_path[1:]
+        return path
 
 
 class RideShareSystem:
-    def __init__(self, graph_file, driver_file, rider_file, output_file):
+    def __init__(self, graph_file, driver_file, rider_file, output_file, er_backend='dense', trace_level='off', results_dir=None):
+        # Intermediate steps go through the tracer; output_results always writes to output_file
+        self.trace = Tracer(output_file, trace_level)
+        # Directory for assignments.jsonl / metrics.json (see result_writer), or None to skip them
+        self.results_dir = results_dir
         self.graph_manager = GraphManager(graph_file)
-        self.drivers = self.load_drivers(driver_file, output_file)
-        self.riders = self.load_riders(rider_file, output_file)
-        self.eligibility_matrix = EligibilityRiderMatrix(self.graph_manager, output_file)
+        self.drivers = self.load_drivers(driver_file, self.trace)
+        self.riders, self.rider_index = self.load_riders(rider_file, self.graph_manager.graph, self.trace)
+        self.eligibility_matrix = EligibilityRiderMatrix(self.graph_manager, self.trace, er_backend=er_backend)
+        # SP/MP of every driver, reused by the matrix, driver selection and result phases
+        self.eligibility_matrix.set_path_limits(self.drivers)
         self.total_initial_seats = sum(driver.seats for driver in self.drivers)
 
     @staticmethod
-    def load_drivers(file_path, output_file):
+    def load_drivers(file_path, trace):
         drivers = []
         with open(file_path, 'r') as file:
             reader = csv.DictReader(file)
@@ -465,12 +509,13 @@ class RideShareSystem:
                     threshold=int(row['threshold'])
                 )
                 drivers.append(driver)
-        output_file.write(f"##########  Program Start  ###########\n")
-        output_file.write(f"Loaded drivers info:\n {[driver.__dict__ for driver in drivers]}\n")
+        trace.summary("##########  Program Start  ###########")
+        trace.iteration("Loaded drivers info:\n {}", [driver.__dict__ for driver in drivers])
         return drivers
 
     @staticmethod
-    def load_riders(file_path, output_file):
+    def load_riders(file_path, graph, trace):
+        """Riders in file order and their RiderIndex (graph node -> riders by pickup and by dropoff)."""
         riders = []
         with open(file_path, 'r') as file:
             reader = csv.DictReader(file)
@@ -481,13 +526,37 @@ class RideShareSystem:
                     destination=int(row['destination'])
                 )
                 riders.append(rider)
-        output_file.write(f"Loaded riders info:\n {[rider.__dict__ for rider in riders]}\n")
-        return riders
+        trace.iteration("Loaded riders info:\n {}", [rider.__dict__ for rider in riders])
+        return riders, RiderIndex(graph, riders)
 
     def run(self, output_file):
-        self.eligibility_matrix.calculate(self.drivers, self.riders, output_file)
-        DPassigned = self.eligibility_matrix.assign_riders_to_drivers(self.drivers, self.riders, output_file)
+        start_time = time.time()
+        self.eligibility_matrix.calculate(self.drivers, self.riders, self.trace, rider_index=self.rider_index)
+        eligibility_time = time.time()
+        DPassigned = self.eligibility_matrix.assign_riders_to_drivers(self.drivers, self.riders, self.trace)
+        assignment_time = time.time()
         self.output_results(DPassigned, output_file)
+        if self.results_dir is not None:
+            self.write_results(DPassigned, {
+                'eligibility_seconds': eligibility_time - start_time,
+                'assignment_seconds': assignment_time - eligibility_time,
+            })
+        self.trace.summary("Path cache statistics: {}", self.eligibility_matrix.path_cache.stats())
+
+    def write_results(self, DPassigned, timings):
+        """Per-driver records and metrics as assignments.jsonl / metrics.json in results_dir."""
+        writer = ResultWriter(self.results_dir, 'DeRideFair')
+        for driver in self.drivers:
+            assignment = DPassigned[driver.id]
+            writer.add_driver(driver.id, driver.seats + len(assignment['riders']),
+                              [rider['rider_id'] for rider in assignment['riders']],
+                              path=assignment['driver_path'] or None,
+                              source=driver.source, destination=driver.destination, threshold=driver.threshold,
+                              shortest_path_length=driver.sp, max_path_length=driver.mp,
+                              stops=[[node, rider_id, kind] for node, rider_id, kind in assignment['route'].stops],
+                              route_length=assignment['route'].length)
+        writer.finish(len(self.riders), timings=timings,
+                      path_cache=self.eligibility_matrix.path_cache.stats())
 
     # Function to output results
     def output_results(self, DPassigned, output_file):
@@ -579,7 +648,8 @@ if __name__ == "__main__":
 
     with open(os.path.join(output_dir, 'Output.txt'), 'w') as output_file:
     
-        ride_share_system = RideShareSystem(graph_file, driver_file, rider_file, output_file)
+        # Trace level for Output.txt: 'off' (final assignment and metrics only), 'summary', 'iteration' or 'pair'
+        ride_share_system = RideShareSystem(graph_file, driver_file, rider_file, output_file, trace_level='off', results_dir=output_dir)
         ride_share_system.run(output_file)
         
     # End the timer
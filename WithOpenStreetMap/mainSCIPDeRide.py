@@ -1,159 +1,167 @@
 import os
 import time
-import pandas as pd
-import networkx as nx
 from pyscipopt import Model, quicksum
+from distance_engine import DistanceEngine
+from result_writer import write_solver_results
+from solver_common import (load_data, prepare_data, eligible_pairs, pair_index, greedy_assignment, add_greedy_start,
+                           eligibility_components, map_components)
 
-# Step 1: Load data
-def load_data(drivers_file, riders_file, graph_file):
-    drivers_df = pd.read_csv(drivers_file)
-    riders_df = pd.read_csv(riders_file)
-    graph_df = pd.read_csv(graph_file)
-    return drivers_df, riders_df, graph_df
-
-# Step 2: Prepare drivers and riders data
-def prepare_data(drivers_df, riders_df):
-    drivers = []
-    for _, row in drivers_df.iterrows():
-        drivers.append({
-            'id': row['id'],
-            'source': row['source'],
-            'destination': row['destination'],
-            'seats': row['seats'],
-            'threshold': row['threshold']
-        })
-
-    riders = [{'id': row['id'], 'source': row['source'], 'destination': row['destination']} for _, row in riders_df.iterrows()]
-    return drivers, riders
-
-# Step 3: Build graph from graph_df
-def build_graph(graph_df):
-    G = nx.DiGraph()
-    for _, row in graph_df.iterrows():
-        G.add_edge(row['source'], row['destination'], weight=row['weight'])
-    return G
-
-# Step 4: Define optimization model
-def define_model(G, drivers, riders):
+# Steps 1-2 (load_data, prepare_data) are shared with the other solver scripts in solver_common
+
+# Step 3: Define optimization model
+def define_model(distances, drivers, riders, pairs=None):
     num_drivers = len(drivers)
     num_riders = len(riders)
     model = Model("rideshare_optimization")
 
-    # Define decision variables
+    # Decision variables only for the eligible pairs, whose deviated path length is within
+    # the driver's maximum allowed distance; every other assignment simply does not exist
+    if pairs is None:
+        pairs = eligible_pairs(distances, drivers, riders)
+    riders_of, drivers_of = pair_index(pairs)
     I = {}
-    for i in range(num_drivers):
-        for j in range(num_riders):
-            I[i, j] = model.addVar(vtype="B", name=f"I_{i}_{j}")  # Binary variable
+    for i, j in pairs:
+        I[i, j] = model.addVar(vtype="B", name=f"I_{i}_{j}")  # Binary variable
 
     # Objective - Maximize the number of riders assigned to drivers
-    model.setObjective(
-        quicksum(I[i, j] for i in range(num_drivers) for j in range(num_riders)), "maximize"
-    )
-
-    # Constraint for each driver to ensure the deviated path length does not exceed the maximum allowed distance
-    for i, driver in enumerate(drivers):
-        max_distance = nx.shortest_path_length(G, source=driver['source'], target=driver['destination'], weight='weight') * (1 + driver['threshold'] / 100)
-        for j, rider in enumerate(riders):
-            if nx.has_path(G, driver['source'], rider['source']) and nx.has_path(G, rider['source'], rider['destination']) and nx.has_path(G, rider['destination'], driver['destination']):
-                deviated_path_length = (nx.shortest_path_length(G, source=driver['source'], target=rider['source'], weight='weight') +
-                                        nx.shortest_path_length(G, source=rider['source'], target=rider['destination'], weight='weight') +
-                                        nx.shortest_path_length(G, source=rider['destination'], target=driver['destination'], weight='weight'))
-                model.addCons(I[i, j] * deviated_path_length <= max_distance, f"deviated_path_driver_{i}_rider_{j}")
+    model.setObjective(quicksum(I.values()), "maximize")
 
     # Unique Assignment Constraint for each rider
     for j in range(num_riders):
-        model.addCons(
-            quicksum(I[i, j] for i in range(num_drivers)) <= 1, f"unique_assignment_rider_{j}"
-        )
+        if drivers_of[j]:
+            model.addCons(
+                quicksum(I[i, j] for i in drivers_of[j]) <= 1, f"unique_assignment_rider_{j}"
+            )
 
     # Car Capacity Constraint for each driver
     for i, driver in enumerate(drivers):
-        model.addCons(
-            quicksum(I[i, j] for j in range(num_riders)) <= driver['seats'], f"car_capacity_driver_{i}"
-        )
+        if riders_of[i]:
+            model.addCons(
+                quicksum(I[i, j] for j in riders_of[i]) <= driver['seats'], f"car_capacity_driver_{i}"
+            )
 
     return model, I
 
-# Step 5: Solve model and display results
-def solve_model(model, I, drivers, riders, output_file_path):
+# Step 4: Solve model and display results
+def solve_model(model, I, drivers, riders, output_file):
     model.optimize()
-    with open(output_file_path, "a") as f:  # append mode to preserve previous logs
-        if model.getStatus() == "optimal":
-            f.write(f"Objective value (max riders accommodated): {model.getObjVal()}\n")
-            accommodated_riders = 0
-            driver_loads = [0 for _ in range(len(drivers))]
-            for i in range(len(drivers)):
-                for j in range(len(riders)):
-                    if model.getVal(I[i, j]) > 0.5:
-                        f.write(f"Rider {riders[j]['id']} assigned to Driver {drivers[i]['id']}\n")
-                        accommodated_riders += 1
-                        driver_loads[i] += 1
-            f.write(f"Number of accommodated riders: {accommodated_riders}\n")
-
-            # --- Fairness Metrics ---
-            if driver_loads:
-                mean_load = sum(driver_loads) / len(driver_loads)
-                actual_variance = sum((load - mean_load) ** 2 for load in driver_loads) / len(driver_loads)
-                actual_stddev = actual_variance ** 0.5  # Standard deviation
-                min_load_actual = min(driver_loads)
-                max_load_actual = max(driver_loads)
-                load_spread = max_load_actual - min_load_actual
-                fairness_ratio = min_load_actual / max_load_actual if max_load_actual > 0 else 1
-
-                fairness_metrics = "\n--- Fairness Metrics ---\n"
-                fairness_metrics += f"Actual calculated standard deviation: {actual_stddev:.6f}\n"
-                fairness_metrics += f"Load spread (max - min): {load_spread}\n"
-                fairness_metrics += f"Fairness ratio (min/max): {fairness_ratio:.3f}\n"
-                f.write(fairness_metrics)
-                print(fairness_metrics, end='')
-
-                interpretation = "\n--- Interpretation ---\n"
-                if accommodated_riders > 0.7 * len(riders):
-                    interpretation += "Excellent balance between efficiency and fairness\n"
-                elif accommodated_riders > 0.5 * len(riders):
-                    interpretation += "Good balance between efficiency and fairness\n"
-                elif accommodated_riders > 0.3 * len(riders):
-                    interpretation += "Moderate balance, some trade-offs evident\n"
-                else:
-                    interpretation += "Significant trade-offs, difficult to optimize both objectives\n"
-                f.write(interpretation)
-                print(interpretation, end='')
-
-            # --- Stats Summary ---
-            stats = "\n" + "="*80 + "\n"
-            stats += "\n=== ANALYSIS SUMMARY ===\n"
-            stats += f"Method: Single Objective (Max Riders)\n"
-            stats += f"Drivers: {len(drivers)}\n"
-            stats += f"Riders: {len(riders)}\n"
-            stats += f"Assignments made: {accommodated_riders}\n"
-            stats += f"Variance: {actual_variance:.6f}\n"
-            stats += f"Standard deviation: {actual_stddev:.6f}\n"
-            stats += f"Load spread (max - min): {load_spread}\n"
-            stats += f"Fairness ratio (min/max): {fairness_ratio:.3f}\n"
-            f.write(stats)
-            print(stats, end='')
-
-            # Print rider assignments
-            rider_assignments = []
-            for j in range(len(riders)):
-                assigned_driver = None
-                for i in range(len(drivers)):
-                    if model.getVal(I[i, j]) > 0.5:
-                        assigned_driver = drivers[i]['id']
-                        break
-                rider_assignments.append((riders[j]['id'], assigned_driver))
-            print("\nRider assignments:")
-            for rider_id, driver_id in rider_assignments:
-                print(f"  Rider {rider_id} assigned to Driver {driver_id if driver_id is not None else 'None'}")
-
-            # Print driver filled seats
-            print("\nDriver filled seats:")
-            for i, driver in enumerate(drivers):
-                print(f"  Driver {driver['id']} filled seats: {driver_loads[i]}")
+    if model.getStatus() == "optimal":
+        assignments = [(i, j) for (i, j), var in I.items() if model.getVal(var) > 0.5]
+        write_report(assignments, model.getObjVal(), drivers, riders, output_file)
+    else:
+        output_file.write("No feasible solution found.\n")
+        print("No feasible solution found.\n", end='')
+
+# Write the assignment (driver index, rider index) pairs of a solution with its fairness metrics
+def write_report(assignments, objective, drivers, riders, output_file):
+    output_file.write(f"Objective value (max riders accommodated): {objective}\n")
+    accommodated_riders = 0
+    driver_loads = [0 for _ in range(len(drivers))]
+    for i, j in sorted(assignments):
+        output_file.write(f"Rider {riders[j]['id']} assigned to Driver {drivers[i]['id']}\n")
+        accommodated_riders += 1
+        driver_loads[i] += 1
+    output_file.write(f"Number of accommodated riders: {accommodated_riders}\n")
+
+    # --- Fairness Metrics ---
+    if driver_loads:
+        mean_load = sum(driver_loads) / len(driver_loads)
+        actual_variance = sum((load - mean_load) ** 2 for load in driver_loads) / len(driver_loads)
+        actual_stddev = actual_variance ** 0.5  # Standard deviation
+        min_load_actual = min(driver_loads)
+        max_load_actual = max(driver_loads)
+        load_spread = max_load_actual - min_load_actual
+        fairness_ratio = min_load_actual / max_load_actual if max_load_actual > 0 else 1
 
+        fairness_metrics = "\n--- Fairness Metrics ---\n"
+        fairness_metrics += f"Actual calculated standard deviation: {actual_stddev:.6f}\n"
+        fairness_metrics += f"Load spread (max - min): {load_spread}\n"
+        fairness_metrics += f"Fairness ratio (min/max): {fairness_ratio:.3f}\n"
+        output_file.write(fairness_metrics)
+        print(fairness_metrics, end='')
+
+        interpretation = "\n--- Interpretation ---\n"
+        if accommodated_riders > 0.7 * len(riders):
+            interpretation += "Excellent balance between efficiency and fairness\n"
+        elif accommodated_riders > 0.5 * len(riders):
+            interpretation += "Good balance between efficiency and fairness\n"
+        elif accommodated_riders > 0.3 * len(riders):
+            interpretation += "Moderate balance, some trade-offs evident\n"
         else:
-            f.write("No feasible solution found.\n")
-            print("No feasible solution found.\n", end='')
+            interpretation += "Significant trade-offs, difficult to optimize both objectives\n"
+        output_file.write(interpretation)
+        print(interpretation, end='')
+
+    # --- Stats Summary ---
+    stats = "\n" + "="*80 + "\n"
+    stats += "\n=== ANALYSIS SUMMARY ===\n"
+    stats += f"Method: Single Objective (Max Riders)\n"
+    stats += f"Drivers: {len(drivers)}\n"
+    stats += f"Riders: {len(riders)}\n"
+    stats += f"Assignments made: {accommodated_riders}\n"
+    stats += f"Variance: {actual_variance:.6f}\n"
+    stats += f"Standard deviation: {actual_stddev:.6f}\n"
+    stats += f"Load spread (max - min): {load_spread}\n"
+    stats += f"Fairness ratio (min/max): {fairness_ratio:.3f}\n"
+    output_file.write(stats)
+    print(stats, end='')
+
+    # Print rider assignments
+    assigned_to = {j: drivers[i]['id'] for i, j in assignments}
+    rider_assignments = [(rider['id'], assigned_to.get(j)) for j, rider in enumerate(riders)]
+    print("\nRider assignments:")
+    for rider_id, driver_id in rider_assignments:
+        print(f"  Rider {rider_id} assigned to Driver {driver_id if driver_id is not None else 'None'}")
+
+    # Print driver filled seats
+    print("\nDriver filled seats:")
+    for i, driver in enumerate(drivers):
+        print(f"  Driver {driver['id']} filled seats: {driver_loads[i]}")
+
+# Step 4b: Solve every connected component of the eligibility graph as its own model
+def solve_component(drivers, riders, pairs, start=None, quiet=False):
+    """Solve one component (local indices); module-level so that a process pool can run it.
+
+    `quiet` hides SCIP's log, for components solved side by side in worker processes.
+    """
+    model, I = define_model(None, drivers, riders, pairs)
+    if quiet:
+        model.hideOutput()
+    # Whether SCIP accepted the component's share of the greedy start (None without one)
+    start_accepted = add_greedy_start(model, I, start)[1] if start is not None else None
+    model.optimize()
+    status = model.getStatus()
+    return {
+        'status': status,
+        'objective': model.getObjVal() if status == "optimal" else None,
+        'assignments': [(i, j) for (i, j), var in I.items() if model.getVal(var) > 0.5] if status == "optimal" else [],
+        'solve_seconds': model.getSolvingTime(),
+        'nodes': model.getNNodes(),
+        'start_accepted': start_accepted,
+    }
+
+def solve_decomposed(drivers, riders, pairs, start_assignment=None, processes=None):
+    """
+    No eligible pair links two connected components of the bipartite driver-rider
+    eligibility graph, and max riders is a sum over drivers, so solving every
+    component separately and merging the assignments gives an optimum of the whole
+    model. Returns (assignments in global indices, objective, per-component stats).
+    """
+    components = eligibility_components(pairs, len(drivers), len(riders))
+    # Interleaved logs of parallel workers are unreadable; the sequential path keeps SCIP's output
+    quiet = processes is not None and processes > 1
+    tasks = [([drivers[i] for i in component.drivers], [riders[j] for j in component.riders], component.pairs,
+              component.localize(start_assignment) if start_assignment is not None else None, quiet)
+             for component in components]
+    results = map_components(solve_component, tasks, processes)
+    assignments = []
+    stats = []
+    for component, result in zip(components, results):
+        assignments.extend(component.globalize(result['assignments']))
+        stats.append({'drivers': len(component.drivers), 'riders': len(component.riders), 'pairs': len(component.pairs),
+                      **{key: value for key, value in result.items() if key != 'assignments'}})
+    optimal = all(result['status'] == "optimal" for result in results)
+    return assignments, len(assignments) if optimal else None, stats
 
 # Run the main function if the script is executed directly
 if __name__ == "__main__":
@@ -191,14 +199,13 @@ if __name__ == "__main__":
         output_file.write(loading_text)
         print(loading_text, end='')
         
-        drivers_df, riders_df, graph_df = load_data(drivers_file, riders_file, graph_file)
+        drivers_df, riders_df, G = load_data(drivers_file, riders_file, graph_file)
         
         # Prepare drivers and riders data
-        drivers, riders = prepare_data(drivers_df, riders_df)
+        distances = DistanceEngine(G)
+        drivers, riders = prepare_data(drivers_df, riders_df, distances)
         data_info = f"   Drivers: {len(drivers)}, Riders: {len(riders)}\n"
         
-        # Build the graph
-        G = build_graph(graph_df)
         graph_info = f"   Graph nodes: {G.number_of_nodes()}, edges: {G.number_of_edges()}\n"
         
         info_text = data_info + graph_info
@@ -209,13 +216,63 @@ if __name__ == "__main__":
         step_text = "\n🛠️  Defining optimization model...\n"
         output_file.write(step_text)
         print(step_text, end='')
-        model, I = define_model(G, drivers, riders)
-        
+        pairs = eligible_pairs(distances, drivers, riders)
+
+        # MIP start from a greedy assignment: None (cold start), 'DeRide' or 'DeRideFair'
+        greedy_start = None
+        # Solve each connected component of the eligibility graph as its own model (True) or one model (False)
+        decompose = False
+        # Worker processes for the components: None or 1 solves them one after another
+        processes = None
+
+        start_info = None
+        start_assignment = None
+        if greedy_start is not None:
+            start_assignment = greedy_assignment(greedy_start, graph_file, drivers_file, riders_file)
+            start_info = {'method': greedy_start, 'riders': len(start_assignment)}
+            start_text = f"   {greedy_start} greedy start: {len(start_assignment)} riders assigned\n"
+            output_file.write(start_text)
+            print(start_text, end='')
+
         # Solve the model and save results
         solving_text = "\n🚦 Solving model and saving results...\n"
         output_file.write(solving_text)
         print(solving_text, end='')
-        solve_model(model, I, drivers, riders, output_file_path)
+        if decompose:
+            # Wall-clock time: the per-component solve times overlap when processes > 1
+            solve_start = time.time()
+            assignments, objective, component_stats = solve_decomposed(drivers, riders, pairs, start_assignment, processes)
+            solve_seconds = time.time() - solve_start
+            if start_info is not None:
+                # Number of components that accepted their share of the start (None without components)
+                start_info['components'] = len(component_stats)
+                start_info['accepted_components'] = (sum(1 for stat in component_stats if stat['start_accepted'])
+                                                     if component_stats else None)
+            components_text = (f"   {len(component_stats)} independent components, largest: "
+                               f"{component_stats[0]['drivers'] if component_stats else 0} drivers / "
+                               f"{component_stats[0]['riders'] if component_stats else 0} riders\n")
+            output_file.write(components_text)
+            print(components_text, end='')
+            if objective is not None:
+                write_report(assignments, objective, drivers, riders, output_file)
+            else:
+                output_file.write("No feasible solution found.\n")
+                print("No feasible solution found.\n", end='')
+        else:
+            model, I = define_model(distances, drivers, riders, pairs)
+            if start_assignment is not None:
+                start_info['accepted'] = add_greedy_start(model, I, start_assignment)[1]
+            solve_model(model, I, drivers, riders, output_file)
+            component_stats = None
+            objective = model.getObjVal() if model.getStatus() == "optimal" else None
+            assignments = [(i, j) for (i, j), var in I.items() if model.getVal(var) > 0.5] if objective is not None else []
+            solve_seconds = model.getSolvingTime()
+
+        # assignments.jsonl / metrics.json next to Output.txt
+        if objective is not None:
+            write_solver_results(output_dir, 'SCIPDeRide', drivers, riders, assignments,
+                                 timings={'solve_seconds': solve_seconds, 'total_seconds': time.time() - start_time},
+                                 objective=objective, greedy_start=start_info, components=component_stats)
         
         # End the timer and print execution time
         end_time = time.time()
@@ -1,37 +1,12 @@
 import os
 import time
-import pandas as pd
-import networkx as nx
 from pyscipopt import Model, quicksum
 import numpy as np
+from distance_engine import DistanceEngine
+from result_writer import write_solver_results
+from solver_common import load_data, prepare_data, eligible_pairs, pair_index, greedy_assignment, add_greedy_start, incumbent, solve_phase, format_phase
 
-def load_data(drivers_file, riders_file, graph_file):
-    drivers_df = pd.read_csv(drivers_file)
-    riders_df = pd.read_csv(riders_file)
-    graph_df = pd.read_csv(graph_file)
-    return drivers_df, riders_df, graph_df
-
-def prepare_data(drivers_df, riders_df):
-    drivers = []
-    for _, row in drivers_df.iterrows():
-        drivers.append({
-            'id': row['id'],
-            'source': row['source'],
-            'destination': row['destination'],
-            'seats': int(row['seats']),
-            'threshold': float(row.get('threshold', 0.0))
-        })
-    riders = [{'id': row['id'], 'source': row['source'], 'destination': row['destination']} for _, row in riders_df.iterrows()]
-    return drivers, riders
-
-def build_graph(graph_df):
-    G = nx.DiGraph()
-    for _, row in graph_df.iterrows():
-        # expects columns: source, destination, weight
-        G.add_edge(row['source'], row['destination'], weight=float(row['weight']))
-    return G
-
-def define_model_maxmin_fairness(G, drivers, riders):
+def define_model_maxmin_fairness(distances, drivers, riders):
     """
     Classical max-min fairness:
       Phase 1 objective: maximize z  subject to z <= load_i for all drivers
@@ -42,11 +17,13 @@ def define_model_maxmin_fairness(G, drivers, riders):
     num_riders = len(riders)
     model = Model("rideshare_maxmin_fairness")
 
-    # Binary assignment variables x[i,j]
+    # Binary assignment variables x[i,j], only for the eligible pairs (all three subpaths
+    # exist and the deviated path length is within max_distance); other pairs cannot be assigned
+    pairs = eligible_pairs(distances, drivers, riders, abs_tol=1e-9)
+    riders_of, drivers_of = pair_index(pairs)
     x = {}
-    for i in range(num_drivers):
-        for j in range(num_riders):
-            x[i, j] = model.addVar(vtype="B", name=f"x_{i}_{j}")
+    for i, j in pairs:
+        x[i, j] = model.addVar(vtype="B", name=f"x_{i}_{j}")
 
     # Loads
     load = {}
@@ -56,9 +33,9 @@ def define_model_maxmin_fairness(G, drivers, riders):
     # Minimum load variable (z)
     z = model.addVar(vtype="I", name="min_load", lb=0, ub=num_riders)
 
-    # Load definitions
+    # Load definitions (drivers without eligible riders get load 0)
     for i in range(num_drivers):
-        model.addCons(load[i] == quicksum(x[i, j] for j in range(num_riders)), f"load_def_{i}")
+        model.addCons(load[i] == quicksum(x[i, j] for j in riders_of[i]), f"load_def_{i}")
 
     # z <= load[i] for all drivers (so z is the minimum)
     for i in range(num_drivers):
@@ -66,45 +43,13 @@ def define_model_maxmin_fairness(G, drivers, riders):
 
     # Each rider at most once
     for j in range(num_riders):
-        model.addCons(quicksum(x[i, j] for i in range(num_drivers)) <= 1, f"unique_assign_{j}")
+        if drivers_of[j]:
+            model.addCons(quicksum(x[i, j] for i in drivers_of[j]) <= 1, f"unique_assign_{j}")
 
     # Capacity constraints
     for i, driver in enumerate(drivers):
-        model.addCons(quicksum(x[i, j] for j in range(num_riders)) <= driver['seats'], f"capacity_{i}")
-
-    # Feasibility constraints: deviated path length <= allowed max_distance
-    for i, driver in enumerate(drivers):
-        # skip driver if driver route not connected in graph
-        if not (nx.has_path(G, driver['source'], driver['destination'])):
-            # This driver cannot serve anyone; leave constraints as they are (loads will be zero)
-            continue
-        try:
-            base_route_len = nx.shortest_path_length(G, source=driver['source'], target=driver['destination'], weight='weight')
-        except nx.NetworkXNoPath:
-            continue
-
-        max_distance = base_route_len * (1.0 + driver['threshold'] / 100.0)
-
-        for j, rider in enumerate(riders):
-            # require that the three subpaths exist
-            if (nx.has_path(G, driver['source'], rider['source'])
-                and nx.has_path(G, rider['source'], rider['destination'])
-                and nx.has_path(G, rider['destination'], driver['destination'])):
-                deviated_path_length = (
-                    nx.shortest_path_length(G, source=driver['source'], target=rider['source'], weight='weight')
-                    + nx.shortest_path_length(G, source=rider['source'], target=rider['destination'], weight='weight')
-                    + nx.shortest_path_length(G, source=rider['destination'], target=driver['destination'], weight='weight')
-                )
-                # If deviated path is longer than max_distance, prevent assignment by setting x[i,j] == 0
-                if deviated_path_length > max_distance + 1e-9:
-                    # Force x[i,j] == 0
-                    model.addCons(x[i, j] == 0, f"feas_zero_driver_{i}_rider_{j}")
-                else:
-                    # Otherwise no extra constraint required (assignment allowed)
-                    pass
-            else:
-                # Missing path(s): forbid assignment
-                model.addCons(x[i, j] == 0, f"feas_no_path_driver_{i}_rider_{j}")
+        if riders_of[i]:
+            model.addCons(quicksum(x[i, j] for j in riders_of[i]) <= driver['seats'], f"capacity_{i}")
 
     # Phase 1 objective: maximize z
     model.setObjective(z, "maximize")
@@ -113,7 +58,9 @@ def define_model_maxmin_fairness(G, drivers, riders):
 
 def solve_two_phase_maxmin(model, x, load, z, drivers, riders, output_file):
     # --- Phase 1: maximize z (max-min fairness) ---
-    model.optimize()
+    phases = [solve_phase(model, "phase 1: max min load")]
+    output_file.write(format_phase(phases[-1]) + "\n")
+    print(format_phase(phases[-1]))
     status = model.getStatus()
     if status != "optimal":
         output_file.write("Phase 1: No optimal solution found (status: {}).\n".format(status))
@@ -129,19 +76,21 @@ def solve_two_phase_maxmin(model, x, load, z, drivers, riders, output_file):
     output_file.write("Phase 1 load per driver: " + ", ".join(f"{drivers[i]['id']}:{phase1_loads[i]}" for i in range(len(drivers))) + "\n")
 
     # --- Phase 2: Tie-breaker maximize total riders subject to z >= z_opt ---
+    # The phase-1 optimum stays feasible under z >= z_opt and warm-starts phase 2
+    start = incumbent(model)
     # Reset model to allow new constraints/objective
     model.freeTransform()  # <-- Add this line
     # Add constraint enforcing z >= z_opt (so we keep same fairness level)
     model.addCons(z >= z_opt, "fix_min_load_to_opt")
 
     # Now set new objective to maximize total assigned riders
-    num_drivers = len(drivers)
-    num_riders = len(riders)
-    total_riders_expr = quicksum(x[i, j] for i in range(num_drivers) for j in range(num_riders))
+    total_riders_expr = quicksum(x.values())
     model.setObjective(total_riders_expr, "maximize")
 
     # Re-optimize
-    model.optimize()
+    phases.append(solve_phase(model, "phase 2: max riders", start))
+    output_file.write(format_phase(phases[-1]) + "\n")
+    print(format_phase(phases[-1]))
     status2 = model.getStatus()
     if status2 != "optimal":
         output_file.write("Phase 2: No optimal solution found (status: {}).\n".format(status2))
@@ -166,14 +115,10 @@ def solve_two_phase_maxmin(model, x, load, z, drivers, riders, output_file):
 
     # Assignments detail
     output_file.write("\nAssignments:\n")
-    assigned_count = 0
+    assigned_to = {j: drivers[i]['id'] for (i, j), var in x.items() if model.getVal(var) > 0.5}
+    assigned_count = len(assigned_to)
     for j, rider in enumerate(riders):
-        assigned_driver = None
-        for i in range(len(drivers)):
-            if model.getVal(x[i, j]) > 0.5:
-                assigned_driver = drivers[i]['id']
-                assigned_count += 1
-                break
+        assigned_driver = assigned_to.get(j)
         output_file.write(f" Rider {rider['id']} -> Driver {assigned_driver if assigned_driver is not None else 'None'}\n")
         
     output_file.write("\nDriver loads:\n")
@@ -192,7 +137,8 @@ def solve_two_phase_maxmin(model, x, load, z, drivers, riders, output_file):
     return {
         'min_load': final_z,
         'total_riders': final_total_riders,
-        'loads': final_loads
+        'loads': final_loads,
+        'phases': phases
     }
 
 if __name__ == "__main__":
@@ -215,16 +161,25 @@ if __name__ == "__main__":
         print(header)
 
         # Load and prepare
-        drivers_df, riders_df, graph_df = load_data(drivers_file, riders_file, graph_file)
-        drivers, riders = prepare_data(drivers_df, riders_df)
-        G = build_graph(graph_df)
+        drivers_df, riders_df, G = load_data(drivers_file, riders_file, graph_file)
+        distances = DistanceEngine(G)
+        drivers, riders = prepare_data(drivers_df, riders_df, distances)
 
         info = f"Drivers: {len(drivers)}, Riders: {len(riders)}, Graph nodes: {G.number_of_nodes()}, edges: {G.number_of_edges()}\n"
         output_file.write(info)
         print(info)
 
         # Build model
-        model, x, load, z = define_model_maxmin_fairness(G, drivers, riders)
+        model, x, load, z = define_model_maxmin_fairness(distances, drivers, riders)
+
+        # MIP start from a greedy assignment: None (cold start), 'DeRide' or 'DeRideFair'
+        greedy_start = None
+        start_info = None
+        if greedy_start is not None:
+            used, accepted = add_greedy_start(model, x, greedy_assignment(greedy_start, graph_file, drivers_file, riders_file))
+            start_info = {'method': greedy_start, 'riders': used, 'accepted': accepted}
+            output_file.write(f"{greedy_start} greedy start: {used} riders assigned (accepted: {accepted})\n")
+            print(f"{greedy_start} greedy start: {used} riders assigned (accepted: {accepted})")
 
         # Solve two-phase (max-min then maximize riders)
         result = solve_two_phase_maxmin(model, x, load, z, drivers, riders, output_file)
@@ -263,6 +218,13 @@ if __name__ == "__main__":
 
         end_time = time.time()
         output_file.write(f"\nTotal execution time: {end_time - start_time:.4f} sec\n")
+
+        # assignments.jsonl / metrics.json next to Output.txt
+        assignments = [(i, j) for (i, j), var in x.items() if model.getVal(var) > 0.5]
+        write_solver_results(output_dir, 'SCIPDeRideFairMM2Phase', drivers, riders, assignments,
+                             timings={'solve_seconds': sum(phase['solve_seconds'] for phase in result['phases']),
+                                      'total_seconds': end_time - start_time},
+                             min_load_z=result['min_load'], phases=result['phases'], greedy_start=start_info)
         print(f"\nTotal execution time: {end_time - start_time:.4f} sec\n")
 
     print(f"Output written to: {output_file_path}")
@@ -1,43 +1,22 @@
 #!/usr/bin/env python3
 import os
 import time
-import pandas as pd
-import networkx as nx
 from pyscipopt import Model, quicksum
 import numpy as np
+from distance_engine import DistanceEngine
+from result_writer import write_solver_results
+from solver_common import load_data, prepare_data, eligible_pairs, pair_index, greedy_assignment, add_greedy_start, incumbent, solve_phase, format_phase
 
-def load_data(drivers_file, riders_file, graph_file):
-    drivers_df = pd.read_csv(drivers_file)
-    riders_df = pd.read_csv(riders_file)
-    graph_df = pd.read_csv(graph_file)
-    return drivers_df, riders_df, graph_df
-
-def prepare_data(drivers_df, riders_df):
-    drivers = []
-    for _, row in drivers_df.iterrows():
-        drivers.append({
-            'id': row['id'],
-            'source': row['source'],
-            'destination': row['destination'],
-            'seats': int(row['seats']),
-            'threshold': float(row.get('threshold', 0.0))
-        })
-    riders = [{'id': row['id'], 'source': row['source'], 'destination': row['destination']} for _, row in riders_df.iterrows()]
-    return drivers, riders
-
-def build_graph(graph_df):
-    G = nx.DiGraph()
-    for _, row in graph_df.iterrows():
-        # expects columns: source, destination, weight
-        G.add_edge(row['source'], row['destination'], weight=float(row['weight']))
-    return G
-
-def define_model_with_ys(G, drivers, riders, R_upperbound=None):
+def define_model_with_ys(distances, drivers, riders, R_upperbound=None, formulation='compact'):
     """
     Build model with:
       - binary assignment vars x[i,j]
       - integer load vars load[i]
       - binary y[i,t] for t=1..R (y[i,t] == 1 <=> load[i] >= t)
+    formulation selects how y is linked to load:
+      - 'compact': y[i,t] only for t <= min(R, seats_i, eligible riders of i),
+        y[i,t] >= y[i,t+1] and load[i] == sum_t y[i,t] (no big-M, tight LP relaxation)
+      - 'bigm': y[i,t] for every t=1..R, two-sided big-M links with M = num_riders
     Returns model, x, load, y, and values for num_drivers and num_riders.
     """
     num_drivers = len(drivers)
@@ -46,59 +25,32 @@ def define_model_with_ys(G, drivers, riders, R_upperbound=None):
     # Optional: quiet output
     # model.hideOutput()
 
-    # Binary assignment variables x[i,j]
+    # Binary assignment variables x[i,j], only for the eligible pairs: all three subpaths exist
+    # and the detour is within max_distance (relative tolerance against floating point artifacts)
+    pairs = eligible_pairs(distances, drivers, riders, rel_tol=1e-6)
+    riders_of, drivers_of = pair_index(pairs)
     x = {}
-    for i in range(num_drivers):
-        for j in range(num_riders):
-            x[i, j] = model.addVar(vtype="B", name=f"x_{i}_{j}")
+    for i, j in pairs:
+        x[i, j] = model.addVar(vtype="B", name=f"x_{i}_{j}")
 
     # Loads (integer)
     load = {}
     for i in range(num_drivers):
-        load[i] = model.addVar(vtype="I", name=f"load_{i}", lb=0, ub=num_riders)
+        load[i] = model.addVar(vtype="I", name=f"load_{i}", lb=0, ub=min(num_riders, drivers[i]['seats']))
 
-    # Load definitions
+    # Load definitions (drivers without eligible riders get load 0)
     for i in range(num_drivers):
-        model.addCons(load[i] == quicksum(x[i, j] for j in range(num_riders)), f"load_def_{i}")
+        model.addCons(load[i] == quicksum(x[i, j] for j in riders_of[i]), f"load_def_{i}")
 
     # Each rider at most once
     for j in range(num_riders):
-        model.addCons(quicksum(x[i, j] for i in range(num_drivers)) <= 1, f"unique_assign_{j}")
+        if drivers_of[j]:
+            model.addCons(quicksum(x[i, j] for i in drivers_of[j]) <= 1, f"unique_assign_{j}")
 
     # Capacity constraints
     for i, driver in enumerate(drivers):
-        model.addCons(quicksum(x[i, j] for j in range(num_riders)) <= driver['seats'], f"capacity_{i}")
-
-    # Feasibility constraints: driver->rider->driver path lengths within threshold
-    for i, driver in enumerate(drivers):
-        # If no path on base route, this driver can't serve anyone (loads remain 0)
-        if not (nx.has_path(G, driver['source'], driver['destination'])):
-            continue
-        try:
-            base_route_len = nx.shortest_path_length(G, source=driver['source'], target=driver['destination'], weight='weight')
-        except nx.NetworkXNoPath:
-            continue
-
-        max_distance = base_route_len * (1.0 + driver['threshold'] / 100.0)
-
-        for j, rider in enumerate(riders):
-            # require that the three subpaths exist
-            if (nx.has_path(G, driver['source'], rider['source'])
-                and nx.has_path(G, rider['source'], rider['destination'])
-                and nx.has_path(G, rider['destination'], driver['destination'])):
-                deviated_path_length = (
-                    nx.shortest_path_length(G, source=driver['source'], target=rider['source'], weight='weight')
-                    + nx.shortest_path_length(G, source=rider['source'], target=rider['destination'], weight='weight')
-                    + nx.shortest_path_length(G, source=rider['destination'], target=driver['destination'], weight='weight')
-                )
-                # use a relative tolerance to avoid floating point artifacts
-                tol = 1e-6 * max(1.0, max_distance)
-                if deviated_path_length - max_distance > tol:
-                    # forbid assignment if the detour exceeds allowed max
-                    model.addCons(x[i, j] == 0, f"feas_zero_driver_{i}_rider_{j}")
-            else:
-                # missing path(s): forbid assignment
-                model.addCons(x[i, j] == 0, f"feas_no_path_driver_{i}_rider_{j}")
+        if riders_of[i]:
+            model.addCons(quicksum(x[i, j] for j in riders_of[i]) <= driver['seats'], f"capacity_{i}")
 
     # Determine R (max threshold for y). If provided, use it, else compute from data:
     if R_upperbound is None:
@@ -107,18 +59,32 @@ def define_model_with_ys(G, drivers, riders, R_upperbound=None):
     else:
         R = min(num_riders, R_upperbound)
 
-    # Create y[i,t] variables and link to load using a tight formulation:
     y = {}
-    M = num_riders  # safe big-M: no driver load can exceed num_riders
-    for i in range(num_drivers):
-        for t in range(1, R + 1):
-            y[i, t] = model.addVar(vtype="B", name=f"y_{i}_{t}")
-            # Enforce: y[i,t] == 1 <=> load[i] >= t
-            # Correct linearization (both directions):
-            #   load[i] >= t * y[i,t]
-            #   load[i] <= (t-1) + M * y[i,t]
-            model.addCons(load[i] >= t * y[i, t], f"link_low_{i}_{t}")
-            model.addCons(load[i] <= (t - 1) + M * y[i, t], f"link_high_{i}_{t}")
+    if formulation == 'compact':
+        # A driver's load never exceeds its seats or its eligible riders, so y[i,t] only
+        # exists up to that level; missing y[i,t] are 0. With the ordering the ones form a
+        # prefix, hence y[i,t] == 1 <=> load[i] >= t.
+        for i, driver in enumerate(drivers):
+            levels = min(R, driver['seats'], len(riders_of[i]))
+            for t in range(1, levels + 1):
+                y[i, t] = model.addVar(vtype="B", name=f"y_{i}_{t}")
+                if t > 1:
+                    model.addCons(y[i, t - 1] >= y[i, t], f"y_order_{i}_{t}")
+            model.addCons(load[i] == quicksum(y[i, t] for t in range(1, levels + 1)), f"load_levels_{i}")
+    elif formulation == 'bigm':
+        # Create y[i,t] variables and link to load using a big-M formulation:
+        M = num_riders  # safe big-M: no driver load can exceed num_riders
+        for i in range(num_drivers):
+            for t in range(1, R + 1):
+                y[i, t] = model.addVar(vtype="B", name=f"y_{i}_{t}")
+                # Enforce: y[i,t] == 1 <=> load[i] >= t
+                # Correct linearization (both directions):
+                #   load[i] >= t * y[i,t]
+                #   load[i] <= (t-1) + M * y[i,t]
+                model.addCons(load[i] >= t * y[i, t], f"link_low_{i}_{t}")
+                model.addCons(load[i] <= (t - 1) + M * y[i, t], f"link_high_{i}_{t}")
+    else:
+        raise ValueError(f"unknown formulation {formulation!r}, expected 'compact' or 'bigm'")
 
     return model, x, load, y, num_drivers, num_riders, R
 
@@ -127,20 +93,27 @@ def solve_lexicographic(model, x, load, y, drivers, riders, R, output_file, maxi
     Iterative lexicographic max-min:
       For t=1..R maximize S_t = sum_i y[i,t], fix S_t to opt, repeat.
     Optionally maximize total assigned riders as final tie-breaker.
-    Returns dict with loads, total_riders, min_load, S_vals.
+    Every phase is warm-started from the previous phase's incumbent, which stays
+    feasible once S_t is fixed to its optimum.
+    Returns dict with loads, total_riders, min_load, S_vals and per-phase statistics.
     """
 
     num_drivers = len(drivers)
     num_riders = len(riders)
     S_vals = {}
+    phases = []
+    start = None
 
     # Iteratively optimize for each threshold t (1..R)
     for t in range(1, R + 1):
-        St_expr = quicksum(y[i, t] for i in range(num_drivers))
+        # Drivers without a y[i,t] (compact formulation) can never reach load t
+        St_expr = quicksum(y[i, t] for i in range(num_drivers) if (i, t) in y)
         model.freeTransform()  # <-- Add this before setting objective or adding constraints
         model.setObjective(St_expr, "maximize")
 
-        model.optimize()
+        phases.append(solve_phase(model, f"t={t}", start))
+        output_file.write(format_phase(phases[-1]) + "\n")
+        print(format_phase(phases[-1]))
         status = model.getStatus()
         if status != "optimal":
             output_file.write(f"Lexicographic phase t={t}: No optimal solution found (status: {status}). Stopping further lexicographic steps.\n")
@@ -152,18 +125,21 @@ def solve_lexicographic(model, x, load, y, drivers, riders, R, output_file, maxi
         output_file.write(f"Phase t={t}: max number of drivers with load >= {t} is {S_t_opt}\n")
         print(f"Phase t={t}: max number of drivers with load >= {t} is {S_t_opt}")
 
+        start = incumbent(model)
         model.freeTransform()  # <-- Add this before adding the constraint below
-        model.addCons(quicksum(y[i, t] for i in range(num_drivers)) == S_t_opt, f"fix_St_{t}")
+        model.addCons(quicksum(y[i, t] for i in range(num_drivers) if (i, t) in y) == S_t_opt, f"fix_St_{t}")
 
         # NOTE: no short-circuit here — continue lexicographic refinement up to R
         # (If you want the old short-circuit, add it back intentionally.)
 
     # Optional final efficiency tie-breaker: maximize total riders while keeping lexicographic constraints fixed
     if maximize_total_after:
-        total_riders_expr = quicksum(x[i, j] for i in range(num_drivers) for j in range(num_riders))
+        total_riders_expr = quicksum(x.values())
         model.freeTransform()
         model.setObjective(total_riders_expr, "maximize")
-        model.optimize()
+        phases.append(solve_phase(model, "max riders", start))
+        output_file.write(format_phase(phases[-1]) + "\n")
+        print(format_phase(phases[-1]))
         status2 = model.getStatus()
         if status2 != "optimal":
             output_file.write(f"Final tie-breaker (maximize total riders): No optimal solution (status: {status2}).\n")
@@ -176,7 +152,7 @@ def solve_lexicographic(model, x, load, y, drivers, riders, R, output_file, maxi
     # After optimization, check status before extracting solution
     if model.getStatus() in ["optimal", "feasible"]:
         final_loads = [int(round(model.getVal(load[i]))) for i in range(num_drivers)]
-        final_total_riders = int(round(sum(model.getVal(x[i, j]) for i in range(num_drivers) for j in range(num_riders))))
+        final_total_riders = int(round(sum(model.getVal(var) for var in x.values())))
         final_min_load = min(final_loads) if final_loads else 0
 
         # Write per-driver loads to output file
@@ -196,7 +172,8 @@ def solve_lexicographic(model, x, load, y, drivers, riders, R, output_file, maxi
         'loads': final_loads,
         'total_riders': final_total_riders,
         'min_load': final_min_load,
-        'S_vals': S_vals
+        'S_vals': S_vals,
+        'phases': phases
     }
 
 if __name__ == "__main__":
@@ -219,9 +196,9 @@ if __name__ == "__main__":
         print(header)
 
         # Load and prepare
-        drivers_df, riders_df, graph_df = load_data(drivers_file, riders_file, graph_file)
-        drivers, riders = prepare_data(drivers_df, riders_df)
-        G = build_graph(graph_df)
+        drivers_df, riders_df, G = load_data(drivers_file, riders_file, graph_file)
+        distances = DistanceEngine(G)
+        drivers, riders = prepare_data(drivers_df, riders_df, distances)
 
         info = f"Drivers: {len(drivers)}, Riders: {len(riders)}, Graph nodes: {G.number_of_nodes()}, edges: {G.number_of_edges()}\n"
         output_file.write(info)
@@ -234,7 +211,19 @@ if __name__ == "__main__":
         print(f"Using R_upperbound = {R_upperbound} (min(num_riders, max_seats)).")
 
         # Build model with y variables for lexicographic optimization
-        model, x, load, y, num_drivers, num_riders, R = define_model_with_ys(G, drivers, riders, R_upperbound=R_upperbound)
+        # Load-threshold formulation of y: 'compact' (ordered y, load == sum_t y) or 'bigm' (original links)
+        formulation = 'compact'
+        model, x, load, y, num_drivers, num_riders, R = define_model_with_ys(distances, drivers, riders, R_upperbound=R_upperbound,
+                                                                             formulation=formulation)
+
+        # MIP start from a greedy assignment: None (cold start), 'DeRide' or 'DeRideFair'
+        greedy_start = None
+        start_info = None
+        if greedy_start is not None:
+            used, accepted = add_greedy_start(model, x, greedy_assignment(greedy_start, graph_file, drivers_file, riders_file))
+            start_info = {'method': greedy_start, 'riders': used, 'accepted': accepted}
+            output_file.write(f"{greedy_start} greedy start: {used} riders assigned (accepted: {accepted})\n")
+            print(f"{greedy_start} greedy start: {used} riders assigned (accepted: {accepted})")
 
         # Solve lexicographic max-min and then tie-break with efficiency
         result = solve_lexicographic(model, x, load, y, drivers, riders, R, output_file, maximize_total_after=True)
@@ -272,6 +261,15 @@ if __name__ == "__main__":
 
         end_time = time.time()
         output_file.write(f"\nTotal execution time: {end_time - start_time:.4f} sec\n")
+
+        # assignments.jsonl / metrics.json next to Output.txt
+        if loads:
+            assignments = [(i, j) for (i, j), var in x.items() if model.getVal(var) > 0.5]
+            write_solver_results(output_dir, 'SCIPDeRideFairMMLexico', drivers, riders, assignments,
+                                 timings={'solve_seconds': sum(phase['solve_seconds'] for phase in result['phases']),
+                                          'total_seconds': end_time - start_time},
+                                 S_vals=result['S_vals'], phases=result['phases'], greedy_start=start_info,
+                                 formulation=formulation)
         print(f"\nTotal execution time: {end_time - start_time:.4f} sec\n")
 
     print(f"Output written to: {output_file_path}")
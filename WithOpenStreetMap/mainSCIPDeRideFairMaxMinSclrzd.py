@@ -1,9 +1,10 @@
 import os
 import time
-import pandas as pd
-import networkx as nx
 from pyscipopt import Model, quicksum
 import numpy as np
+from distance_engine import DistanceEngine
+from result_writer import write_solver_results
+from solver_common import load_data, prepare_data, eligible_pairs, pair_index, greedy_assignment, add_greedy_start
 
 # NOTE:
 # Variance minimization may not strongly affect results if:
@@ -12,39 +13,30 @@ import numpy as np
 # - The max-min scalarization balances both objectives, but if the solution is already close to optimal for both, variance changes little.
 # - If most drivers have similar loads due to constraints, variance is naturally low and minimizing it further has little effect.
 
-# Step 1: Load data
-def load_data(drivers_file, riders_file, graph_file):
-    drivers_df = pd.read_csv(drivers_file)
-    riders_df = pd.read_csv(riders_file)
-    graph_df = pd.read_csv(graph_file)
-    return drivers_df, riders_df, graph_df
-
-# Step 2: Prepare drivers and riders data
-def prepare_data(drivers_df, riders_df):
-    drivers = []
-    for _, row in drivers_df.iterrows():
-        drivers.append({
-            'id': row['id'],
-            'source': row['source'],
-            'destination': row['destination'],
-            'seats': row['seats'],
-            'threshold': row['threshold']
-        })
-
-    riders = [{'id': row['id'], 'source': row['source'], 'destination': row['destination']} for _, row in riders_df.iterrows()]
-    return drivers, riders
-
-# Step 3: Build graph from graph_df
-def build_graph(graph_df):
-    G = nx.DiGraph()
-    for _, row in graph_df.iterrows():
-        G.add_edge(row['source'], row['destination'], weight=row['weight'])
-    return G
-
-# Step 4: Estimate objective bounds for min-max scalarization
-def estimate_objective_bounds(G, drivers, riders):
+# Steps 1-2 (load_data, prepare_data) are shared with the other solver scripts in solver_common
+
+# Fairness objective f2 of the scalarization. 'variance' needs the quadratic deviation_sq
+# constraints (nonconvex MINLP); the linear surrogates keep the model a pure MILP.
+FAIRNESS_MEASURES = {
+    'variance': "Variance in rider distribution",
+    'abs_deviation': "Mean absolute deviation of driver loads",
+    'range': "Load range (max - min)",
+}
+
+def fairness_value(loads, fairness):
+    """f2 of a load vector under the given fairness measure."""
+    mean_load = sum(loads) / len(loads)
+    if fairness == 'variance':
+        return sum((load - mean_load) ** 2 for load in loads) / len(loads)
+    if fairness == 'abs_deviation':
+        return sum(abs(load - mean_load) for load in loads) / len(loads)
+    return max(loads) - min(loads)
+
+# Step 3: Estimate objective bounds for min-max scalarization
+def estimate_objective_bounds(G, drivers, riders, fairness='variance'):
     """
     Estimate the minimum and maximum values for each objective to enable normalization
+    (f2 according to the fairness measure, see FAIRNESS_MEASURES)
     """
     num_drivers = len(drivers)
     num_riders = len(riders)
@@ -59,20 +51,24 @@ def estimate_objective_bounds(G, drivers, riders):
         perfect_distribution = num_riders / num_drivers
         f2_min = 0  # Perfect distribution has zero variance
         
-        # Maximum variance: all riders go to one driver
+        # Maximum variance (or deviation/range): all riders go to one driver
         worst_case_loads = [0] * (num_drivers - 1) + [num_riders]
-        mean_load = num_riders / num_drivers
-        f2_max = sum((load - mean_load) ** 2 for load in worst_case_loads) / num_drivers
+        f2_max = fairness_value(worst_case_loads, fairness)
     else:
         f2_min, f2_max = 0, 1
     
     return (f1_min, f1_max), (f2_min, f2_max)
 
-# Step 5: Define optimization model with max-min scalarization
-def define_model_maxmin_scalarization(G, drivers, riders, f1_bounds, f2_bounds):
+# Step 4: Define optimization model with max-min scalarization
+def define_model_maxmin_scalarization(distances, drivers, riders, f1_bounds, f2_bounds, fairness='variance'):
     """
     Convert multi-objective problem to single objective using max-min scalarization
     
+    f2 is the fairness measure (see FAIRNESS_MEASURES):
+      'variance':      mean of deviation_sq[i] == (load[i] - avg)^2 (quadratic)
+      'abs_deviation': mean of dev_pos[i] + dev_neg[i] with load[i] - avg == dev_pos[i] - dev_neg[i]
+      'range':         max_load - min_load with min_load <= load[i] <= max_load
+    
     Formulation:
     max_{x,t} t
     subject to:
@@ -88,11 +84,13 @@ def define_model_maxmin_scalarization(G, drivers, riders, f1_bounds, f2_bounds):
     f1_min, f1_max = f1_bounds
     f2_min, f2_max = f2_bounds
 
-    # Define decision variables x_ij
+    # Define decision variables x_ij, only for the eligible pairs whose deviated path length
+    # does not exceed the driver's maximum allowed distance
+    pairs = eligible_pairs(distances, drivers, riders)
+    riders_of, drivers_of = pair_index(pairs)
     I = {}
-    for i in range(num_drivers):
-        for j in range(num_riders):
-            I[i, j] = model.addVar(vtype="B", name=f"x_{i}_{j}")
+    for i, j in pairs:
+        I[i, j] = model.addVar(vtype="B", name=f"x_{i}_{j}")
 
     # Additional variables for objective calculations
     # Load for each driver (number of riders assigned)
@@ -100,13 +98,17 @@ def define_model_maxmin_scalarization(G, drivers, riders, f1_bounds, f2_bounds):
     for i in range(num_drivers):
         load[i] = model.addVar(vtype="I", name=f"load_{i}", lb=0, ub=num_riders)
     
+    if fairness not in FAIRNESS_MEASURES:
+        raise ValueError(f"unknown fairness measure {fairness!r}, expected one of {list(FAIRNESS_MEASURES)}")
+
     # Variables for variance calculation (Objective 2)
     avg_riders = model.addVar(vtype="C", name="avg_riders", lb=0)
     deviation = {}
     deviation_sq = {}
-    for i in range(num_drivers):
-        deviation[i] = model.addVar(vtype="C", name=f"deviation_{i}", lb=-num_riders, ub=num_riders)
-        deviation_sq[i] = model.addVar(vtype="C", name=f"deviation_sq_{i}", lb=0)
+    if fairness == 'variance':
+        for i in range(num_drivers):
+            deviation[i] = model.addVar(vtype="C", name=f"deviation_{i}", lb=-num_riders, ub=num_riders)
+            deviation_sq[i] = model.addVar(vtype="C", name=f"deviation_sq_{i}", lb=0)
 
     # Max-min scalarization variable
     t = model.addVar(vtype="C", name="t", lb=0, ub=1)
@@ -118,31 +120,48 @@ def define_model_maxmin_scalarization(G, drivers, riders, f1_bounds, f2_bounds):
     # Define load constraints
     for i in range(num_drivers):
         model.addCons(
-            load[i] == quicksum(I[i, j] for j in range(num_riders)),
+            load[i] == quicksum(I[i, j] for j in riders_of[i]),
             f"load_definition_{i}"
         )
 
     # Define the average constraint for variance calculation
     if num_drivers > 0:
         model.addCons(
-            avg_riders == quicksum(I[i, j] for i in range(num_drivers) for j in range(num_riders)) / num_drivers,
+            avg_riders == quicksum(I.values()) / num_drivers,
             "average_riders"
         )
     else:
         model.addCons(avg_riders == 0, "average_riders_zero_drivers")
 
-    # Define deviation constraints for variance calculation
-    for i in range(num_drivers):
-        model.addCons(
-            deviation[i] == load[i] - avg_riders,
-            f"deviation_driver_{i}"
-        )
-        # Quadratic equality (SCIP can handle quadratic constraints if available):
-        model.addCons(deviation_sq[i] == deviation[i] * deviation[i], f"deviation_sq_def_{i}")
-
     # Define the two objectives (as expressions)
-    f1 = quicksum(I[i, j] for i in range(num_drivers) for j in range(num_riders))
-    f2 = quicksum(deviation_sq[i] for i in range(num_drivers)) / num_drivers if num_drivers > 0 else 0
+    f1 = quicksum(I.values())
+    if fairness == 'variance':
+        # Define deviation constraints for variance calculation
+        for i in range(num_drivers):
+            model.addCons(
+                deviation[i] == load[i] - avg_riders,
+                f"deviation_driver_{i}"
+            )
+            # Quadratic equality (SCIP can handle quadratic constraints if available):
+            model.addCons(deviation_sq[i] == deviation[i] * deviation[i], f"deviation_sq_def_{i}")
+        f2 = quicksum(deviation_sq[i] for i in range(num_drivers)) / num_drivers if num_drivers > 0 else 0
+    elif fairness == 'abs_deviation':
+        # |load[i] - avg| split into its positive and negative parts; minimizing f2 keeps
+        # at most one of them nonzero, so their sum is the absolute deviation
+        dev_pos, dev_neg = {}, {}
+        for i in range(num_drivers):
+            dev_pos[i] = model.addVar(vtype="C", name=f"dev_pos_{i}", lb=0, ub=num_riders)
+            dev_neg[i] = model.addVar(vtype="C", name=f"dev_neg_{i}", lb=0, ub=num_riders)
+            model.addCons(load[i] - avg_riders == dev_pos[i] - dev_neg[i], f"abs_deviation_driver_{i}")
+        f2 = quicksum(dev_pos[i] + dev_neg[i] for i in range(num_drivers)) / num_drivers if num_drivers > 0 else 0
+    else:
+        # Load range: the tightest [min_load, max_load] interval around every load
+        min_load = model.addVar(vtype="C", name="min_load", lb=0, ub=num_riders)
+        max_load = model.addVar(vtype="C", name="max_load", lb=0, ub=num_riders)
+        for i in range(num_drivers):
+            model.addCons(min_load <= load[i], f"min_load_bound_{i}")
+            model.addCons(max_load >= load[i], f"max_load_bound_{i}")
+        f2 = max_load - min_load
 
     # Now define U1 and U2 via explicit constraints (this is the important fix)
     # U1 == normalized f1
@@ -164,37 +183,26 @@ def define_model_maxmin_scalarization(G, drivers, riders, f1_bounds, f2_bounds):
     # Objective: maximize t (which represents the minimum of the normalized utilities)
     model.setObjective(t, "maximize")
 
-    # Constraint for each driver to ensure the deviated path length does not exceed the maximum allowed distance
-    for i, driver in enumerate(drivers):
-        # protect against cases where driver source/destination not connected
-        if not (nx.has_path(G, driver['source'], driver['destination'])):
-            # If the driver itself has no path, then they cannot serve any rider — we could either skip or set max_distance to inf
-            continue
-        max_distance = nx.shortest_path_length(G, source=driver['source'], target=driver['destination'], weight='weight') * (1 + driver['threshold'] / 100.0)
-        for j, rider in enumerate(riders):
-            if nx.has_path(G, driver['source'], rider['source']) and nx.has_path(G, rider['source'], rider['destination']) and nx.has_path(G, rider['destination'], driver['destination']):
-                deviated_path_length = (nx.shortest_path_length(G, source=driver['source'], target=rider['source'], weight='weight') +
-                                        nx.shortest_path_length(G, source=rider['source'], target=rider['destination'], weight='weight') +
-                                        nx.shortest_path_length(G, source=rider['destination'], target=driver['destination'], weight='weight'))
-                model.addCons(I[i, j] * deviated_path_length <= max_distance, f"deviated_path_driver_{i}_rider_{j}")
-
     # Unique Assignment Constraint for each rider
     for j in range(num_riders):
-        model.addCons(
-            quicksum(I[i, j] for i in range(num_drivers)) <= 1, f"unique_assignment_rider_{j}"
-        )
+        if drivers_of[j]:
+            model.addCons(
+                quicksum(I[i, j] for i in drivers_of[j]) <= 1, f"unique_assignment_rider_{j}"
+            )
 
     # Car Capacity Constraint for each driver
     for i, driver in enumerate(drivers):
-        model.addCons(
-            quicksum(I[i, j] for j in range(num_riders)) <= driver['seats'], f"car_capacity_driver_{i}"
-        )
+        if riders_of[i]:
+            model.addCons(
+                quicksum(I[i, j] for j in riders_of[i]) <= driver['seats'], f"car_capacity_driver_{i}"
+            )
 
     # Return U1 and U2 (variables) instead of expression objects
     return model, I, deviation_sq, load, f1, f2, t, U1, U2
 
-# Step 6: Solve model and display results with max-min scalarization
-def solve_model_maxmin(model, I, deviation_sq, load, f1, f2, t, U1, U2, drivers, riders, f1_bounds, f2_bounds, output_file):
+# Step 5: Solve model and display results with max-min scalarization
+def solve_model_maxmin(model, I, deviation_sq, load, f1, f2, t, U1, U2, drivers, riders, f1_bounds, f2_bounds, output_file,
+                       fairness='variance'):
     model.optimize()
     if model.getStatus() == "optimal":
         output_file.write("=== MAX-MIN SCALARIZATION RESULTS ===\n")
@@ -208,7 +216,13 @@ def solve_model_maxmin(model, I, deviation_sq, load, f1, f2, t, U1, U2, drivers,
         # Calculate raw objective values
         # getVal accepts linear/quadratic expressions as well, but now we also have U1/U2 as actual variables to query
         total_riders = model.getVal(f1)
-        variance = model.getVal(f2)
+        # f2 as the solver constrained it; u2 is checked against this value
+        f2_model = model.getVal(f2)
+        f2_value = f2_model
+        if fairness != 'variance':
+            # The linear surrogates only bound f2 from above when U2 is not binding, so
+            # report the measure of the actual loads
+            f2_value = fairness_value([int(round(model.getVal(load[i]))) for i in range(len(drivers))], fairness)
         t_value = model.getVal(t)
         u1_value = model.getVal(U1)
         u2_value = model.getVal(U2)
@@ -223,13 +237,15 @@ def solve_model_maxmin(model, I, deviation_sq, load, f1, f2, t, U1, U2, drivers,
             u1_manual = 1
             
         if f2_max > f2_min:
-            u2_manual = 1 - (variance - f2_min) / (f2_max - f2_min)
+            u2_manual = 1 - (f2_model - f2_min) / (f2_max - f2_min)
         else:
             u2_manual = 1
         
         raw_objectives = f"\n--- Raw Objective Values ---\n"
         raw_objectives += f"f1(x) - Total riders accommodated: {total_riders}\n"
-        raw_objectives += f"f2(x) - Variance in rider distribution: {variance:.6f}\n"
+        raw_objectives += f"f2(x) - {FAIRNESS_MEASURES[fairness]}: {f2_value:.6f}\n"
+        if fairness != 'variance':
+            raw_objectives += f"f2 in the model (bound used for u2): {f2_model:.6f}\n"
         
         norm_utilities = f"\n--- Normalized Utility Values ---\n"
         norm_utilities += f"u1(x) = (f1-f1_min)/(f1_max-f1_min): {u1_value:.6f}\n"
@@ -256,12 +272,12 @@ def solve_model_maxmin(model, I, deviation_sq, load, f1, f2, t, U1, U2, drivers,
         assignment_count = 0
         for i in range(len(drivers)):
             driver_loads[i] = 0
-            for j in range(len(riders)):
-                if model.getVal(I[i, j]) > 0.5:
-                    assignment_line = f"Rider {riders[j]['id']} assigned to Driver {drivers[i]['id']}\n"
-                    assignment_details += assignment_line
-                    driver_loads[i] += 1
-                    assignment_count += 1
+        for (i, j), var in I.items():
+            if model.getVal(var) > 0.5:
+                assignment_line = f"Rider {riders[j]['id']} assigned to Driver {drivers[i]['id']}\n"
+                assignment_details += assignment_line
+                driver_loads[i] += 1
+                assignment_count += 1
         
         assignment_summary = f"\nTotal assignments made: {assignment_count}\n"
         assignment_details += assignment_summary
@@ -312,12 +328,9 @@ def solve_model_maxmin(model, I, deviation_sq, load, f1, f2, t, U1, U2, drivers,
         # Print rider assignments
         print("\nRider assignments:")
         output_file.write("\nRider assignments:\n")
+        assigned_to = {j: drivers[i]['id'] for (i, j), var in I.items() if model.getVal(var) > 0.5}
         for j in range(len(riders)):
-            assigned_driver = None
-            for i in range(len(drivers)):
-                if model.getVal(I[i, j]) > 0.5:
-                    assigned_driver = drivers[i]['id']
-                    break
+            assigned_driver = assigned_to.get(j)
             print(f"  Rider {riders[j]['id']} assigned to Driver {assigned_driver if assigned_driver is not None else 'None'}")
             output_file.write(f"  Rider {riders[j]['id']} assigned to Driver {assigned_driver if assigned_driver is not None else 'None'}\n")
 
@@ -328,7 +341,7 @@ def solve_model_maxmin(model, I, deviation_sq, load, f1, f2, t, U1, U2, drivers,
             print(f"  Driver {driver['id']} filled seats: {driver_loads[i]}")
             output_file.write(f"  Driver {driver['id']} filled seats: {driver_loads[i]}\n")
         
-        return total_riders, variance, t_value
+        return total_riders, f2_value, t_value
             
     else:
         error_msg = "No feasible solution found.\n"
@@ -336,14 +349,17 @@ def solve_model_maxmin(model, I, deviation_sq, load, f1, f2, t, U1, U2, drivers,
         print(error_msg, end='')
         return None, None, None
 
-# Step 7: Run exact max-min scalarization (single run since it's parameter-free)
-def run_exact_maxmin_analysis(G, drivers, riders, f1_bounds, f2_bounds, output_file):
+# Step 6: Run exact max-min scalarization (single run since it's parameter-free)
+def run_exact_maxmin_analysis(distances, drivers, riders, f1_bounds, f2_bounds, output_file, start_assignment=None,
+                              fairness='variance'):
     """
     Run exact max-min scalarization analysis
     This formulation doesn't require parameter tuning as it finds the balanced solution automatically
+    start_assignment: optional (driver index, rider index) pairs (e.g. a greedy result) offered as MIP start
+    fairness: f2 measure, see FAIRNESS_MEASURES (f2_bounds must be estimated for the same measure)
     """
     header = "=== EXACT MAX-MIN SCALARIZATION ANALYSIS ===\n\n"
-    formulation = "Formulation: max_x min{u1(x), u2(x)}\n"
+    formulation = f"Formulation: max_x min{{u1(x), u2(x)}}, f2 = {FAIRNESS_MEASURES[fairness]}\n"
     explanation = "where:\n"
     explanation += "  u1(x) = (f1(x) - f1_min)/(f1_max - f1_min)\n"
     explanation += "  u2(x) = 1 - (f2(x) - f2_min)/(f2_max - f2_min)\n"
@@ -354,20 +370,36 @@ def run_exact_maxmin_analysis(G, drivers, riders, f1_bounds, f2_bounds, output_f
     print(intro_text, end='')
     
     model, I, deviation_sq, load, f1, f2, t, U1, U2 = define_model_maxmin_scalarization(
-        G, drivers, riders, f1_bounds, f2_bounds
+        distances, drivers, riders, f1_bounds, f2_bounds, fairness
     )
+
+    start_info = None
+    if start_assignment is not None:
+        used, accepted = add_greedy_start(model, I, start_assignment)
+        start_info = {'riders': used, 'accepted': accepted}
+        start_text = f"MIP start: {used} riders assigned (accepted: {accepted})\n\n"
+        output_file.write(start_text)
+        print(start_text, end='')
     
-    riders_count, variance, t_value = solve_model_maxmin(
+    riders_count, f2_value, t_value = solve_model_maxmin(
         model, I, deviation_sq, load, f1, f2, t, U1, U2,
-        drivers, riders, f1_bounds, f2_bounds, output_file
+        drivers, riders, f1_bounds, f2_bounds, output_file, fairness
     )
     
     if riders_count is not None:
+        assignments = [(i, j) for (i, j), var in I.items() if model.getVal(var) > 0.5]
+        loads = [0] * len(drivers)
+        for i, j in assignments:
+            loads[i] += 1
         result = {
             'riders': riders_count,
-            'variance': variance,
+            'variance': f2_value if fairness == 'variance' else fairness_value(loads, 'variance'),
+            'f2': f2_value,
             't_value': t_value,
-            'method': 'Exact Max-Min Scalarization'
+            'method': 'Exact Max-Min Scalarization',
+            'assignments': assignments,
+            'solve_seconds': model.getSolvingTime(),
+            'start': start_info
         }
         
         summary = "\n" + "="*80 + "\n"
@@ -382,7 +414,7 @@ def run_exact_maxmin_analysis(G, drivers, riders, f1_bounds, f2_bounds, output_f
         f1_min, f1_max = f1_bounds
         f2_min, f2_max = f2_bounds
         efficiency_pct = (result['riders'] / f1_max * 100) if f1_max > 0 else 0
-        fairness_pct = (1 - (result['variance'] - f2_min)/(f2_max - f2_min)) * 100 if f2_max > f2_min else 100
+        fairness_pct = (1 - (result['f2'] - f2_min)/(f2_max - f2_min)) * 100 if f2_max > f2_min else 100
         
         performance = f"\nPerformance relative to bounds:\n"
         performance += f"  Efficiency: {efficiency_pct:.1f}% of maximum possible\n"
@@ -432,14 +464,13 @@ if __name__ == "__main__":
         output_file.write(loading_text)
         print(loading_text, end='')
         
-        drivers_df, riders_df, graph_df = load_data(drivers_file, riders_file, graph_file)
+        drivers_df, riders_df, G = load_data(drivers_file, riders_file, graph_file)
         
         # Prepare drivers and riders data
-        drivers, riders = prepare_data(drivers_df, riders_df)
+        distances = DistanceEngine(G)
+        drivers, riders = prepare_data(drivers_df, riders_df, distances)
         data_info = f"   Drivers: {len(drivers)}, Riders: {len(riders)}\n"
         
-        # Build the graph
-        G = build_graph(graph_df)
         graph_info = f"   Graph nodes: {G.number_of_nodes()}, edges: {G.number_of_edges()}\n"
         
         info_text = data_info + graph_info
@@ -451,18 +482,32 @@ if __name__ == "__main__":
         output_file.write(bounds_text)
         print(bounds_text, end='')
         
-        f1_bounds, f2_bounds = estimate_objective_bounds(G, drivers, riders)
+        # Fairness objective f2: 'variance' (quadratic MINLP), 'abs_deviation' or 'range' (linear MILP)
+        fairness = 'variance'
+        f1_bounds, f2_bounds = estimate_objective_bounds(G, drivers, riders, fairness)
         bounds_info = f"   f1 (riders) bounds: {f1_bounds}\n"
-        bounds_info += f"   f2 (variance) bounds: {f2_bounds}\n"
+        bounds_info += f"   f2 ({fairness}) bounds: {f2_bounds}\n"
         
         output_file.write(bounds_info)
         print(bounds_info, end='')
         
         # Run exact max-min scalarization analysis
-        result = run_exact_maxmin_analysis(G, drivers, riders, f1_bounds, f2_bounds, output_file)
+        # MIP start from a greedy assignment: None (cold start), 'DeRide' or 'DeRideFair'
+        greedy_start = None
+        start_assignment = greedy_assignment(greedy_start, graph_file, drivers_file, riders_file) if greedy_start is not None else None
+        result = run_exact_maxmin_analysis(distances, drivers, riders, f1_bounds, f2_bounds, output_file, start_assignment,
+                                           fairness)
         
         # End the timer and print execution time
         end_time = time.time()
+
+        # assignments.jsonl / metrics.json next to Output.txt
+        if result is not None:
+            write_solver_results(output_dir, 'SCIPDeRideFairMMScalar', drivers, riders, result['assignments'],
+                                 timings={'solve_seconds': result['solve_seconds'], 'total_seconds': end_time - start_time},
+                                 t_value=result['t_value'], fairness=fairness, f2=result['f2'],
+                                 f1_bounds=f1_bounds, f2_bounds=f2_bounds,
+                                 greedy_start=dict(result['start'], method=greedy_start) if result['start'] else None)
         timing_text = f"\n⏱️  Total execution time: {end_time - start_time:.4f} seconds\n"
         completion_text = "\n✅ Max-Min Scalarization Analysis Complete!\n"
         
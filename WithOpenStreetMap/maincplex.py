@@ -1,80 +1,54 @@
 import os
 import time
-import pandas as pd
 import numpy as np
 from docplex.mp.model import Model
-import networkx as nx
+from docplex.mp.solution import SolveSolution
+from distance_engine import DistanceEngine
+from solver_common import load_data, prepare_data, eligible_pairs, pair_index, greedy_assignment, start_values
 
-# Step 1: Load data
-def load_data(drivers_file, riders_file, graph_file):
-    drivers_df = pd.read_csv(drivers_file)
-    riders_df = pd.read_csv(riders_file)
-    graph_df = pd.read_csv(graph_file)
-    return drivers_df, riders_df, graph_df
+# Steps 1-2 (load_data, prepare_data) are shared with the other solver scripts in solver_common
 
-# Step 2: Prepare drivers and riders data
-def prepare_data(drivers_df, riders_df):
-    drivers = []
-    for _, row in drivers_df.iterrows():
-        drivers.append({
-            'id': row['id'],
-            'source': row['source'],
-            'destination': row['destination'],
-            'seats': row['seats'],
-            'threshold': row['threshold']
-        })
-
-    riders = [{'id': row['id'], 'source': row['source'], 'destination': row['destination']} for _, row in riders_df.iterrows()]
-    return drivers, riders
-
-# Step 3: Build graph from graph_df
-def build_graph(graph_df):
-    G = nx.DiGraph()
-    for _, row in graph_df.iterrows():
-        G.add_edge(row['source'], row['destination'], weight=row['weight'])
-    return G
-
-# Step 4: Define optimization model
-def define_model(G, drivers, riders):
+# Step 3: Define optimization model
+def define_model(distances, drivers, riders):
     num_drivers = len(drivers)
     num_riders = len(riders)
     mdl = Model(name="rideshare_optimization")
 
-    # Define decision variables
-    I = {(i, j): mdl.binary_var(name=f"I_{i}_{j}") for i in range(num_drivers) for j in range(num_riders)}
+    # Define decision variables, only for the eligible pairs whose deviated path length
+    # does not exceed the driver's maximum allowed distance
+    pairs = eligible_pairs(distances, drivers, riders)
+    riders_of, drivers_of = pair_index(pairs)
+    I = {(i, j): mdl.binary_var(name=f"I_{i}_{j}") for i, j in pairs}
 
     # Objective - Maximize the number of riders assigned to drivers
-    mdl.maximize(mdl.sum(I[i, j] for i in range(num_drivers) for j in range(num_riders)))
-
-    # Constraint for each driver to ensure the deviated path length does not exceed the maximum allowed distance
-    for i, driver in enumerate(drivers):
-        max_distance = nx.shortest_path_length(G, source=driver['source'], target=driver['destination'], weight='weight') * (1 + driver['threshold'] / 100)
-        for j, rider in enumerate(riders):
-            if nx.has_path(G, driver['source'], rider['source']) and nx.has_path(G, rider['source'], rider['destination']) and nx.has_path(G, rider['destination'], driver['destination']):
-                deviated_path_length = (nx.shortest_path_length(G, source=driver['source'], target=rider['source'], weight='weight') +
-                                        nx.shortest_path_length(G, source=rider['source'], target=rider['destination'], weight='weight') +
-                                        nx.shortest_path_length(G, source=rider['destination'], target=driver['destination'], weight='weight'))
-                mdl.add_constraint(I[i, j] * deviated_path_length <= max_distance, f"deviated_path_driver_{i}_rider_{j}")
+    mdl.maximize(mdl.sum(I.values()))
 
     # Unique Assignment Constraint for each rider
     for j in range(num_riders):
-        mdl.add_constraint(mdl.sum(I[i, j] for i in range(num_drivers)) <= 1, f"unique_assignment_rider_{j}")
+        if drivers_of[j]:
+            mdl.add_constraint(mdl.sum(I[i, j] for i in drivers_of[j]) <= 1, f"unique_assignment_rider_{j}")
 
     # Car Capacity Constraint for each driver
     for i, driver in enumerate(drivers):
-        mdl.add_constraint(mdl.sum(I[i, j] for j in range(num_riders)) <= driver['seats'], f"car_capacity_driver_{i}")
+        if riders_of[i]:
+            mdl.add_constraint(mdl.sum(I[i, j] for j in riders_of[i]) <= driver['seats'], f"car_capacity_driver_{i}")
 
     return mdl, I
 
-# Step 5: Solve model and display results
+# Offer a greedy assignment (see solver_common.greedy_assignment) as MIP start; returns the riders it assigns
+def add_greedy_mip_start(mdl, I, assignment):
+    values = start_values(I, assignment)
+    mdl.add_mip_start(SolveSolution(mdl, {I[key]: value for key, value in values.items()}))
+    return sum(values.values())
+
+# Step 4: Solve model and display results
 def solve_model(mdl, I, drivers, riders):
     solution = mdl.solve()
     if solution:
         print("Objective value (max riders accommodated):", solution.objective_value)
-        for i in range(len(drivers)):
-            for j in range(len(riders)):
-                if I[i, j].solution_value > 0.5:  # Variable is binary
-                    print(f"Rider {riders[j]['id']} assigned to Driver {drivers[i]['id']}")
+        for (i, j), var in I.items():
+            if var.solution_value > 0.5:  # Variable is binary
+                print(f"Rider {riders[j]['id']} assigned to Driver {drivers[i]['id']}")
     else:
         print("No feasible solution found.")
     
@@ -96,16 +70,21 @@ if __name__ == "__main__":
     graph_file = os.path.join(map_dir, 'graph.csv')
     
     # Load data
-    drivers_df, riders_df, graph_df = load_data(drivers_file, riders_file, graph_file)
+    drivers_df, riders_df, G = load_data(drivers_file, riders_file, graph_file)
     
     # Prepare drivers and riders data
-    drivers, riders = prepare_data(drivers_df, riders_df)
+    distances = DistanceEngine(G)
+    drivers, riders = prepare_data(drivers_df, riders_df, distances)
     
-    # Build the graph
-    G = build_graph(graph_df)
     
     # Define the optimization model
-    mdl, I = define_model(G, drivers, riders)
+    mdl, I = define_model(distances, drivers, riders)
+
+    # MIP start from a greedy assignment: None (cold start), 'DeRide' or 'DeRideFair'
+    greedy_start = None
+    if greedy_start is not None:
+        used = add_greedy_mip_start(mdl, I, greedy_assignment(greedy_start, graph_file, drivers_file, riders_file))
+        print(f"{greedy_start} greedy start: {used} riders assigned")
     
     # Solve the model and display results
     solve_model(mdl, I, drivers, riders)
@@ -0,0 +1,103 @@
+import numpy as np
+
+
+class NodeIndex:
+    """Inverted index from graph nodes to the items (riders) located at them.
+
+    Item k sits at OSM node `nodes[k]`. The index is stored in CSR form over
+    the dense node indices of a CSRGraph: the items at dense node v are
+    items[indptr[v]:indptr[v+1]], in ascending order. Items whose node is not
+    in the graph are listed in `missing`.
+    """
+
+    def __init__(self, graph, nodes):
+        self.node_index = graph.indices_of(nodes)  # dense node index of every item, -1 if missing
+        present = self.node_index >= 0
+        self.missing = np.flatnonzero(~present)
+        positions = np.flatnonzero(present)
+        self.items = positions[np.argsort(self.node_index[present], kind='stable')]
+        self.indptr = np.zeros(graph.number_of_nodes() + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.node_index[present], minlength=graph.number_of_nodes()), out=self.indptr[1:])
+
+    def __len__(self):
+        return len(self.node_index)
+
+    def at(self, node_indices):
+        """Items located at any of the dense `node_indices`, ascending."""
+        node_indices = np.asarray(node_indices, dtype=np.int64)
+        starts = self.indptr[node_indices]
+        counts = self.indptr[node_indices + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        # Concatenate the runs items[start:start+count] without a Python loop
+        offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return np.sort(self.items[offsets + np.arange(total)])
+
+    def within(self, dist, cutoff):
+        """Items whose node has dist[node] <= cutoff, for a distance array over dense node indices."""
+        return self.at(np.flatnonzero(dist <= cutoff))
+
+
+class RiderIndex:
+    """Node -> riders indexes of a rider list, by pickup (`pickups`) and by dropoff (`dropoffs`).
+
+    Built once when the riders are loaded; corridor and radius queries use it
+    to enumerate the riders near a route instead of scanning all of them.
+    """
+
+    def __init__(self, graph, riders):
+        self.graph = graph
+        self.sources = np.array([rider.source for rider in riders], dtype=np.int64)
+        self.destinations = np.array([rider.destination for rider in riders], dtype=np.int64)
+        self.pickups = NodeIndex(graph, self.sources)
+        self.dropoffs = NodeIndex(graph, self.destinations)
+
+    def __len__(self):
+        return len(self.pickups)
+
+    def on_nodes(self, nodes):
+        """Riders whose pickup and dropoff are both among the OSM node IDs `nodes`, ascending."""
+        node_indices = self.graph.indices_of(list(nodes))
+        node_indices = np.unique(node_indices[node_indices >= 0])
+        return np.intersect1d(self.pickups.at(node_indices), self.dropoffs.at(node_indices), assume_unique=True)
+
+
+class PathPositions:
+    """node -> position along a driver path, for every node attached to the path.
+
+    `nodes` maps each node near the path to the path node it is attached to
+    (see find_nodes_within_threshold); the position of a node is the index of
+    the first occurrence of that path node, exactly what driver_path.index()
+    returns. Kept as a dict for single lookups and as sorted NumPy arrays for
+    batch lookups, so "pickup before dropoff" is O(1) per rider.
+    """
+
+    def __init__(self, path, nodes):
+        first = {}
+        for position, node in enumerate(path):
+            first.setdefault(node, position)
+        self.positions = {node: first[anchor] for node, anchor in nodes.items() if anchor in first}
+        self._nodes = np.array(sorted(self.positions), dtype=np.int64)
+        self._values = np.array([self.positions[node] for node in self._nodes.tolist()], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __repr__(self):
+        return f"PathPositions({len(self.positions)} nodes)"
+
+    def get(self, node):
+        """Path position of `node`, or None if it is not attached to the path."""
+        return self.positions.get(node)
+
+    def in_order(self, sources, destinations):
+        """Boolean array: both endpoints attached to the path and the source strictly before the destination."""
+        sources = np.asarray(sources, dtype=np.int64)
+        destinations = np.asarray(destinations, dtype=np.int64)
+        if len(self._nodes) == 0:
+            return np.zeros(len(sources), dtype=bool)
+        source_idx = np.minimum(np.searchsorted(self._nodes, sources), len(self._nodes) - 1)
+        destination_idx = np.minimum(np.searchsorted(self._nodes, destinations), len(self._nodes) - 1)
+        return ((self._nodes[source_idx] == sources) & (self._nodes[destination_idx] == destinations)
+                & (self._values[source_idx] < self._values[destination_idx]))
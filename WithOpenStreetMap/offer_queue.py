@@ -0,0 +1,56 @@
+import heapq
+import random
+
+
+class OfferQueue:
+    """Indexed min-priority queue of riders keyed by their current offer count.
+
+    Backed by a binary heap of (offer, rider) entries with lazy invalidation:
+    `update` (decrease-key or increase-key) pushes a fresh entry and the stale
+    one is discarded when it reaches the top, since it no longer matches
+    `offers[rider]`. Riders with zero offers are not queued.
+    """
+
+    def __init__(self, offers):
+        self.offers = offers  # shared with EligibilityRiderMatrix.offers, updated in place by the caller
+        self._heap = [(int(offer), rider) for rider, offer in enumerate(offers) if offer > 0]
+        heapq.heapify(self._heap)
+
+    def update(self, rider):
+        """Re-key `rider` after offers[rider] changed."""
+        if self.offers[rider] > 0:
+            heapq.heappush(self._heap, (int(self.offers[rider]), rider))
+
+    def _discard_stale(self):
+        while self._heap and self._heap[0][0] != self.offers[self._heap[0][1]]:
+            heapq.heappop(self._heap)
+
+    def __bool__(self):
+        self._discard_stale()
+        return bool(self._heap)
+
+    def min_offer(self):
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else 0
+
+    def pop_min(self):
+        """Remove and return (min_offer, ties, selected rider).
+
+        `ties` lists every rider holding the minimum offer in ascending index
+        order, exactly like np.where(offers == min_offer)[0], and the selected
+        rider is drawn from it with random.choice, so the greedy consumes the
+        random stream the same way as the dense implementation. The riders
+        that were not selected stay queued.
+        """
+        self._discard_stale()
+        min_offer = self._heap[0][0]
+        ties = []
+        while self._heap and self._heap[0][0] == min_offer:
+            offer, rider = heapq.heappop(self._heap)
+            if offer == self.offers[rider] and (not ties or ties[-1] != rider):
+                ties.append(rider)
+        selected = ties[0] if len(ties) == 1 else random.choice(ties)
+        for rider in ties:
+            if rider != selected:
+                heapq.heappush(self._heap, (min_offer, rider))
+        return min_offer, ties, selected
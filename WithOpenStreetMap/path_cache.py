@@ -0,0 +1,82 @@
+from collections import OrderedDict
+
+# Rough per-entry memory cost used for the cap: key tuple, entry list and float,
+# plus one boxed int and list slot per node of a materialized path.
+ENTRY_BYTES = 200
+PATH_NODE_BYTES = 40
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class PathCache:
+    """Bounded LRU memo of (source, target) -> shortest path length and, lazily, the path.
+
+    Lengths come from the DistanceEngine table lookups; the node sequence is
+    only reconstructed the first time `path` is asked for a pair. Entries are
+    evicted least-recently-used first once the estimated size, together with
+    the search rows cached by the engine (DistanceEngine.nbytes), exceeds
+    `max_bytes`. Hit/miss counters are kept for profiling.
+    """
+
+    def __init__(self, distance_engine, max_bytes=DEFAULT_MAX_BYTES):
+        self.distance_engine = distance_engine
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (source, target) -> [length, path or None]
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.path_hits = 0
+        self.path_misses = 0
+        self.evictions = 0
+
+    def _entry(self, source, target):
+        key = (source, target)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = [self.distance_engine.distance(source, target), None]
+        self._entries[key] = entry
+        self.nbytes += ENTRY_BYTES
+        self._evict()
+        return entry
+
+    def _evict(self):
+        while self.nbytes + self.distance_engine.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, path) = self._entries.popitem(last=False)
+            self.nbytes -= ENTRY_BYTES + (len(path) * PATH_NODE_BYTES if path else 0)
+            self.evictions += 1
+
+    def distance(self, source, target):
+        """Shortest path length from `source` to `target`, or inf if unreachable."""
+        return self._entry(source, target)[0]
+
+    def path(self, source, target):
+        """(path as a list of node IDs, length), or (None, inf) if `target` is unreachable."""
+        entry = self._entry(source, target)
+        if entry[1] is None and entry[0] != float('inf'):
+            self.path_misses += 1
+            entry[1], _ = self.distance_engine.shortest_path(source, target)
+            self.nbytes += len(entry[1]) * PATH_NODE_BYTES
+            self._evict()
+        elif entry[1] is not None:
+            self.path_hits += 1
+        return entry[1], entry[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'path_hits': self.path_hits,
+            'path_misses': self.path_misses,
+            'evictions': self.evictions,
+            'engine_bytes': self.distance_engine.nbytes,
+            'engine_evictions': self.distance_engine.evictions,
+        }
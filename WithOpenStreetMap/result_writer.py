@@ -0,0 +1,117 @@
+import json
+import os
+import numpy as np
+
+ASSIGNMENTS_FILE = 'assignments.jsonl'
+METRICS_FILE = 'metrics.json'
+
+
+def _to_builtin(value):
+    """json.dumps fallback for NumPy scalars and arrays (node IDs, loads, seat counts)."""
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def gini_coefficient(loads):
+    loads = np.sort(np.asarray(loads, dtype=float))
+    n = len(loads)
+    if n == 0 or loads.sum() == 0:
+        return 0.0
+    index = np.arange(1, n + 1)
+    return float((2 * np.sum(index * loads)) / (n * loads.sum()) - (n + 1) / n)
+
+
+def load_metrics(loads, seats, num_riders):
+    """Efficiency and fairness metrics of a per-driver load vector (population variance, as in Output.txt)."""
+    loads = np.asarray(loads, dtype=int)
+    seats = np.asarray(seats, dtype=int)
+    accommodated = int(loads.sum())
+    total_seats = int(seats.sum())
+    max_load = int(loads.max()) if len(loads) else 0
+    min_load = int(loads.min()) if len(loads) else 0
+    return {
+        'drivers': len(loads),
+        'riders': num_riders,
+        'accommodated_riders': accommodated,
+        'total_seats': total_seats,
+        'utilization_rate': accommodated / total_seats if total_seats else 0.0,
+        'mean_load': float(loads.mean()) if len(loads) else 0.0,
+        'variance': float(loads.var()) if len(loads) else 0.0,
+        'std_dev': float(loads.std()) if len(loads) else 0.0,
+        'min_load': min_load,
+        'max_load': max_load,
+        'load_spread': max_load - min_load,
+        'fairness_ratio': min_load / max_load if max_load > 0 else 1.0,
+        'gini_coefficient': gini_coefficient(loads),
+        'empty_drivers': int((loads == 0).sum()),
+        'full_drivers': int(((loads == seats) & (seats > 0)).sum()),
+        'load_histogram': np.bincount(loads, minlength=max_load + 1).tolist() if len(loads) else [],
+    }
+
+
+class ResultWriter:
+    """Machine-readable results of one solver run, next to its Output.txt.
+
+    Per-driver records (assigned riders, load, seats, path) are streamed to
+    assignments.jsonl as they are added, one JSON object per line; `finish`
+    writes metrics.json with the aggregate metrics, timings and any
+    solver-specific fields. Both can be read back with read_assignments and
+    read_metrics (or pandas.read_json(..., lines=True)).
+    """
+
+    def __init__(self, results_dir, algorithm):
+        os.makedirs(results_dir, exist_ok=True)
+        self.results_dir = results_dir
+        self.algorithm = algorithm
+        self.loads = []
+        self.seats = []
+        self._file = open(os.path.join(results_dir, ASSIGNMENTS_FILE), 'w')
+
+    def add_driver(self, driver_id, seats, riders, path=None, **fields):
+        """Record one driver: `seats` is its capacity before assignment, `riders` the assigned rider IDs."""
+        record = {'algorithm': self.algorithm, 'driver_id': driver_id, 'seats': seats,
+                  'load': len(riders), 'riders': list(riders), 'path': path}
+        record.update(fields)
+        self._file.write(json.dumps(record, default=_to_builtin) + "\n")
+        self.loads.append(len(riders))
+        self.seats.append(seats)
+
+    def finish(self, num_riders, timings=None, **fields):
+        """Close assignments.jsonl and write metrics.json; returns the metrics dict."""
+        self._file.close()
+        metrics = {'algorithm': self.algorithm}
+        metrics.update(load_metrics(self.loads, self.seats, num_riders))
+        metrics['timings'] = timings or {}
+        metrics.update(fields)
+        with open(os.path.join(self.results_dir, METRICS_FILE), 'w') as f:
+            json.dump(metrics, f, indent=2, default=_to_builtin)
+        return metrics
+
+
+def write_solver_results(results_dir, algorithm, drivers, riders, assignments, timings=None, **fields):
+    """ResultWriter for the MIP scripts: `assignments` are (driver index, rider index) pairs of x[i, j] = 1."""
+    assigned = [[] for _ in drivers]
+    for i, j in sorted(assignments):
+        assigned[i].append(riders[j]['id'])
+    writer = ResultWriter(results_dir, algorithm)
+    for i, driver in enumerate(drivers):
+        writer.add_driver(driver['id'], driver['seats'], assigned[i],
+                          source=driver['source'], destination=driver['destination'], threshold=driver['threshold'],
+                          shortest_path_length=driver.get('sp'), max_path_length=driver.get('max_distance'))
+    return writer.finish(len(riders), timings=timings, **fields)
+
+
+def read_assignments(results_dir):
+    """assignments.jsonl as a pandas DataFrame, one row per driver."""
+    import pandas as pd
+    return pd.read_json(os.path.join(results_dir, ASSIGNMENTS_FILE), lines=True)
+
+
+def read_metrics(results_dir):
+    with open(os.path.join(results_dir, METRICS_FILE)) as f:
+        return json.load(f)
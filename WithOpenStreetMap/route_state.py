@@ -0,0 +1,95 @@
+INF = float('inf')
+
+
+class RouteState:
+    """Ordered stop list of one driver's route with cached leg lengths.
+
+    The route is source -> stops -> destination, where every stop is a
+    (node, rider_id, kind) tuple with kind 'pickup' or 'dropoff'. legs[m] is
+    the length of the leg leaving the m-th node of that sequence (the source
+    is node 0), looked up through `distance` (e.g. PathCache.distance).
+
+    `best_insertion` evaluates the cheapest position for a new rider's pickup
+    and dropoff (pickup before dropoff, existing stops kept in order) with
+    O(k) distance lookups and O(k^2) arithmetic for k stops; `insert` commits
+    it by splicing the two stops in and replacing only the affected legs.
+    """
+
+    def __init__(self, source, destination, distance):
+        self.source = source
+        self.destination = destination
+        self.distance = distance
+        self.stops = []
+        self.legs = [distance(source, destination)]
+        self.length = self.legs[0]
+        self._last = None  # (pickup, dropoff, result) of the last best_insertion call
+
+    def __len__(self):
+        return len(self.stops)
+
+    def __repr__(self):
+        return f"RouteState({len(self.stops)} stops, length={self.length})"
+
+    def nodes(self):
+        """Node sequence source, stop nodes..., destination."""
+        return [self.source] + [stop[0] for stop in self.stops] + [self.destination]
+
+    def best_insertion(self, pickup, dropoff):
+        """(route length, i, j) of the cheapest insertion of a pickup/dropoff pair.
+
+        The pickup goes right after node i of `nodes()` and the dropoff right
+        after node j (i <= j; i == j puts them next to each other). Ties keep
+        the earliest positions; the length is inf if no insertion is reachable.
+        """
+        if self._last is not None and self._last[:2] == (pickup, dropoff):
+            return self._last[2]
+        nodes = self.nodes()
+        n = len(self.stops)
+        to_pickup = [self.distance(node, pickup) for node in nodes]
+        from_pickup = [self.distance(pickup, node) for node in nodes]
+        to_dropoff = [self.distance(node, dropoff) for node in nodes]
+        from_dropoff = [self.distance(dropoff, node) for node in nodes]
+        direct = self.distance(pickup, dropoff)
+
+        # prefix[m]: length up to node m; suffix[m]: length from node m to the destination
+        prefix = [0.0]
+        for leg in self.legs:
+            prefix.append(prefix[-1] + leg)
+        suffix = [0.0] * (n + 2)
+        for m in range(n, -1, -1):
+            suffix[m] = self.legs[m] + suffix[m + 1]
+
+        best = (INF, 0, 0)
+        for i in range(n + 1):
+            # Pickup and dropoff both between node i and node i+1
+            length = prefix[i] + to_pickup[i] + direct + from_dropoff[i + 1] + suffix[i + 1]
+            if length < best[0]:
+                best = (length, i, i)
+            # Dropoff after a later node j: the legs between i+1 and j are kept
+            middle = 0.0
+            for j in range(i + 1, n + 1):
+                if j > i + 1:
+                    middle += self.legs[j - 1]
+                length = (prefix[i] + to_pickup[i] + from_pickup[i + 1] + middle
+                          + to_dropoff[j] + from_dropoff[j + 1] + suffix[j + 1])
+                if length < best[0]:
+                    best = (length, i, j)
+        self._last = (pickup, dropoff, best)
+        return best
+
+    def insert(self, rider_id, pickup, dropoff):
+        """Commit the cheapest insertion of a rider; returns the new route length."""
+        length, i, j = self.best_insertion(pickup, dropoff)
+        nodes = self.nodes()
+        if i == j:
+            new_legs = [self.distance(nodes[i], pickup), self.distance(pickup, dropoff), self.distance(dropoff, nodes[i + 1])]
+            self.legs[i:i + 1] = new_legs
+        else:
+            # Replace leg j first so that index i is still valid
+            self.legs[j:j + 1] = [self.distance(nodes[j], dropoff), self.distance(dropoff, nodes[j + 1])]
+            self.legs[i:i + 1] = [self.distance(nodes[i], pickup), self.distance(pickup, nodes[i + 1])]
+        self.stops.insert(j, (dropoff, rider_id, 'dropoff'))
+        self.stops.insert(i, (pickup, rider_id, 'pickup'))
+        self.length = length
+        self._last = None
+        return length
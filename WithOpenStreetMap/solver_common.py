@@ -0,0 +1,269 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import importlib
+import os
+import random
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from graph_csr import load_graph
+from eligibility import driver_blocks
+
+
+def load_data(drivers_file, riders_file, graph_file):
+    drivers_df = pd.read_csv(drivers_file)
+    riders_df = pd.read_csv(riders_file)
+    # Memory-mapped binary graph bundle; the CSV is only parsed (and converted) on first use
+    G = load_graph(graph_file)
+    return drivers_df, riders_df, G
+
+
+def prepare_data(drivers_df, riders_df, distances):
+    """Driver and rider dicts of the MIP scripts; drivers carry their SP ('sp') and MP ('max_distance')."""
+    drivers = []
+    for _, row in drivers_df.iterrows():
+        drivers.append({
+            'id': row['id'],
+            'source': row['source'],
+            'destination': row['destination'],
+            'seats': int(row['seats']),
+            'threshold': float(row.get('threshold', 0.0))
+        })
+    # Base route length SP and maximum route length MP, computed once per driver
+    sp = distances.pair_distances([driver['source'] for driver in drivers], [driver['destination'] for driver in drivers])
+    for driver, driver_sp in zip(drivers, sp.tolist()):
+        driver['sp'] = driver_sp
+        driver['max_distance'] = driver['sp'] * (1.0 + driver['threshold'] / 100.0)
+    riders = [{'id': row['id'], 'source': row['source'], 'destination': row['destination']} for _, row in riders_df.iterrows()]
+    return drivers, riders
+
+
+class PairDistances:
+    """Deviated path lengths spd(d.s, r.s) + spd(r.s, r.f) + spd(r.f, d.f) of every driver-rider pair.
+
+    Backed by batched single-source searches of a DistanceEngine: one forward
+    search per driver source and per pickup node, one reverse search per driver
+    destination. Driver rows are only searched when their block is asked for,
+    and pickups only contribute their trip length, so memory follows the block
+    size and the engine's row cap rather than |D| + |R|. Unreachable legs give
+    inf, so no separate has_path check is needed.
+    """
+
+    def __init__(self, distances, drivers, riders):
+        self.distances = distances
+        self.driver_sources = [driver['source'] for driver in drivers]
+        self.driver_destinations = [driver['destination'] for driver in drivers]
+        # Distinct pickup/dropoff nodes are the columns of the distance arrays;
+        # rs/rf map each rider to its column.
+        pickup_nodes, self.rs = np.unique(np.array([rider['source'] for rider in riders], dtype=np.int64), return_inverse=True)
+        dropoff_nodes, self.rf = np.unique(np.array([rider['destination'] for rider in riders], dtype=np.int64), return_inverse=True)
+        self.pickup_nodes, self.dropoff_nodes = pickup_nodes.tolist(), dropoff_nodes.tolist()
+        self.trip = distances.pair_distances([rider['source'] for rider in riders], [rider['destination'] for rider in riders])
+
+    def __len__(self):
+        return len(self.driver_sources)
+
+    def block(self, lo, hi):
+        """(hi - lo) x |riders| array of deviated path lengths of drivers lo..hi-1, inf where unreachable."""
+        D_src = self.distances.distances_from(self.driver_sources[lo:hi], self.pickup_nodes)
+        D_dst = self.distances.distances_to(self.driver_destinations[lo:hi], self.dropoff_nodes)
+        return D_src[:, self.rs] + self.trip + D_dst[:, self.rf]
+
+
+def eligible_pairs(distances, drivers, riders, rel_tol=0.0, abs_tol=0.0):
+    """Sorted list of the (driver index, rider index) pairs that may be assigned.
+
+    A pair is eligible if every leg of d.s -> r.s -> r.f -> d.f is reachable and
+    the deviated path length is at most the driver's max_distance, up to
+    abs_tol + rel_tol * max(1, max_distance). The MIP models only create
+    assignment variables for these pairs.
+    """
+    pair_distances = PairDistances(distances, drivers, riders)
+    max_distance = np.array([driver['max_distance'] for driver in drivers], dtype=float)
+    tol = abs_tol + rel_tol * np.maximum(1.0, max_distance)
+    pairs = []
+    for lo, hi in driver_blocks(len(drivers), len(riders)):
+        with np.errstate(invalid='ignore'):  # inf - inf for drivers without a base route
+            eligible = pair_distances.block(lo, hi) - max_distance[lo:hi, None] <= tol[lo:hi, None]
+        eligible &= np.isfinite(max_distance[lo:hi, None])
+        rows, columns = np.nonzero(eligible)
+        pairs.extend(zip((lo + rows).tolist(), columns.tolist()))
+    return pairs
+
+
+def pair_index(pairs):
+    """(riders of each driver, drivers of each rider) adjacency of an eligible pair list."""
+    riders_of = defaultdict(list)
+    drivers_of = defaultdict(list)
+    for i, j in pairs:
+        riders_of[i].append(j)
+        drivers_of[j].append(i)
+    return riders_of, drivers_of
+
+
+class Component:
+    """One connected component of the bipartite driver-rider eligibility graph.
+
+    `drivers` and `riders` are the global indices of its members; `pairs` are its
+    eligible pairs in local indices, i.e. (k, l) stands for (drivers[k], riders[l]).
+    No eligible pair crosses two components, so each one is an independent
+    assignment problem.
+    """
+
+    def __init__(self, drivers, riders, pairs):
+        self.drivers = drivers
+        self.riders = riders
+        self.pairs = pairs
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __repr__(self):
+        return f"Component({len(self.drivers)} drivers, {len(self.riders)} riders, {len(self.pairs)} pairs)"
+
+    def localize(self, assignment):
+        """Global (driver, rider) pairs of this component in local indices; other pairs are dropped."""
+        driver_position = {i: k for k, i in enumerate(self.drivers)}
+        rider_position = {j: l for l, j in enumerate(self.riders)}
+        return [(driver_position[i], rider_position[j]) for i, j in assignment
+                if i in driver_position and j in rider_position]
+
+    def globalize(self, assignment):
+        """Local (driver, rider) pairs of this component in global indices."""
+        return [(self.drivers[k], self.riders[l]) for k, l in assignment]
+
+
+def eligibility_components(pairs, num_drivers, num_riders):
+    """Connected components of the bipartite eligibility graph, largest (most pairs) first.
+
+    Drivers and riders without any eligible pair are left out: they cannot be
+    assigned whatever the other components do.
+    """
+    if not pairs:
+        return []
+    edges = np.array(pairs, dtype=np.int64)
+    n = num_drivers + num_riders
+    # Drivers are vertices 0..|D|-1, riders |D|..|D|+|R|-1
+    graph = coo_matrix((np.ones(len(edges)), (edges[:, 0], num_drivers + edges[:, 1])), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    members = defaultdict(list)
+    for i, j in pairs:
+        members[labels[i]].append((i, j))
+    components = []
+    for component_pairs in members.values():
+        drivers = sorted({i for i, _ in component_pairs})
+        riders = sorted({j for _, j in component_pairs})
+        component = Component(drivers, riders, [])
+        component.pairs = component.localize(component_pairs)
+        components.append(component)
+    components.sort(key=len, reverse=True)
+    return components
+
+
+def map_components(solve, tasks, processes=None):
+    """[solve(*task) for task in tasks], in a pool of `processes` worker processes if processes > 1.
+
+    `solve` must be a module-level function so that it can be sent to the workers;
+    results come back in task order.
+    """
+    if processes is not None and processes > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            return list(pool.map(solve, *zip(*tasks)))
+    return [solve(*task) for task in tasks]
+
+
+# Greedy heuristics that can provide a MIP start, by name (see greedy_assignment)
+GREEDY_MODULES = {'DeRide': 'mainDeRide', 'DeRideFair': 'mainDeRideFair'}
+
+
+def greedy_assignment(method, graph_file, drivers_file, riders_file, seed=0):
+    """(driver index, rider index) pairs assigned by the DeRide or DeRideFair greedy.
+
+    Runs the greedy's RideShareSystem on the same input files as the MIP script
+    (drivers and riders in file order, so indices line up with prepare_data)
+    and discards its Output.txt. `seed` fixes the greedy's random tie-breaking
+    so that the start, and with it the solver run, is reproducible; the global
+    random state is restored afterwards.
+    """
+    module = importlib.import_module(GREEDY_MODULES[method])
+    state = random.getstate()
+    try:
+        if seed is not None:
+            random.seed(seed)
+        with open(os.devnull, 'w') as devnull:
+            system = module.RideShareSystem(graph_file, drivers_file, riders_file, devnull)
+            system.eligibility_matrix.calculate(system.drivers, system.riders, system.trace, rider_index=system.rider_index)
+            DPassigned = system.eligibility_matrix.assign_riders_to_drivers(system.drivers, system.riders, system.trace)
+    finally:
+        random.setstate(state)
+    rider_position = {rider.id: j for j, rider in enumerate(system.riders)}
+    return [(i, rider_position[rider['rider_id']])
+            for i, driver in enumerate(system.drivers) for rider in DPassigned[driver.id]['riders']]
+
+
+def start_values(x, assignment):
+    """{(i, j): 0/1} start values of the assignment variables x for a greedy assignment.
+
+    Pairs without a variable (not eligible under the model's tolerance) are
+    dropped, so the start always satisfies the assignment constraints.
+    """
+    chosen = set(assignment)
+    return {key: 1 if key in chosen else 0 for key in x}
+
+
+def add_greedy_start(model, x, assignment):
+    """Offer a greedy assignment to SCIP as a partial solution over x; returns (riders used, accepted).
+
+    Only the assignment variables are set; SCIP completes the rest (loads,
+    min load, y, ...) before it starts branching.
+    """
+    values = start_values(x, assignment)
+    solution = model.createPartialSol()
+    for key, var in x.items():
+        model.setSolVal(solution, var, values[key])
+    return sum(values.values()), model.addSol(solution)
+
+
+def incumbent(model):
+    """(variable, value) pairs of the best SCIP solution, integer values rounded.
+
+    Taken before freeTransform() so that the next phase of a multi-phase solve
+    can start from it (see solve_phase).
+    """
+    solution = model.getBestSol()
+    values = []
+    for var in model.getVars():
+        value = model.getSolVal(solution, var)
+        values.append((var, round(value) if var.vtype() in ('BINARY', 'INTEGER') else value))
+    return values
+
+
+def solve_phase(model, phase, start=None):
+    """Optimize one phase of a multi-phase SCIP solve, warm-started from `start` (see incumbent).
+
+    The previous phase's incumbent stays feasible when its optimum is fixed by a
+    constraint, so SCIP starts the phase with a primal bound instead of cold.
+    Returns the phase statistics: status, solve time, branch-and-bound nodes and gap.
+    """
+    if start:
+        solution = model.createSol()
+        for var, value in start:
+            model.setSolVal(solution, var, value)
+        # False only if SCIP rejects it or already kept the same solution across freeTransform()
+        model.addSol(solution, free=True)
+    model.optimize()
+    gap = model.getGap()
+    return {
+        'phase': phase,
+        'status': model.getStatus(),
+        'warm_start': bool(start),
+        'solve_seconds': model.getSolvingTime(),
+        'nodes': model.getNNodes(),
+        'gap': gap if gap < model.infinity() else None,
+    }
+
+
+def format_phase(stats):
+    return (f"[{stats['phase']}] status={stats['status']}, time={stats['solve_seconds']:.3f}s, "
+            f"nodes={stats['nodes']}, gap={stats['gap']}, warm start={stats['warm_start']}")
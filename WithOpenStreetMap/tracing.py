@@ -0,0 +1,41 @@
+OFF, SUMMARY, ITERATION, PAIR = range(4)
+
+TRACE_LEVELS = {
+    'off': OFF,              # nothing but the final assignment and metrics
+    'summary': SUMMARY,      # one-off lines per phase: sizes, final ER, final DP_assigned, cache stats
+    'iteration': ITERATION,  # one block per driver in Algorithm 1 and per greedy iteration in Algorithm 2
+    'pair': PAIR,            # every (driver, rider) check, path lookup and intermediate ER dump
+}
+
+
+class Tracer:
+    """Level-filtered trace writer for the greedy solvers.
+
+    Messages are str.format templates; the template is only formatted (and
+    numpy arrays / DP_assigned dicts only converted to text) when the
+    message's level is enabled, so a disabled trace call costs one integer
+    comparison. The final results are written to the output file directly
+    and are not affected by the level.
+    """
+
+    def __init__(self, output_file, level='summary'):
+        if level not in TRACE_LEVELS:
+            raise ValueError(f"Unknown trace level: {level}")
+        self.output_file = output_file
+        self.level = TRACE_LEVELS[level]
+
+    def enabled(self, level):
+        return self.level >= level
+
+    def _emit(self, level, message, args):
+        if self.level >= level:
+            self.output_file.write((message.format(*args) if args else message) + "\n")
+
+    def summary(self, message, *args):
+        self._emit(SUMMARY, message, args)
+
+    def iteration(self, message, *args):
+        self._emit(ITERATION, message, args)
+
+    def pair(self, message, *args):
+        self._emit(PAIR, message, args)